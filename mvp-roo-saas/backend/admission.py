@@ -0,0 +1,394 @@
+"""Admission control for project creation.
+
+Before a workspace is provisioned, the controller checks three things:
+
+* the per-user quota, via a pluggable hook (ADMISSION_QUOTA_HOOK) that sees
+  the caller's id from the ADMISSION_USER_HEADER header and how many
+  workspaces they already own (``roo.io/owner``), counting their admitted
+  creates and pool claims that the cache has not shown yet;
+* an in-flight limit, so a burst of creates is fed to the API server at most
+  ADMISSION_MAX_INFLIGHT workspaces at a time;
+* cluster capacity: the CPU and memory requests of the rendered Deployment
+  must fit in what schedulable nodes have allocatable, minus what running pods,
+  workspace Deployments and admitted-but-not-yet-visible creates have requested.
+
+Creates that cannot go ahead yet wait in a bounded queue for up to
+ADMISSION_QUEUE_TIMEOUT seconds and are then rejected with 503 and Retry-After;
+a full queue is rejected straight away with 429. Capacity is an aggregate over
+all nodes, not per-node bin-packing, so it bounds overcommit rather than
+guaranteeing every pod schedules.
+"""
+import os
+import time
+import asyncio
+import logging
+import importlib
+import threading
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from kubernetes.utils import parse_quantity
+
+from cache import Informer
+from k8s import run_k8s
+from metrics import ADMISSION_DECISIONS, ADMISSION_INFLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT, CLUSTER_CAPACITY
+from provision import render_manifests
+from reaper import deployment_requests
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_INFLIGHT = int(os.environ.get("ADMISSION_MAX_INFLIGHT", "8"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "32"))
+# 0 rejects straight away instead of queueing
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "15"))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "30"))
+# Share of node allocatable that workspaces may fill, leaving headroom for bursts
+ADMISSION_CAPACITY_FRACTION = float(os.environ.get("ADMISSION_CAPACITY_FRACTION", "1.0"))
+ADMISSION_CAPACITY_CHECK = os.environ.get("ADMISSION_CAPACITY_CHECK", "true").lower() == "true"
+ADMISSION_USER_HEADER = os.environ.get("ADMISSION_USER_HEADER", "X-Roo-User")
+# "module:function" replacing default_quota_hook
+ADMISSION_QUOTA_HOOK = os.environ.get("ADMISSION_QUOTA_HOOK", "")
+# Workspaces a single user may own; 0 means unlimited
+USER_PROJECT_QUOTA = int(os.environ.get("USER_PROJECT_QUOTA", "0"))
+# An admitted create holds its reservation until its Deployment shows up in the cache
+RESERVATION_TIMEOUT = 120.0
+CAPACITY_POLL_SECONDS = 1.0
+
+OWNER_ANNOTATION = "roo.io/owner"
+
+Resources = Tuple[float, float]
+QuotaHook = Callable[[str, int, int], Optional[str]]
+
+
+def default_quota_hook(user: str, owned: int, requested: int) -> Optional[str]:
+    """Reject when a user would own more than USER_PROJECT_QUOTA workspaces"""
+    if USER_PROJECT_QUOTA > 0 and owned + requested > USER_PROJECT_QUOTA:
+        return f"User {user} already has {owned} of {USER_PROJECT_QUOTA} projects"
+    return None
+
+
+def load_quota_hook(spec: str = ADMISSION_QUOTA_HOOK) -> QuotaHook:
+    if not spec:
+        return default_quota_hook
+    module_name, _, attr = spec.partition(":")
+    hook = getattr(importlib.import_module(module_name), attr)
+    logger.info(f"Using quota hook {spec}")
+    return hook
+
+
+def _requests(resources) -> Resources:
+    requests = (resources or {}).get("requests") or {}
+    return float(parse_quantity(requests.get("cpu", "0"))), float(parse_quantity(requests.get("memory", "0")))
+
+
+def manifest_requests(documents: Sequence[dict]) -> Resources:
+    """(CPU cores, memory bytes) requested by the Deployments among rendered manifests"""
+    cpu = memory = 0.0
+    for doc in documents:
+        if doc.get("kind") != "Deployment":
+            continue
+        spec = doc.get("spec") or {}
+        replicas = spec.get("replicas", 1)
+        for container in spec.get("template", {}).get("spec", {}).get("containers", []):
+            c, m = _requests(container.get("resources"))
+            cpu += c * replicas
+            memory += m * replicas
+    return cpu, memory
+
+
+def workspace_requests() -> Resources:
+    """Requests of one workspace as the current templates would render it"""
+    return manifest_requests(render_manifests("admission-check"))
+
+
+def pod_requests(pod) -> Resources:
+    """Effective (CPU, memory) requests of a pod: its containers, or its largest init container"""
+    def total(containers) -> Resources:
+        cpu = memory = 0.0
+        for container in containers or ():
+            resources = container.resources
+            c, m = _requests({"requests": resources.requests} if resources else None)
+            cpu += c
+            memory += m
+        return cpu, memory
+
+    cpu, memory = total(pod.spec.containers)
+    for init in pod.spec.init_containers or ():
+        c, m = total([init])
+        cpu, memory = max(cpu, c), max(memory, m)
+    return cpu, memory
+
+
+def _schedulable(node) -> bool:
+    if node.spec and node.spec.unschedulable:
+        return False
+    for taint in (node.spec.taints if node.spec else None) or ():
+        if taint.effect in ("NoSchedule", "NoExecute"):
+            return False
+    for condition in (node.status.conditions if node.status else None) or ():
+        if condition.type == "Ready":
+            return condition.status == "True"
+    return True
+
+
+class ClusterCapacity:
+    """Allocatable vs. requested CPU and memory, from node and pod informers.
+
+    Workspace pods are counted through their Deployments in the project cache
+    instead, so a workspace uses capacity from the moment its Deployment exists
+    (before the pod is scheduled) and frees it when scaled to zero.
+    """
+
+    def __init__(self, v1, project_cache):
+        self.project_cache = project_cache
+        self._lock = threading.Lock()
+        self.nodes: Dict[str, Resources] = {}
+        # pod UID -> requests, for running and pending pods that are not workspaces
+        self.pods: Dict[str, Resources] = {}
+        self.informers = [
+            Informer("nodes", v1.list_node, self._reset_nodes, self._node_event),
+            Informer("pods-all", v1.list_pod_for_all_namespaces, self._reset_pods, self._pod_event,
+                     field_selector="status.phase!=Succeeded,status.phase!=Failed"),
+        ]
+        for resource, index in (("cpu", 0), ("memory", 1)):
+            CLUSTER_CAPACITY.labels(resource=resource, state="allocatable").set_function(
+                lambda index=index: self.allocatable()[index])
+            CLUSTER_CAPACITY.labels(resource=resource, state="requested").set_function(
+                lambda index=index: self.requested()[index])
+
+    def start(self) -> None:
+        for informer in self.informers:
+            informer.start()
+
+    def stop(self) -> None:
+        for informer in self.informers:
+            informer.stop()
+
+    def is_known(self) -> bool:
+        """True once both informers have synced, the project cache is fresh and some node is schedulable"""
+        return (all(informer.synced.is_set() for informer in self.informers)
+                and self.project_cache.is_fresh() and bool(self.nodes))
+
+    def allocatable(self) -> Resources:
+        with self._lock:
+            values = list(self.nodes.values())
+        return (sum(cpu for cpu, _ in values) * ADMISSION_CAPACITY_FRACTION,
+                sum(memory for _, memory in values) * ADMISSION_CAPACITY_FRACTION)
+
+    def requested(self) -> Resources:
+        with self._lock:
+            values = list(self.pods.values())
+        cpu, memory = sum(c for c, _ in values), sum(m for _, m in values)
+        for deployment in self.project_cache.deployment_objects():
+            c, m = deployment_requests(deployment)
+            cpu += c
+            memory += m
+        return cpu, memory
+
+    def workspaces(self) -> List[str]:
+        return [deployment.metadata.namespace for deployment in self.project_cache.deployment_objects()]
+
+    def _reset_nodes(self, items) -> None:
+        with self._lock:
+            self.nodes = {}
+            for node in items:
+                self._set_node(node)
+
+    def _node_event(self, event_type: str, node) -> None:
+        with self._lock:
+            self.nodes.pop(node.metadata.name, None)
+            if event_type != 'DELETED':
+                self._set_node(node)
+
+    def _set_node(self, node) -> None:
+        if _schedulable(node):
+            self.nodes[node.metadata.name] = _requests({"requests": node.status.allocatable})
+
+    def _reset_pods(self, items) -> None:
+        with self._lock:
+            self.pods = {}
+            for pod in items:
+                self._set_pod(pod)
+
+    def _pod_event(self, event_type: str, pod) -> None:
+        with self._lock:
+            self.pods.pop(pod.metadata.uid, None)
+            if event_type != 'DELETED':
+                self._set_pod(pod)
+
+    def _set_pod(self, pod) -> None:
+        if (pod.metadata.labels or {}).get("app") == "vscode-server":
+            return
+        if pod.status and pod.status.phase in ("Succeeded", "Failed"):
+            return
+        self.pods[pod.metadata.uid] = pod_requests(pod)
+
+
+class AdmissionController:
+    """Quota, in-flight and capacity gate in front of workspace provisioning"""
+
+    def __init__(self, v1, project_cache, quota_hook: Optional[QuotaHook] = None):
+        self.v1 = v1
+        self.project_cache = project_cache
+        self.capacity = ClusterCapacity(v1, project_cache)
+        self.quota_hook = quota_hook or load_quota_hook()
+        self.inflight = 0
+        self.waiting = 0
+        # namespace -> (requests, deadline) for admitted creates not yet in the cache
+        self.reservations: Dict[str, Tuple[Resources, float]] = {}
+        # namespace -> (owner, deadline) for creates and pool claims not yet in the cache as that owner's
+        self.pending_owners: Dict[str, Tuple[str, float]] = {}
+        self._changed: Optional[asyncio.Condition] = None
+        # Held from a quota check until the workspaces it allowed are pending, so parallel creates see each other
+        self._quota_lock: Optional[asyncio.Lock] = None
+        ADMISSION_QUEUE_DEPTH.set_function(lambda: self.waiting)
+        ADMISSION_INFLIGHT.set_function(lambda: self.inflight)
+        CLUSTER_CAPACITY.labels(resource="cpu", state="reserved").set_function(lambda: self.reserved()[0])
+        CLUSTER_CAPACITY.labels(resource="memory", state="reserved").set_function(lambda: self.reserved()[1])
+
+    def start(self, check_capacity: bool = ADMISSION_CAPACITY_CHECK) -> None:
+        self._changed = asyncio.Condition()
+        self._quota_lock = asyncio.Lock()
+        if check_capacity:
+            self.capacity.start()
+            logger.info(f"Admission control: {ADMISSION_MAX_INFLIGHT} creates in flight, capacity check enabled")
+
+    def stop(self) -> None:
+        self.capacity.stop()
+
+    def owner(self, headers) -> Optional[str]:
+        """The caller's user id, if the request carries one"""
+        return headers.get(ADMISSION_USER_HEADER) or None
+
+    async def owned(self, user: str) -> int:
+        """Workspaces the user owns, including ones admitted or claimed for them that the cache has not shown"""
+        if self.project_cache.is_fresh():
+            namespaces = self.project_cache.namespace_objects()
+        else:
+            namespaces = (await run_k8s(self.v1.list_namespace, label_selector="roo=true")).items
+        owners = {ns.metadata.name: (ns.metadata.annotations or {}).get(OWNER_ANNOTATION) for ns in namespaces}
+        now = time.monotonic()
+        for namespace, (owner, deadline) in list(self.pending_owners.items()):
+            if owners.get(namespace) == owner or deadline < now:
+                self.pending_owners.pop(namespace, None)
+        visible = {namespace for namespace, owner in owners.items() if owner == user}
+        return len(visible) + sum(1 for namespace, (owner, _) in self.pending_owners.items()
+                                  if owner == user and namespace not in visible)
+
+    async def check_quota(self, user: Optional[str], requested: int = 1) -> None:
+        """Raise 429 if the quota hook refuses `requested` more workspaces for this user"""
+        if user is None:
+            return
+        reason = self.quota_hook(user, await self.owned(user), requested)
+        if reason:
+            self._reject("quota", 429, reason)
+
+    @asynccontextmanager
+    async def quota(self, user: Optional[str], requested: int = 1):
+        """Check the quota and hold it while pool workspaces are claimed; record each with claimed()"""
+        if user is None:
+            yield
+            return
+        async with self._quota_lock:
+            await self.check_quota(user, requested)
+            yield
+
+    def claimed(self, namespace: str, user: Optional[str]) -> None:
+        """Count a pool workspace handed to a user against their quota until the cache shows it as theirs"""
+        if user is not None:
+            self.pending_owners[namespace] = (user, time.monotonic() + RESERVATION_TIMEOUT)
+
+    def reserved(self) -> Resources:
+        now = time.monotonic()
+        known = set(self.capacity.workspaces())
+        for namespace, (_, deadline) in list(self.reservations.items()):
+            if namespace in known or deadline < now:
+                self.reservations.pop(namespace, None)
+        values = [need for need, _ in self.reservations.values()]
+        return sum(c for c, _ in values), sum(m for _, m in values)
+
+    def release(self, namespace: str) -> None:
+        """Drop the reservation of a create that failed after admission"""
+        self.reservations.pop(namespace, None)
+        self.pending_owners.pop(namespace, None)
+
+    def rename(self, old: str, new: str) -> None:
+        """Move a reservation to the namespace name a create retried under"""
+        if old in self.reservations:
+            self.reservations[new] = self.reservations.pop(old)
+        if old in self.pending_owners:
+            self.pending_owners[new] = self.pending_owners.pop(old)
+
+    def fits(self, need: Resources) -> bool:
+        """True if `need` fits in free capacity, or capacity is not known"""
+        if not self.capacity.is_known():
+            return True
+        allocatable, requested, reserved = self.capacity.allocatable(), self.capacity.requested(), self.reserved()
+        return all(need[i] <= allocatable[i] - requested[i] - reserved[i] for i in (0, 1))
+
+    def _reject(self, reason: str, status_code: int, detail: str, retry_after: Optional[int] = None) -> None:
+        ADMISSION_DECISIONS.labels(result=reason).inc()
+        logger.warning(f"Rejected project create ({reason}): {detail}")
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+    @asynccontextmanager
+    async def admit(self, namespaces: List[str], per_workspace: Resources, owner: Optional[str] = None):
+        """Wait for an in-flight slot and capacity for these namespaces, then hold them while provisioning.
+
+        With an owner, the quota is checked once they may go ahead, under the
+        same lock that records them as pending.
+        """
+        count = len(namespaces)
+        need = (per_workspace[0] * count, per_workspace[1] * count)
+        if self.waiting >= ADMISSION_MAX_QUEUE:
+            self._reject("queue_full", 429, "Too many project creations are queued", retry_after=5)
+
+        started = time.monotonic()
+        deadline = started + ADMISSION_QUEUE_TIMEOUT
+        self.waiting += 1
+        try:
+            async with self._changed:
+                while True:
+                    # A batch larger than the limit goes through on its own
+                    slot = self.inflight == 0 or self.inflight + count <= ADMISSION_MAX_INFLIGHT
+                    room = self.fits(need)
+                    if slot and room:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if not room:
+                            self._reject("capacity", 503, "The cluster has no capacity for new projects",
+                                         retry_after=ADMISSION_RETRY_AFTER)
+                        self._reject("busy", 503, "Too many projects are being created", retry_after=5)
+                    try:
+                        # Capacity is freed on informer threads, so poll it while queued
+                        await asyncio.wait_for(self._changed.wait(), timeout=min(remaining, CAPACITY_POLL_SECONDS))
+                    except asyncio.TimeoutError:
+                        pass
+                hold = time.monotonic() + RESERVATION_TIMEOUT
+                if owner is not None:
+                    async with self._quota_lock:
+                        await self.check_quota(owner, count)
+                        for namespace in namespaces:
+                            self.pending_owners[namespace] = (owner, hold)
+                self.inflight += count
+        finally:
+            self.waiting -= 1
+
+        ADMISSION_WAIT.observe(time.monotonic() - started)
+        ADMISSION_DECISIONS.labels(result="admitted").inc(count)
+        for namespace in namespaces:
+            self.reservations[namespace] = (per_workspace, hold)
+        try:
+            yield
+        except BaseException:
+            for namespace in namespaces:
+                self.reservations.pop(namespace, None)
+                self.pending_owners.pop(namespace, None)
+            raise
+        finally:
+            async with self._changed:
+                self.inflight -= count
+                self._changed.notify_all()
@@ -0,0 +1,175 @@
+"""Kubernetes REST client with rate limiting, retries and per-verb metrics.
+
+``InstrumentedRESTClient`` replaces the generated client's REST layer, so
+every API call, including informer lists and watches, goes through it:
+
+- token buckets can cap the request rate, one for writes (K8S_QPS, bursts of
+  K8S_BURST) and one for reads (K8S_READ_QPS, K8S_READ_BURST), so a burst of
+  creates queues here instead of being throttled by the API server, and never
+  delays reads such as /health's. Both are off unless configured: a waiting
+  request holds its k8s thread;
+- transient failures are retried with full-jitter exponential backoff, waiting
+  at least as long as the server's Retry-After. Reads, updates and deletes are
+  retried on 429, 5xx and connection errors; creates and patches only when the
+  server cannot have acted on them (429, 503, or no connection);
+- each attempt is counted and timed by verb and resource, and each call is a
+  trace span (with its retries) when made inside a traced request.
+"""
+import random
+import socket
+import threading
+import time
+from typing import Optional, Tuple
+
+import urllib3
+from urllib3.connection import HTTPConnection
+from kubernetes.client.rest import ApiException, RESTClientObject
+
+from metrics import K8S_API_DURATION, K8S_API_REQUESTS, K8S_API_RETRIES, K8S_RATE_LIMIT_WAIT
+from tracing import span
+
+# Safe to repeat: a retry cannot apply the change twice
+IDEMPOTENT_VERBS = frozenset({"get", "list", "update", "delete", "deletecollection"})
+# Refused before the server did anything, whatever the verb
+UNPROCESSED_STATUSES = frozenset({429, 503})
+TRANSIENT_STATUSES = frozenset({429, 500, 502, 503, 504})
+METHOD_VERBS = {"POST": "create", "PUT": "update", "PATCH": "patch"}
+# Drawn from the read budget; every other verb from the write budget
+READ_VERBS = frozenset({"get", "list", "watch"})
+
+
+def api_verb(method: str, url: str, query_params=None) -> Tuple[str, str]:
+    """The Kubernetes verb and resource (with subresource) a request URL addresses"""
+    path = urllib3.util.parse_url(url).path or ""
+    parts = [part for part in path.split("/") if part]
+    # /api/v1/... or /apis/<group>/<version>/...
+    parts = parts[2:] if parts[:1] == ["api"] else parts[3:]
+    # Namespaced resources, but not the namespace's own subresources
+    if len(parts) >= 3 and parts[0] == "namespaces" and parts[2] not in ("status", "finalize"):
+        parts = parts[2:]
+    resource = "/".join(parts[:1] + parts[2:3]) or "unknown"
+    named = len(parts) >= 2
+    if method in METHOD_VERBS:
+        return METHOD_VERBS[method], resource
+    if method == "DELETE":
+        return ("delete" if named else "deletecollection"), resource
+    if not named and any(key == "watch" and str(value).lower() == "true" for key, value in query_params or ()):
+        return "watch", resource
+    return ("get" if named else "list"), resource
+
+
+def is_transient(error: BaseException) -> bool:
+    """True for API failures worth retrying later: throttling, server errors, no connection"""
+    if isinstance(error, ApiException):
+        return error.status in TRANSIENT_STATUSES
+    return isinstance(error, urllib3.exceptions.HTTPError)
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: qps tokens a second, up to burst banked"""
+
+    def __init__(self, qps: float, burst: int):
+        self.qps = qps
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until it is due; returns the seconds waited"""
+        if self.qps <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.qps)
+            self._updated = now
+            # Going negative reserves a future token, so waiters are served in order
+            self._tokens -= 1
+            wait = -self._tokens / self.qps if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class RetryPolicy:
+    """Which failures to retry, and how long to wait before each attempt"""
+
+    def __init__(self, max_retries: int, base_seconds: float, max_seconds: float, retry_after_max: float):
+        self.max_retries = max_retries
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.retry_after_max = retry_after_max
+
+    def retryable(self, verb: str, status: Optional[int] = None, error: Optional[Exception] = None) -> bool:
+        if verb == "watch":
+            # Informers restart their own watches
+            return False
+        if status is not None:
+            return status in UNPROCESSED_STATUSES or (status in TRANSIENT_STATUSES and verb in IDEMPOTENT_VERBS)
+        # A connect error means the request was never sent
+        return isinstance(error, urllib3.exceptions.ConnectTimeoutError) or verb in IDEMPOTENT_VERBS
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        delay = random.uniform(0, min(self.max_seconds, self.base_seconds * 2 ** attempt))
+        try:
+            return max(delay, min(float(retry_after), self.retry_after_max)) if retry_after else delay
+        except ValueError:
+            return delay
+
+
+class InstrumentedRESTClient(RESTClientObject):
+    """RESTClientObject with shared rate limits, retries and metrics"""
+
+    def __init__(self, configuration, limiter: TokenBucket, policy: RetryPolicy, maxsize: Optional[int] = None,
+                 read_limiter: Optional[TokenBucket] = None):
+        super().__init__(configuration, maxsize=maxsize)
+        self.limiter = limiter
+        # Without a read budget of their own, reads are not limited
+        self.read_limiter = read_limiter or TokenBucket(0, 1)
+        self.policy = policy
+        # TCP keepalive, so pooled connections idle between bursts are not silently dropped
+        self.pool_manager.connection_pool_kw["socket_options"] = (
+            HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+
+    def request(self, method, url, query_params=None, headers=None, body=None, post_params=None,
+                _preload_content=True, _request_timeout=None):
+        verb, resource = api_verb(method.upper(), url, query_params)
+        limiter = self.read_limiter if verb in READ_VERBS else self.limiter
+        with span(f"k8s {verb} {resource}", verb=verb, resource=resource) as current:
+            attempt = 0
+            while True:
+                waited = limiter.acquire()
+                if waited:
+                    K8S_RATE_LIMIT_WAIT.observe(waited)
+                    current.set_attribute("rate_limit_wait_ms", round(waited * 1000, 1))
+                start = time.perf_counter()
+                retry_after = None
+                try:
+                    response = super().request(method, url, query_params=query_params, headers=headers, body=body,
+                                               post_params=post_params, _preload_content=_preload_content,
+                                               _request_timeout=_request_timeout)
+                except ApiException as e:
+                    self._observe(verb, resource, str(e.status), start)
+                    current.set_attribute("status_code", e.status)
+                    if not (e.status and self.policy.retryable(verb, status=e.status)) or attempt >= self.policy.max_retries:
+                        raise
+                    reason = str(e.status)
+                    retry_after = (e.headers or {}).get("Retry-After")
+                except urllib3.exceptions.HTTPError as e:
+                    self._observe(verb, resource, "error", start)
+                    if not self.policy.retryable(verb, error=e) or attempt >= self.policy.max_retries:
+                        raise
+                    reason = "connection"
+                else:
+                    self._observe(verb, resource, str(response.status), start)
+                    current.set_attribute("status_code", response.status)
+                    return response
+                K8S_API_RETRIES.labels(verb=verb, reason=reason).inc()
+                attempt += 1
+                current.set_attribute("retries", attempt)
+                time.sleep(self.policy.delay(attempt - 1, retry_after))
+
+    @staticmethod
+    def _observe(verb: str, resource: str, code: str, start: float) -> None:
+        K8S_API_REQUESTS.labels(verb=verb, resource=resource, code=code).inc()
+        K8S_API_DURATION.labels(verb=verb, resource=resource).observe(time.perf_counter() - start)
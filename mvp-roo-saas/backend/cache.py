@@ -0,0 +1,263 @@
+"""Watch-backed in-memory index of workspace namespaces and their deployments.
+
+Each informer lists its resource once, then follows a watch from the returned
+resourceVersion. Watches are re-opened from the last seen resourceVersion when
+they time out or drop, and a full relist only happens when the API server
+reports that version as expired (410 Gone).
+"""
+import os
+import time
+import random
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+from metrics import CACHE_OBJECTS, CACHE_RESYNCS, CACHE_STALENESS, CACHE_WATCH_ERRORS
+
+logger = logging.getLogger(__name__)
+
+WATCH_TIMEOUT_SECONDS = int(os.environ.get("PROJECT_CACHE_WATCH_TIMEOUT", "60"))
+# A watch is re-opened at least every WATCH_TIMEOUT_SECONDS, so anything much
+# older than that means the informer is stuck and the index can't be trusted
+MAX_STALENESS_SECONDS = float(os.environ.get("PROJECT_CACHE_MAX_STALENESS", str(WATCH_TIMEOUT_SECONDS * 2 + 10)))
+
+
+# Set on a workspace namespace when its deletion is requested; see deletion.py
+DELETION_ANNOTATION = "roo.io/deletion-requested"
+
+
+def deployment_status(deployment) -> str:
+    """Map a vscode-server deployment to the status shown to users"""
+    if deployment is None:
+        return "unknown"
+    if deployment.spec and deployment.spec.replicas == 0:
+        return "sleeping"
+    if deployment.status.ready_replicas and deployment.status.ready_replicas > 0:
+        return "ready"
+    elif deployment.status.replicas and deployment.status.replicas > 0:
+        return "starting"
+    else:
+        return "pending"
+
+
+def is_deleting(namespace) -> bool:
+    """True once a namespace is marked for deletion or terminating"""
+    if namespace.status and namespace.status.phase == "Terminating":
+        return True
+    return DELETION_ANNOTATION in (namespace.metadata.annotations or {})
+
+
+def project_status(namespace, deployment) -> str:
+    """Map a workspace namespace and its vscode-server deployment to the status shown to users"""
+    if namespace is not None and is_deleting(namespace):
+        return "deleting"
+    return deployment_status(deployment)
+
+
+class Informer:
+    """List-then-watch loop for one resource, running on a daemon thread"""
+
+    def __init__(self, resource: str, list_fn: Callable, on_reset: Callable, on_event: Callable, **list_kwargs):
+        self.resource = resource
+        self.list_fn = list_fn
+        self.list_kwargs = list_kwargs
+        self.on_reset = on_reset
+        self.on_event = on_event
+        self.resource_version: Optional[str] = None
+        self.synced = threading.Event()
+        self.last_healthy = 0.0
+        self._stop = threading.Event()
+        self._watch: Optional[watch.Watch] = None
+        self._thread = threading.Thread(target=self._run, name=f"informer-{resource}", daemon=True)
+        CACHE_STALENESS.labels(resource=resource).set_function(self.staleness)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watch:
+            self._watch.stop()
+
+    def staleness(self) -> float:
+        if not self.synced.is_set():
+            return float("inf")
+        return time.monotonic() - self.last_healthy
+
+    def _relist(self) -> None:
+        result = self.list_fn(**self.list_kwargs)
+        self.on_reset(result.items)
+        self.resource_version = result.metadata.resource_version
+        self.last_healthy = time.monotonic()
+        self.synced.set()
+        CACHE_RESYNCS.labels(resource=self.resource).inc()
+        logger.info(f"Informer {self.resource} synced {len(result.items)} objects at resourceVersion {self.resource_version}")
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if self.resource_version is None:
+                    self._relist()
+                self._watch = watch.Watch()
+                for event in self._watch.stream(
+                    self.list_fn,
+                    resource_version=self.resource_version,
+                    timeout_seconds=WATCH_TIMEOUT_SECONDS,
+                    allow_watch_bookmarks=True,
+                    _request_timeout=WATCH_TIMEOUT_SECONDS + 10,
+                    **self.list_kwargs,
+                ):
+                    if event['type'] == 'BOOKMARK':
+                        self.resource_version = event['raw_object']['metadata']['resourceVersion']
+                    else:
+                        self.resource_version = event['object'].metadata.resource_version
+                        self.on_event(event['type'], event['object'])
+                    self.last_healthy = time.monotonic()
+                # Clean server-side timeout: the stream was healthy until now
+                self.last_healthy = time.monotonic()
+                backoff = 1.0
+            except ApiException as e:
+                CACHE_WATCH_ERRORS.labels(resource=self.resource).inc()
+                if e.status == 410:  # resourceVersion expired, relist
+                    logger.info(f"Informer {self.resource} watch expired, relisting")
+                    self.resource_version = None
+                    continue
+                logger.warning(f"Informer {self.resource} watch failed: {e}")
+                self._stop.wait(backoff + random.uniform(0, backoff))
+                backoff = min(backoff * 2, 30.0)
+            except Exception as e:
+                CACHE_WATCH_ERRORS.labels(resource=self.resource).inc()
+                logger.warning(f"Informer {self.resource} watch dropped: {e}")
+                self._stop.wait(backoff + random.uniform(0, backoff))
+                backoff = min(backoff * 2, 30.0)
+
+
+def project_changes(before: Dict[str, str], after: Dict[str, str]) -> List[Tuple[str, str, str]]:
+    """Deltas between two namespace -> status maps as (change, namespace, status)"""
+    changes = []
+    for name, status in after.items():
+        if name not in before:
+            changes.append(("created", name, status))
+        elif before[name] != status:
+            changes.append(("updated", name, status))
+    for name, status in before.items():
+        if name not in after:
+            changes.append(("deleted", name, status))
+    return changes
+
+
+class ProjectCache:
+    """In-memory index of roo=true namespaces and their vscode-server deployments"""
+
+    def __init__(self, v1, apps_v1):
+        self._lock = threading.Lock()
+        self.namespaces: Dict[str, object] = {}
+        self.deployments: Dict[str, object] = {}
+        self.listeners: List[Callable[[List[Tuple[str, str, str]]], None]] = []
+        self.informers = [
+            Informer("namespaces", v1.list_namespace, self._reset_namespaces, self._namespace_event,
+                     label_selector="roo=true"),
+            Informer("deployments", apps_v1.list_deployment_for_all_namespaces, self._reset_deployments,
+                     self._deployment_event, field_selector="metadata.name=vscode-server"),
+        ]
+        CACHE_OBJECTS.labels(resource="namespaces").set_function(lambda: len(self.namespaces))
+        CACHE_OBJECTS.labels(resource="deployments").set_function(lambda: len(self.deployments))
+
+    def start(self) -> None:
+        for informer in self.informers:
+            informer.start()
+
+    def stop(self) -> None:
+        for informer in self.informers:
+            informer.stop()
+
+    def add_listener(self, listener: Callable[[List[Tuple[str, str, str]]], None]) -> None:
+        """Register a callback receiving project deltas.
+
+        Listeners run on informer threads with the index locked, so they must
+        return quickly and must not call back into the cache.
+        """
+        self.listeners.append(listener)
+
+    def is_fresh(self) -> bool:
+        """True when every informer has synced and watched recently"""
+        return all(informer.staleness() <= MAX_STALENESS_SECONDS for informer in self.informers)
+
+    def deployment(self, namespace: str):
+        """The cached vscode-server deployment for any namespace, pooled ones included"""
+        with self._lock:
+            return self.deployments.get(namespace)
+
+    def deployment_objects(self) -> List[object]:
+        """Every cached vscode-server deployment, pooled ones included"""
+        with self._lock:
+            return list(self.deployments.values())
+
+    def projects(self) -> List[Tuple[str, str]]:
+        """(namespace, status) for every workspace, sorted by namespace"""
+        with self._lock:
+            return [(name, self._status(name)) for name in sorted(self.namespaces)]
+
+    def namespace(self, name: str):
+        """The cached roo=true namespace, if any"""
+        with self._lock:
+            return self.namespaces.get(name)
+
+    def namespace_objects(self) -> List[object]:
+        """Every cached roo=true namespace"""
+        with self._lock:
+            return list(self.namespaces.values())
+
+    def _status(self, name: str) -> str:
+        return project_status(self.namespaces.get(name), self.deployments.get(name))
+
+    def _statuses(self, names=None) -> Dict[str, str]:
+        names = self.namespaces if names is None else [n for n in names if n in self.namespaces]
+        return {name: self._status(name) for name in names}
+
+    def _update(self, mutate: Callable[[], None], names=None) -> None:
+        """Apply a change to the index and notify listeners of what it did to projects"""
+        with self._lock:
+            before = self._statuses(names)
+            mutate()
+            changes = project_changes(before, self._statuses(names))
+            # Notify under the lock so listeners see changes in the order they happened
+            for listener in self.listeners if changes else ():
+                try:
+                    listener(changes)
+                except Exception as e:
+                    logger.warning(f"Project cache listener failed: {e}")
+
+    def _reset_namespaces(self, items) -> None:
+        def mutate():
+            self.namespaces = {ns.metadata.name: ns for ns in items}
+        self._update(mutate)
+
+    def _reset_deployments(self, items) -> None:
+        def mutate():
+            self.deployments = {d.metadata.namespace: d for d in items}
+        self._update(mutate)
+
+    def _namespace_event(self, event_type: str, ns) -> None:
+        name = ns.metadata.name
+
+        def mutate():
+            if event_type == 'DELETED':
+                self.namespaces.pop(name, None)
+            else:
+                self.namespaces[name] = ns
+        self._update(mutate, [name])
+
+    def _deployment_event(self, event_type: str, deployment) -> None:
+        name = deployment.metadata.namespace
+
+        def mutate():
+            if event_type == 'DELETED':
+                self.deployments.pop(name, None)
+            else:
+                self.deployments[name] = deployment
+        self._update(mutate, [name])
@@ -0,0 +1,317 @@
+"""Coordination between backend processes through Kubernetes Leases.
+
+Several backend processes can serve the API at once: worker processes in one
+pod (BACKEND_WORKERS) and replicas of the pod. Request handling needs no
+coordination, but some duties must run exactly once: the deletion sweep, the
+TTL reaper, warm pool refills, idle scale-down, idempotency record expiry and
+recording workspace startup phase reports.
+
+``LeaderElector`` runs those on whichever process holds the
+``roo-backend-leader`` Lease in COORDINATION_NAMESPACE. The holder renews it
+every LEASE_RETRY_SECONDS; others take it over once it has gone unrenewed for
+LEASE_DURATION_SECONDS. A leader that cannot renew within
+LEASE_RENEW_DEADLINE_SECONDS steps down before anyone else can take over, so
+two leaders never overlap as long as clocks run at the same rate.
+
+``NodeIdLease`` gives each process a distinct namespace-name node ID (see
+naming.py) by holding a ``roo-node-<id>`` Lease for it.
+"""
+import os
+import time
+import uuid
+import random
+import socket
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
+
+from kubernetes.client.rest import ApiException
+
+from k8s import BACKEND_WORKERS, run_k8s
+from metrics import LEADER_TRANSITIONS
+from naming import NODE_BITS
+
+logger = logging.getLogger(__name__)
+
+COORDINATION_NAMESPACE = os.environ.get("COORDINATION_NAMESPACE", "default")
+# Off: every process runs the singleton duties, as with a single backend
+LEADER_ELECTION_ENABLED = os.environ.get("LEADER_ELECTION_ENABLED", "true").lower() == "true"
+LEADER_LEASE_NAME = os.environ.get("LEADER_LEASE_NAME", "roo-backend-leader")
+LEASE_DURATION_SECONDS = int(os.environ.get("LEASE_DURATION_SECONDS", "15"))
+LEASE_RENEW_DEADLINE_SECONDS = float(os.environ.get("LEASE_RENEW_DEADLINE_SECONDS", "10"))
+LEASE_RETRY_SECONDS = float(os.environ.get("LEASE_RETRY_SECONDS", "2"))
+
+NODE_LEASE_PREFIX = "roo-node-"
+NODE_LEASE_LABELS = {"roo.io/lease": "node-id", "created-by": "roo-saas"}
+# Free node IDs tried per claim before waiting for the next round
+NODE_CLAIM_ATTEMPTS = 8
+
+MICROTIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def process_identity() -> str:
+    """A name for this process that no other process, here or in another pod, shares"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def _microtime(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime(MICROTIME_FORMAT)
+
+
+class LeaseLock:
+    """A Lease used as a lock: held by its holderIdentity until it goes unrenewed for its duration.
+
+    The methods block; call them with run_k8s.
+    """
+
+    def __init__(self, coordination_v1, name: str, identity: str, namespace: str = COORDINATION_NAMESPACE,
+                 duration: int = LEASE_DURATION_SECONDS, labels: Optional[dict] = None):
+        self.api = coordination_v1
+        self.name = name
+        self.identity = identity
+        self.namespace = namespace
+        self.duration = duration
+        self.labels = labels
+        # (resourceVersion, monotonic time it was first seen): expiry is judged on
+        # this process's clock once the record has been watched for a while
+        self._observed: Optional[Tuple[str, float]] = None
+
+    def _body(self, acquired: datetime, renewed: datetime, transitions: int, holder: Optional[str] = None,
+              resource_version: Optional[str] = None) -> dict:
+        metadata = {"name": self.name, "namespace": self.namespace}
+        if self.labels:
+            metadata["labels"] = self.labels
+        if resource_version:
+            # Replaces conflict (409) if anyone else wrote the lease since it was read
+            metadata["resourceVersion"] = resource_version
+        return {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            "metadata": metadata,
+            "spec": {
+                "holderIdentity": self.identity if holder is None else holder,
+                "leaseDurationSeconds": self.duration,
+                "acquireTime": _microtime(acquired),
+                "renewTime": _microtime(renewed),
+                "leaseTransitions": transitions,
+            },
+        }
+
+    def _expired(self, lease) -> bool:
+        spec = lease.spec
+        if not spec.holder_identity:
+            return True
+        duration = spec.lease_duration_seconds or self.duration
+        version = lease.metadata.resource_version
+        now = time.monotonic()
+        if self._observed is not None and self._observed[0] == version:
+            return now - self._observed[1] >= duration
+        self._observed = (version, now)
+        # First sight of this record: all there is to go on is the holder's renewTime
+        renewed = spec.renew_time
+        return renewed is not None and (datetime.now(timezone.utc) - renewed).total_seconds() >= duration
+
+    def try_acquire(self) -> Optional[str]:
+        """Take or renew the lease; returns who holds it now, or None if another process raced us"""
+        now = datetime.now(timezone.utc)
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            try:
+                self.api.create_namespaced_lease(self.namespace, self._body(now, now, 0))
+            except ApiException as e:
+                if e.status == 409:
+                    return None
+                raise
+            return self.identity
+
+        spec = lease.spec
+        holder = spec.holder_identity
+        if holder != self.identity and not self._expired(lease):
+            return holder
+        renewing = holder == self.identity
+        body = self._body(spec.acquire_time if renewing and spec.acquire_time else now, now,
+                          (spec.lease_transitions or 0) + (0 if renewing else 1),
+                          resource_version=lease.metadata.resource_version)
+        try:
+            self.api.replace_namespaced_lease(self.name, self.namespace, body)
+        except ApiException as e:
+            if e.status == 409:
+                return None
+            raise
+        return self.identity
+
+    def release(self) -> None:
+        """Give the lease up, if this process holds it, so a successor need not wait for it to expire"""
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.namespace)
+        except ApiException as e:
+            if e.status == 404:
+                return
+            raise
+        if lease.spec.holder_identity != self.identity:
+            return
+        now = datetime.now(timezone.utc)
+        body = self._body(lease.spec.acquire_time or now, now, lease.spec.lease_transitions or 0, holder="",
+                          resource_version=lease.metadata.resource_version)
+        try:
+            self.api.replace_namespaced_lease(self.name, self.namespace, body)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+
+
+class LeaderElector:
+    """Calls on_started when this process becomes the leader and on_stopped when it stops being it"""
+
+    def __init__(self, lock: LeaseLock, on_started: Callable[[], None], on_stopped: Callable[[], None],
+                 enabled: bool = LEADER_ELECTION_ENABLED, renew_deadline: float = LEASE_RENEW_DEADLINE_SECONDS,
+                 retry: float = LEASE_RETRY_SECONDS):
+        self.lock = lock
+        self.on_started = on_started
+        self.on_stopped = on_stopped
+        self.enabled = enabled
+        self.renew_deadline = renew_deadline
+        self.retry = retry
+        self.is_leader = False
+        self.holder: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if not self.enabled:
+            logger.info("Leader election disabled: this process runs every singleton duty")
+            self._transition(True)
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.is_leader:
+            self._transition(False)
+            if self.enabled:
+                try:
+                    await asyncio.wait_for(run_k8s(self.lock.release), timeout=self.retry)
+                except Exception as e:
+                    logger.warning(f"Failed to release lease {self.lock.name}: {e}")
+
+    def _transition(self, leader: bool) -> None:
+        self.is_leader = leader
+        LEADER_TRANSITIONS.labels(lease=self.lock.name, event="acquired" if leader else "lost").inc()
+        logger.info(f"Process {os.getpid()} {'is now' if leader else 'is no longer'} the leader ({self.lock.identity})")
+        try:
+            (self.on_started if leader else self.on_stopped)()
+        except Exception as e:
+            logger.error(f"Leader {'start' if leader else 'stop'} callback failed: {e}")
+
+    async def _run(self) -> None:
+        last_renewed = 0.0
+        while True:
+            try:
+                # A hung call must not keep a leader past its renew deadline
+                holder = await asyncio.wait_for(run_k8s(self.lock.try_acquire), timeout=self.renew_deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Lease {self.lock.name} renewal failed: {e!r}")
+                holder = None
+            if holder is not None:
+                self.holder = holder
+            if holder == self.lock.identity:
+                last_renewed = time.monotonic()
+                if not self.is_leader:
+                    self._transition(True)
+            elif self.is_leader and (holder is not None or time.monotonic() - last_renewed >= self.renew_deadline):
+                self._transition(False)
+            await asyncio.sleep(self.retry)
+
+
+class NodeIdLease:
+    """Holds a roo-node-<id> Lease so no two live processes allocate names with the same node ID"""
+
+    def __init__(self, coordination_v1, allocator, identity: str, namespace: str = COORDINATION_NAMESPACE,
+                 duration: int = LEASE_DURATION_SECONDS):
+        self.api = coordination_v1
+        self.allocator = allocator
+        self.identity = identity
+        self.namespace = namespace
+        self.duration = duration
+        self.lock: Optional[LeaseLock] = None
+        # time.monotonic() of the last successful renewal of self.lock
+        self.renewed = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _lock(self, node_id: int) -> LeaseLock:
+        return LeaseLock(self.api, f"{NODE_LEASE_PREFIX}{node_id}", self.identity, self.namespace,
+                         self.duration, labels=NODE_LEASE_LABELS)
+
+    async def start(self) -> None:
+        if os.environ.get("ROO_NODE_ID"):
+            if BACKEND_WORKERS > 1:
+                logger.warning("ROO_NODE_ID is set, so every worker process allocates names with the same node ID; "
+                               "unset it to have each worker lease its own")
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.lock is not None:
+            try:
+                await asyncio.wait_for(run_k8s(self.lock.release), timeout=LEASE_RETRY_SECONDS)
+            except Exception as e:
+                logger.warning(f"Failed to release lease {self.lock.name}: {e}")
+
+    def _drop(self, reason: str) -> None:
+        """Stop using a node ID whose lease another process may now hold"""
+        logger.warning(f"{reason} lease {self.lock.name}; claiming another node ID")
+        lost = self.allocator.node_id
+        self.lock = None
+        # As at startup, a random ID until another is leased, never the one its new holder allocates with
+        self.allocator.node_id = random.choice([node_id for node_id in range(2 ** NODE_BITS) if node_id != lost])
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.lock is not None:
+                    if await run_k8s(self.lock.try_acquire) == self.identity:
+                        self.renewed = time.monotonic()
+                    else:
+                        self._drop("Lost")
+                if self.lock is None:
+                    await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Node ID lease renewal failed: {e!r}")
+                if self.lock is not None and time.monotonic() - self.renewed >= self.duration:
+                    self._drop("Could not renew")
+            await asyncio.sleep(self.duration / 3 if self.lock is not None else LEASE_RETRY_SECONDS)
+
+    async def _claim(self) -> None:
+        leases = await run_k8s(self.api.list_namespaced_lease, self.namespace,
+                               label_selector=",".join(f"{key}={value}" for key, value in NODE_LEASE_LABELS.items()))
+        now = datetime.now(timezone.utc)
+        held = set()
+        for lease in leases.items:
+            spec = lease.spec
+            if spec.holder_identity and spec.renew_time and \
+                    (now - spec.renew_time).total_seconds() < (spec.lease_duration_seconds or self.duration):
+                held.add(lease.metadata.name)
+        # Start the search somewhere random, so processes starting together rarely race for one ID
+        start = random.getrandbits(NODE_BITS)
+        free = (node_id % 2 ** NODE_BITS for node_id in range(start, start + 2 ** NODE_BITS)
+                if f"{NODE_LEASE_PREFIX}{node_id % 2 ** NODE_BITS}" not in held)
+        for _, node_id in zip(range(NODE_CLAIM_ATTEMPTS), free):
+            lock = self._lock(node_id)
+            if await run_k8s(lock.try_acquire) == self.identity:
+                self.lock = lock
+                self.renewed = time.monotonic()
+                self.allocator.node_id = node_id
+                logger.info(f"Allocating namespace names as node {node_id}")
+                return
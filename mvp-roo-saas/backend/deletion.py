@@ -0,0 +1,178 @@
+"""Queued, reconciled workspace deletion.
+
+A delete request only marks the namespace with the ``roo.io/deletion-requested``
+annotation and queues it, so the API can answer straight away. Workers then
+delete the workspace's cluster-scoped RBAC objects and its namespace, retrying
+failures with backoff. The annotation makes requests durable: a periodic sweep
+re-queues any marked namespace that is not yet terminating, e.g. after a
+restart, and garbage-collects cluster-scoped ``workspace-cluster-reader-*``
+objects whose namespace no longer exists.
+
+Every backend process tears down the workspaces it was asked to delete; the
+sweep is a singleton duty, run only by the elected leader (``start_sweep``).
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from kubernetes.client.rest import ApiException
+
+from cache import DELETION_ANNOTATION, is_deleting
+from k8s import run_k8s
+from metrics import DELETION_ATTEMPTS, DELETION_DURATION, DELETION_QUEUE, ORPHANS_COLLECTED
+from tracing import root_span, span
+
+logger = logging.getLogger(__name__)
+
+DELETION_WORKERS = int(os.environ.get("DELETION_WORKERS", "4"))
+DELETION_RESYNC_SECONDS = float(os.environ.get("DELETION_RESYNC_SECONDS", "60"))
+# Cluster-scoped objects are created alongside their namespace, not after it,
+# so only ones older than this are ever treated as orphans
+ORPHAN_GRACE_SECONDS = float(os.environ.get("ORPHAN_GRACE_SECONDS", "300"))
+MAX_RETRY_DELAY = 300.0
+
+CLUSTER_RBAC_PREFIX = "workspace-cluster-reader-"
+WORKSPACE_SELECTOR = "created-by=roo-saas"
+# Label values per delete-collection call; keeps the selector a sane length
+GC_CHUNK_SIZE = 50
+
+
+class DeletionReconciler:
+    """Background queue that tears workspaces down and sweeps up leftovers"""
+
+    def __init__(self, v1, rbac_v1):
+        self.v1 = v1
+        self.rbac_v1 = rbac_v1
+        self.pending: Set[str] = set()
+        self.attempts: Dict[str, int] = {}
+        self.requested_at: Dict[str, float] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sweep_task: Optional[asyncio.Task] = None
+        DELETION_QUEUE.set_function(lambda: len(self.pending))
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(DELETION_WORKERS)]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self.stop_sweep()
+
+    def start_sweep(self) -> None:
+        """Periodically re-queue marked namespaces and collect orphans; one process in the deployment does this"""
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    def stop_sweep(self) -> None:
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+
+    async def request(self, namespace: str) -> None:
+        """Mark a workspace for deletion and queue it; raises ApiException 404 if it does not exist"""
+        await run_k8s(self.v1.patch_namespace, namespace, {
+            "metadata": {"annotations": {
+                DELETION_ANNOTATION: datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }}
+        })
+        self.requested_at.setdefault(namespace, time.monotonic())
+        self.enqueue(namespace)
+
+    def enqueue(self, namespace: str) -> None:
+        if namespace in self.pending:
+            return
+        self.pending.add(namespace)
+        self._queue.put_nowait(namespace)
+
+    async def _worker(self) -> None:
+        while True:
+            namespace = await self._queue.get()
+            try:
+                await self._teardown(namespace)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                attempt = self.attempts.get(namespace, 0) + 1
+                self.attempts[namespace] = attempt
+                delay = min(2 ** attempt, MAX_RETRY_DELAY) * random.uniform(0.5, 1.0)
+                DELETION_ATTEMPTS.labels(result="retry").inc()
+                logger.warning(f"Deleting namespace {namespace} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, namespace)
+                continue
+            self.pending.discard(namespace)
+            self.attempts.pop(namespace, None)
+            requested_at = self.requested_at.pop(namespace, None)
+            if requested_at is not None:
+                DELETION_DURATION.observe(time.monotonic() - requested_at)
+            DELETION_ATTEMPTS.labels(result="success").inc()
+
+    async def _teardown(self, namespace: str) -> None:
+        """Delete a workspace's cluster-wide RBAC objects and then its namespace; 404s count as done"""
+        name = f"{CLUSTER_RBAC_PREFIX}{namespace}"
+        # Runs outside any request, so each teardown is a trace of its own
+        with root_span("deletion.teardown", namespace=namespace, attempt=self.attempts.get(namespace, 0) + 1):
+            for kind, delete in (("ClusterRole", self.rbac_v1.delete_cluster_role),
+                                 ("ClusterRoleBinding", self.rbac_v1.delete_cluster_role_binding),
+                                 ("Namespace", self.v1.delete_namespace)):
+                target = namespace if kind == "Namespace" else name
+                with span(f"delete {kind}", kind=kind, name=target) as current:
+                    try:
+                        await run_k8s(delete, name=target)
+                        logger.info(f"Deleted {kind}: {target}")
+                    except ApiException as e:
+                        if e.status != 404:
+                            raise
+                        current.set_attribute("already_gone", True)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Deletion sweep failed: {e}")
+            await asyncio.sleep(DELETION_RESYNC_SECONDS)
+
+    async def sweep(self) -> None:
+        """Re-queue marked namespaces and collect orphaned cluster-scoped RBAC objects"""
+        namespaces = (await run_k8s(self.v1.list_namespace, label_selector=WORKSPACE_SELECTOR)).items
+        live = set()
+        for ns in namespaces:
+            name = ns.metadata.name
+            if DELETION_ANNOTATION in (ns.metadata.annotations or {}):
+                if not (ns.status and ns.status.phase == "Terminating"):
+                    self.enqueue(name)
+            elif not is_deleting(ns):
+                live.add(name)
+        # Terminating namespaces without the annotation were deleted by someone else;
+        # their RBAC objects are orphans as well once old enough
+        await self._collect_orphans("ClusterRole", self.rbac_v1.list_cluster_role,
+                                    self.rbac_v1.delete_collection_cluster_role, live)
+        await self._collect_orphans("ClusterRoleBinding", self.rbac_v1.list_cluster_role_binding,
+                                    self.rbac_v1.delete_collection_cluster_role_binding, live)
+
+    async def _collect_orphans(self, kind: str, list_fn, delete_collection_fn, live: Set[str]) -> None:
+        items = (await run_k8s(list_fn, label_selector=WORKSPACE_SELECTOR)).items
+        now = time.time()
+        orphans = sorted({
+            item.metadata.labels["namespace"] for item in items
+            if item.metadata.name.startswith(CLUSTER_RBAC_PREFIX)
+            and (item.metadata.labels or {}).get("namespace")
+            and item.metadata.labels["namespace"] not in live
+            and item.metadata.labels["namespace"] not in self.pending
+            and item.metadata.creation_timestamp
+            and now - item.metadata.creation_timestamp.timestamp() > ORPHAN_GRACE_SECONDS
+        })
+        for start in range(0, len(orphans), GC_CHUNK_SIZE):
+            chunk = orphans[start:start + GC_CHUNK_SIZE]
+            await run_k8s(delete_collection_fn,
+                          label_selector=f"{WORKSPACE_SELECTOR},namespace in ({','.join(chunk)})")
+            ORPHANS_COLLECTED.labels(kind=kind).inc(len(chunk))
+            logger.info(f"Collected {len(chunk)} orphaned {kind} objects: {', '.join(chunk)}")
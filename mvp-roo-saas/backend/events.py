@@ -0,0 +1,57 @@
+"""Fan-out of project deltas from the shared informers to streaming clients.
+
+Every subscriber gets its own bounded queue fed from the single upstream watch
+in ProjectCache, so the number of open dashboards does not change API-server
+load. A subscriber that falls too far behind is dropped; its client reconnects
+and starts again from a fresh snapshot.
+"""
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from metrics import STREAM_DROPPED, STREAM_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stream whose subscriber overflowed its queue
+OVERFLOW = None
+
+
+class ProjectEventHub:
+    """Thread-safe publisher of (change, namespace, status) deltas to asyncio queues"""
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        STREAM_SUBSCRIBERS.set_function(lambda: len(self._subscribers))
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach to the event loop that owns the subscriber queues"""
+        self._loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, changes: List[Tuple[str, str, str]]) -> None:
+        """Hand deltas to the event loop; safe to call from any thread"""
+        if self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self._dispatch, changes)
+
+    def _dispatch(self, changes: List[Tuple[str, str, str]]) -> None:
+        for queue in list(self._subscribers):
+            try:
+                for change in changes:
+                    queue.put_nowait(change)
+            except asyncio.QueueFull:
+                # Too slow to keep up: end its stream rather than buffer without bound
+                self._subscribers.discard(queue)
+                STREAM_DROPPED.inc()
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(OVERFLOW)
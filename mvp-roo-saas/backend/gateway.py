@@ -0,0 +1,86 @@
+"""Route table for the shared workspace gateway (ROO_ROUTING_MODE=gateway).
+
+In the default ingress mode every workspace brings its own regex Ingress, and
+ingress-nginx rebuilds and reloads its configuration on each create and
+delete. In gateway mode workspaces get no Ingress: one static Ingress points at
+the nginx gateway from manifests/gateway.yaml, which asks
+``GET /api/routes/{namespace}`` where a workspace lives. The answer comes from
+an in-memory ``RouteTable`` (routes.py), so adding or removing a workspace is a
+dict update: nothing in the cluster is reconfigured and nothing reloads.
+
+The table follows the project cache's deltas; without the cache it is rebuilt
+from a namespace list every ROUTE_RESYNC_SECONDS. Create and delete also update
+it directly, so a new workspace is reachable as soon as its create returns.
+"""
+import os
+import asyncio
+import logging
+from typing import Optional
+
+from kubernetes.client.rest import ApiException
+
+from cache import is_deleting
+from k8s import run_k8s
+from provision import RESOURCE_CREATORS, TEMPLATE_PARAMETERS, template_store
+from routes import RouteTable
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_NAMESPACE = os.environ.get("GATEWAY_NAMESPACE", "roo-gateway")
+GATEWAY_TEMPLATE = "gateway.yaml"
+# Rebuild the table from the cluster this often when the project cache is off
+ROUTE_RESYNC_SECONDS = float(os.environ.get("ROUTE_RESYNC_SECONDS", "15"))
+
+
+class GatewayRoutes:
+    """Installs the gateway and keeps the route table in step when the cache is off"""
+
+    def __init__(self, v1, project_cache, use_cache: bool = True):
+        self.v1 = v1
+        self.table = RouteTable()
+        self.use_cache = use_cache
+        self._task: Optional[asyncio.Task] = None
+        if use_cache:
+            project_cache.add_listener(self.table.project_changes)
+
+    async def start(self) -> None:
+        await self.install()
+        if not self.use_cache:
+            self._task = asyncio.create_task(self._resync())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def install(self) -> None:
+        """Create the gateway's objects; ones that already exist are left as they are"""
+        try:
+            documents = template_store.render([GATEWAY_TEMPLATE], {**TEMPLATE_PARAMETERS, "NAMESPACE": GATEWAY_NAMESPACE})
+        except FileNotFoundError as e:
+            logger.error(f"Gateway template not found: {e}")
+            return
+        created, existing = 0, 0
+        # In order: the Namespace first, the ConfigMap before the pods that mount it
+        for doc in documents:
+            create, _ = RESOURCE_CREATORS[doc['kind']]
+            try:
+                await run_k8s(create, doc['metadata'].get('namespace'), doc)
+                created += 1
+            except ApiException as e:
+                if e.status == 409:
+                    existing += 1
+                else:
+                    logger.error(f"Failed to create gateway {doc['kind']} {doc['metadata']['name']}: {e}")
+        logger.info(f"Workspace gateway in namespace {GATEWAY_NAMESPACE}: {created} objects created, "
+                    f"{existing} already existed")
+
+    async def _resync(self) -> None:
+        while True:
+            try:
+                namespaces = await run_k8s(self.v1.list_namespace, label_selector="roo=true")
+                self.table.replace(ns.metadata.name for ns in namespaces.items if not is_deleting(ns))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to resync gateway routes: {e}")
+            await asyncio.sleep(ROUTE_RESYNC_SECONDS)
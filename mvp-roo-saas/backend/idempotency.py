@@ -0,0 +1,244 @@
+"""Idempotency-Key support for create requests.
+
+A client that retries a POST with the same Idempotency-Key header gets the
+original response back instead of a second workspace. Keys are kept for
+IDEMPOTENCY_TTL_SECONDS, scoped to the endpoint and the calling user, and tied
+to a fingerprint of the request body: reusing a key for a different request is
+rejected with 422. A retry that arrives while the original is still running
+waits for it. Only successful responses are remembered, so a request that
+failed can be retried under the same key.
+
+With IDEMPOTENCY_SHARED, keys are also claimed in ConfigMaps in
+COORDINATION_NAMESPACE, so a retry that reaches another worker process or
+replica is answered the same way: creating the ConfigMap claims the key, and a
+retry that finds it replays the stored response or waits up to
+IDEMPOTENCY_WAIT_SECONDS for it. The leader deletes expired records.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from kubernetes.client.rest import ApiException
+
+from coordination import COORDINATION_NAMESPACE
+from k8s import run_k8s
+from metrics import IDEMPOTENT_REPLAYS
+from reaper import EXPIRES_ANNOTATION, TIMESTAMP_FORMAT, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Share keys between worker processes and replicas through ConfigMaps
+IDEMPOTENCY_SHARED = os.environ.get("IDEMPOTENCY_SHARED", "true").lower() == "true"
+# Longest a retry waits for another process to finish the original request
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_POLL_SECONDS = 0.5
+# A claim this old whose request never finished belonged to a process that died
+IDEMPOTENCY_CLAIM_STALE_SECONDS = 120.0
+IDEMPOTENCY_EXPIRE_SECONDS = 300.0
+
+RECORD_PREFIX = "roo-idempotency-"
+RECORD_LABEL = "roo.io/idempotency-record"
+
+
+def fingerprint(body) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SharedIdempotencyStore:
+    """Idempotency records kept as ConfigMaps, visible to every backend process"""
+
+    def __init__(self, v1, holder: str, namespace: str = COORDINATION_NAMESPACE, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.v1 = v1
+        self.holder = holder
+        self.namespace = namespace
+        self.ttl = ttl
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def record_name(scope: str, key: str) -> str:
+        return RECORD_PREFIX + hashlib.sha256(f"{scope}\0{key}".encode()).hexdigest()[:40]
+
+    def _record(self, name: str, digest: str) -> dict:
+        expires = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        return {
+            "metadata": {
+                "name": name,
+                "labels": {RECORD_LABEL: "true", "created-by": "roo-saas"},
+                "annotations": {EXPIRES_ANNOTATION: expires.strftime(TIMESTAMP_FORMAT)},
+            },
+            "data": {"fingerprint": digest, "state": "pending", "holder": self.holder, "claimed-at": str(time.time())},
+        }
+
+    async def claim(self, scope: str, key: str, digest: str) -> Optional[object]:
+        """Claim a key: None if this process now owns it, else the response another process recorded"""
+        name = self.record_name(scope, key)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            try:
+                await run_k8s(self.v1.create_namespaced_config_map, self.namespace, self._record(name, digest))
+                return None
+            except ApiException as e:
+                if e.status != 409:
+                    raise
+            try:
+                record = await run_k8s(self.v1.read_namespaced_config_map, name, self.namespace)
+            except ApiException as e:
+                if e.status == 404:
+                    # Released or expired in the meantime: claim it again
+                    continue
+                raise
+            data = record.data or {}
+            if data.get("fingerprint") != digest:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            if data.get("state") == "done":
+                return json.loads(data["response"])
+            if time.time() - float(data.get("claimed-at") or 0) > IDEMPOTENCY_CLAIM_STALE_SECONDS:
+                logger.warning(f"Taking over idempotency record {name} abandoned by {data.get('holder')}")
+                await self._delete(name)
+                continue
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                                    headers={"Retry-After": "1"})
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    async def complete(self, scope: str, key: str, response) -> None:
+        """Record the response for a key this process claimed"""
+        await run_k8s(self.v1.patch_namespaced_config_map, self.record_name(scope, key), self.namespace, {
+            "data": {"state": "done", "response": json.dumps(jsonable_encoder(response))},
+        })
+
+    async def release(self, scope: str, key: str) -> None:
+        """Drop the claim of a request that failed, so it can be retried"""
+        await self._delete(self.record_name(scope, key))
+
+    async def _delete(self, name: str) -> None:
+        try:
+            await run_k8s(self.v1.delete_namespaced_config_map, name, self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    async def expire(self) -> int:
+        """Delete records past their expiry; returns how many"""
+        records = await run_k8s(self.v1.list_namespaced_config_map, self.namespace, label_selector=f"{RECORD_LABEL}=true")
+        now = time.time()
+        expired = [record.metadata.name for record in records.items
+                   if (parse_timestamp((record.metadata.annotations or {}).get(EXPIRES_ANNOTATION)) or now) < now]
+        for name in expired:
+            await self._delete(name)
+        return len(expired)
+
+    def start_expiry(self) -> None:
+        """Periodically delete expired records; one process in the deployment does this"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._expire_loop())
+
+    def stop_expiry(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _expire_loop(self) -> None:
+        while True:
+            try:
+                expired = await self.expire()
+                if expired:
+                    logger.info(f"Deleted {expired} expired idempotency records")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Idempotency record expiry failed: {e}")
+            await asyncio.sleep(IDEMPOTENCY_EXPIRE_SECONDS)
+
+
+class IdempotencyCache:
+    """TTL cache of in-flight and completed responses, keyed by (scope, key)"""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS,
+                 store: Optional[SharedIdempotencyStore] = None):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        # Consulted when this process has not seen a key, for requests other processes handled
+        self.store = store
+        # (scope, key) -> (fingerprint, expires_at, future resolving to the response)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float, asyncio.Future]]" = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            cache_key, (_, expires_at, future) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_keys:
+                break
+            if not future.done():
+                # Never drop a request that is still running
+                break
+            self._entries.popitem(last=False)
+
+    async def run(self, scope: str, key: Optional[str], body, create: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Run create() once per key; returns (response, replayed)"""
+        if key is None:
+            return await create(), False
+        if not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400,
+                                detail=f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+        now = time.monotonic()
+        self._expire(now)
+        cache_key = (scope, key)
+        digest = fingerprint(body)
+        entry = self._entries.get(cache_key)
+        if entry is not None:
+            stored_digest, _, future = entry
+            if stored_digest != digest:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            IDEMPOTENT_REPLAYS.labels(state="completed" if future.done() else "in_flight").inc()
+            # shield: a retry giving up must not cancel the original create
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[cache_key] = (digest, now + self.ttl, future)
+        claimed = False
+        try:
+            if self.store is not None:
+                shared = await self.store.claim(scope, key, digest)
+                if shared is not None:
+                    IDEMPOTENT_REPLAYS.labels(state="shared").inc()
+                    future.set_result(shared)
+                    return shared, True
+                claimed = True
+            response = await create()
+        except BaseException as e:
+            self._entries.pop(cache_key, None)
+            if claimed:
+                await self._release(scope, key)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Nobody may be waiting on the future; don't log its exception as unretrieved
+                future.exception()
+            raise
+        future.set_result(response)
+        if claimed:
+            try:
+                await self.store.complete(scope, key, response)
+            except Exception as e:
+                # The create succeeded; retries elsewhere wait, then take the claim over as abandoned
+                logger.warning(f"Failed to record idempotent response for {scope}: {e}")
+        return response, False
+
+    async def _release(self, scope: str, key: str) -> None:
+        try:
+            await self.store.release(scope, key)
+        except Exception as e:
+            logger.warning(f"Failed to release idempotency claim for {scope}: {e}")
@@ -0,0 +1,161 @@
+"""Scale idle workspaces to zero and wake them on the next request.
+
+Each workspace stamps its Deployment with ``roo.io/last-active`` about once a
+minute while anyone has the editor open. The scaler reads those stamps from the
+project cache and scales a Deployment to zero replicas once it has been idle
+for IDLE_TIMEOUT_SECONDS; the workspace volume is a PersistentVolumeClaim, so
+nothing is lost. While it sleeps, the workspace Ingress (or the shared gateway)
+sends its errors to this backend, which scales the Deployment back up and
+serves a holding page that reloads until the editor answers again.
+
+Any backend process can wake a workspace; only the elected leader scales idle
+ones down.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Set
+
+from kubernetes.client.rest import ApiException
+
+from cache import deployment_status, is_deleting
+from k8s import run_k8s
+from metrics import IDLE_SCALE_DOWNS, IDLE_SLEEPING, IDLE_WAKES
+from reaper import CLAIMED_ANNOTATION, TIMESTAMP_FORMAT, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# 0 disables scale-to-zero
+IDLE_TIMEOUT_SECONDS = int(os.environ.get("IDLE_TIMEOUT_SECONDS", "1800"))
+IDLE_CHECK_SECONDS = float(os.environ.get("IDLE_CHECK_SECONDS", "60"))
+
+LAST_ACTIVE_ANNOTATION = "roo.io/last-active"
+SLEPT_AT_ANNOTATION = "roo.io/slept-at"
+
+HOLDING_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <meta http-equiv="refresh" content="2">
+  <title>Waking up {namespace}</title>
+  <style>
+    body {{ font-family: sans-serif; display: flex; align-items: center; justify-content: center;
+           height: 100vh; margin: 0; background: #f7fafc; color: #2d3748; }}
+  </style>
+</head>
+<body>
+  <div>
+    <h2>🦘 Waking up workspace {namespace}…</h2>
+    <p>It was asleep after a period of inactivity. This page reloads until the editor is ready.</p>
+  </div>
+</body>
+</html>
+"""
+
+
+def last_active(namespace, deployment) -> float:
+    """Epoch seconds of the most recent sign of use: activity, a wake, a claim or creation"""
+    candidates = [
+        parse_timestamp((deployment.metadata.annotations or {}).get(LAST_ACTIVE_ANNOTATION)),
+        parse_timestamp((namespace.metadata.annotations or {}).get(CLAIMED_ANNOTATION)),
+    ]
+    for obj in (deployment, namespace):
+        if obj.metadata.creation_timestamp:
+            candidates.append(obj.metadata.creation_timestamp.timestamp())
+    return max((c for c in candidates if c is not None), default=time.time())
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+class IdleScaler:
+    """Periodically scales idle workspaces down; wakes them on demand"""
+
+    def __init__(self, apps_v1, project_cache, idle_timeout: int = IDLE_TIMEOUT_SECONDS):
+        self.apps_v1 = apps_v1
+        self.project_cache = project_cache
+        self.idle_timeout = idle_timeout
+        self.waking: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        IDLE_SLEEPING.set_function(self._sleeping)
+
+    @property
+    def enabled(self) -> bool:
+        return self.idle_timeout > 0
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Idle scale-to-zero enabled after {self.idle_timeout}s without activity")
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _sleeping(self) -> int:
+        return sum(1 for _, status in self.project_cache.projects() if status == "sleeping")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(IDLE_CHECK_SECONDS)
+            try:
+                await self.scale_down_idle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Idle check failed: {e}")
+
+    async def scale_down_idle(self) -> None:
+        # Acting on a stale view could put an active workspace to sleep
+        if not self.project_cache.is_fresh():
+            return
+        now = time.time()
+        for namespace in self.project_cache.namespace_objects():
+            name = namespace.metadata.name
+            deployment = self.project_cache.deployment(name)
+            if deployment is None or deployment.spec.replicas == 0 or is_deleting(namespace):
+                continue
+            idle_for = now - last_active(namespace, deployment)
+            if idle_for < self.idle_timeout:
+                continue
+            try:
+                await run_k8s(self.apps_v1.patch_namespaced_deployment, "vscode-server", name, {
+                    "metadata": {"annotations": {SLEPT_AT_ANNOTATION: _now()}},
+                    "spec": {"replicas": 0},
+                })
+            except ApiException as e:
+                if e.status != 404:
+                    logger.warning(f"Failed to scale idle workspace {name} to zero: {e}")
+                continue
+            IDLE_SCALE_DOWNS.inc()
+            logger.info(f"Scaled workspace {name} to zero after {idle_for:.0f}s idle")
+
+    async def wake(self, name: str, trigger: str) -> Optional[str]:
+        """Scale a sleeping workspace back up; returns its status, or None if it is not a workspace"""
+        namespace = self.project_cache.namespace(name)
+        deployment = self.project_cache.deployment(name)
+        if namespace is None or deployment is None:
+            return None
+        if is_deleting(namespace):
+            return "deleting"
+        if name in self.waking:
+            return "starting"
+        if deployment.spec.replicas != 0:
+            return deployment_status(deployment)
+        self.waking.add(name)
+        try:
+            # Count the wake as activity so the next idle check does not undo it
+            await run_k8s(self.apps_v1.patch_namespaced_deployment, "vscode-server", name, {
+                "metadata": {"annotations": {LAST_ACTIVE_ANNOTATION: _now()}},
+                "spec": {"replicas": 1},
+            })
+        finally:
+            self.waking.discard(name)
+        IDLE_WAKES.labels(trigger=trigger).inc()
+        logger.info(f"Woke workspace {name} ({trigger})")
+        return "starting"
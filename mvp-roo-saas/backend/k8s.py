@@ -0,0 +1,146 @@
+"""Kubernetes client setup and a bounded thread pool for running blocking API calls.
+
+The kubernetes client is synchronous, so request handlers must not call it on
+the event loop. ``run_k8s`` hands the call to a dedicated executor whose size
+matches the urllib3 connection pool, so concurrent requests proceed in parallel
+without queueing on connections. Requests themselves go through
+``apiclient.InstrumentedRESTClient``, which rate limits, retries and measures them.
+The call runs in a copy of the caller's context, so its API requests are
+traced as children of the caller's span.
+
+The clients are built lazily: importing this module does not read the
+kubeconfig or open connections. The first API call in a process does, so
+startup is quick and every worker process (forked or spawned) gets its own
+connection pool and threads.
+"""
+import os
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kubernetes import client, config
+
+from apiclient import InstrumentedRESTClient, RetryPolicy, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+K8S_MAX_WORKERS = int(os.environ.get("K8S_MAX_WORKERS", "32"))
+# Cap in-flight manifest creates so reads such as /health and list calls
+# always find a free thread, even during a burst of project creation
+K8S_MAX_CONCURRENT_APPLIES = int(os.environ.get("K8S_MAX_CONCURRENT_APPLIES", str(max(1, K8S_MAX_WORKERS // 2))))
+# Connections kept open to the API server; below K8S_MAX_WORKERS, threads open
+# throwaway connections whenever the pool is exhausted
+K8S_POOL_MAXSIZE = int(os.environ.get("K8S_POOL_MAXSIZE", str(K8S_MAX_WORKERS)))
+# Worker processes serving the API (python main.py); they share the rate limits below
+BACKEND_WORKERS = int(os.environ.get("BACKEND_WORKERS", "1"))
+# Client-side rate limits for writes and, separately, reads (get, list, watch);
+# 0 disables. Off by default: a throttled call sleeps on its k8s thread
+K8S_QPS = float(os.environ.get("K8S_QPS", "0"))
+K8S_BURST = int(os.environ.get("K8S_BURST", "100"))
+K8S_READ_QPS = float(os.environ.get("K8S_READ_QPS", "0"))
+K8S_READ_BURST = int(os.environ.get("K8S_READ_BURST", "100"))
+# Retries of transient failures, with jittered exponential backoff
+K8S_MAX_RETRIES = int(os.environ.get("K8S_MAX_RETRIES", "3"))
+K8S_RETRY_BASE_SECONDS = float(os.environ.get("K8S_RETRY_BASE_SECONDS", "0.2"))
+K8S_RETRY_MAX_SECONDS = float(os.environ.get("K8S_RETRY_MAX_SECONDS", "5"))
+# Longest Retry-After from the API server that is honoured
+K8S_RETRY_AFTER_MAX_SECONDS = float(os.environ.get("K8S_RETRY_AFTER_MAX_SECONDS", "10"))
+
+
+def load_configuration() -> client.Configuration:
+    """Load the in-cluster or local kubeconfig into a client configuration for this backend"""
+    try:
+        config.load_incluster_config()  # Try in-cluster config first
+    except:
+        try:
+            config.load_kube_config()  # Fall back to local kubeconfig
+            # If we're using host.docker.internal, disable SSL verification
+            configuration = client.Configuration.get_default_copy()
+            if "host.docker.internal" in configuration.host:
+                configuration.verify_ssl = False
+                configuration.ssl_ca_cert = None
+                configuration.assert_hostname = False
+                client.Configuration.set_default(configuration)
+                logger.info("Disabled SSL verification for host.docker.internal")
+        except:
+            logger.error("Could not load Kubernetes config")
+            raise
+
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = K8S_POOL_MAXSIZE
+    # Retries happen in InstrumentedRESTClient, with backoff and metrics, not in urllib3
+    configuration.retries = False
+    client.Configuration.set_default(configuration)
+    return configuration
+
+
+class LazyApiClient(client.ApiClient):
+    """ApiClient that loads its configuration and builds its connection pool on first use, in each process.
+
+    Nothing touches the kubeconfig or the network at import, and a forked
+    child never reuses its parent's pooled connections.
+    """
+
+    def __init__(self):
+        # ApiClient.__init__ would build the REST client straight away
+        self.pool_threads = 1
+        self.default_headers = {"User-Agent": "roo-saas-backend"}
+        self.cookie = None
+        self.client_side_validation = True
+        self._connection = None
+        self._connect_lock = threading.Lock()
+
+    def _connect(self):
+        connection = self._connection
+        if connection is None or connection[0] != os.getpid():
+            with self._connect_lock:
+                connection = self._connection
+                if connection is None or connection[0] != os.getpid():
+                    configuration = load_configuration()
+                    rest_client = InstrumentedRESTClient(
+                        configuration,
+                        limiter=TokenBucket(K8S_QPS / max(1, BACKEND_WORKERS), K8S_BURST),
+                        policy=RetryPolicy(K8S_MAX_RETRIES, K8S_RETRY_BASE_SECONDS, K8S_RETRY_MAX_SECONDS,
+                                           K8S_RETRY_AFTER_MAX_SECONDS),
+                        read_limiter=TokenBucket(K8S_READ_QPS / max(1, BACKEND_WORKERS), K8S_READ_BURST),
+                    )
+                    connection = self._connection = (os.getpid(), configuration, rest_client)
+        return connection
+
+    @property
+    def configuration(self) -> client.Configuration:
+        return self._connect()[1]
+
+    @property
+    def rest_client(self) -> InstrumentedRESTClient:
+        return self._connect()[2]
+
+
+# API objects are cheap to create; the first call made through one connects
+k8s_client = LazyApiClient()
+v1 = client.CoreV1Api(k8s_client)
+apps_v1 = client.AppsV1Api(k8s_client)
+networking_v1 = client.NetworkingV1Api(k8s_client)
+rbac_v1 = client.RbacAuthorizationV1Api(k8s_client)
+coordination_v1 = client.CoordinationV1Api(k8s_client)
+
+_executor = None
+apply_slots = asyncio.Semaphore(K8S_MAX_CONCURRENT_APPLIES)
+
+
+def k8s_executor() -> ThreadPoolExecutor:
+    """This process's k8s thread pool"""
+    global _executor
+    if _executor is None or _executor[0] != os.getpid():
+        _executor = (os.getpid(), ThreadPoolExecutor(max_workers=K8S_MAX_WORKERS, thread_name_prefix="k8s"))
+    return _executor[1]
+
+
+async def run_k8s(fn, *args, **kwargs):
+    """Run a blocking Kubernetes call on the k8s thread pool, in the caller's context (and trace)"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(k8s_executor(), functools.partial(context.run, fn, *args, **kwargs))
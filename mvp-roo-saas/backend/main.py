@@ -1,14 +1,38 @@
 import os
-import random
-import string
+import json
+import asyncio
+import time
 import logging
 import urllib3
-from typing import List
-from fastapi import FastAPI, HTTPException
+from typing import Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from kubernetes import client, config
 from kubernetes.client.rest import ApiException
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from admission import ADMISSION_CAPACITY_CHECK, OWNER_ANNOTATION, AdmissionController, workspace_requests
+from cache import ProjectCache, deployment_status, is_deleting
+from coordination import LEADER_LEASE_NAME, LeaderElector, LeaseLock, NodeIdLease, process_identity
+from deletion import DeletionReconciler
+from events import OVERFLOW, ProjectEventHub
+from gateway import GatewayRoutes
+from idempotency import IDEMPOTENCY_SHARED, IdempotencyCache, SharedIdempotencyStore
+from idle import HOLDING_PAGE, IdleScaler
+from k8s import BACKEND_WORKERS, v1, apps_v1, coordination_v1, rbac_v1, run_k8s
+from naming import NamespaceAllocator
+from metrics import CACHE_REQUESTS, CREATE_REQUEST_DURATION, REGISTRY_REQUESTS, exposition
+from pool import WarmPool
+from profiling import RequestProfiler
+from provision import (MANIFEST_TEMPLATES, ROUTING_MODE, NamespaceConflict, apply_manifest, apply_manifests,
+                       template_store)
+from reaper import (EXPIRES_ANNOTATION, PROJECT_TTL_MAX_SECONDS, PROJECT_TTL_SECONDS, TtlReaper,
+                    expiry_annotations, parse_timestamp)
+from registry import PAGE_SIZE_MAX, REGISTRY_ENABLED, ProjectRegistry, RegistryReconciler
+from startup import StartupTracker
+from status import ProjectWaiters, detail_etag, etag_matches, project_detail
+from tracing import TracingMiddleware, span
 
 # Disable SSL warnings for development
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -28,466 +52,373 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Kubernetes client
-try:
-    config.load_incluster_config()  # Try in-cluster config first
-except:
-    try:
-        config.load_kube_config()  # Fall back to local kubeconfig
-        # If we're using host.docker.internal, disable SSL verification
-        configuration = client.Configuration.get_default_copy()
-        if "host.docker.internal" in configuration.host:
-            configuration.verify_ssl = False
-            configuration.ssl_ca_cert = None
-            configuration.assert_hostname = False
-            client.Configuration.set_default(configuration)
-            logger.info("Disabled SSL verification for host.docker.internal")
-    except:
-        logger.error("Could not load Kubernetes config")
-        raise
+# Request traces, and sampling profiles of requests sent with an X-Roo-Profile header
+profiler = RequestProfiler()
+app.add_middleware(TracingMiddleware, profiler=profiler)
+
+# Watch-backed index of workspaces, used to serve GET /api/projects from memory
+PROJECT_CACHE_ENABLED = os.environ.get("PROJECT_CACHE_ENABLED", "true").lower() == "true"
+project_cache = ProjectCache(v1, apps_v1)
+
+# Pushes project deltas from the shared informers to /api/projects/stream clients
+STREAM_KEEPALIVE_SECONDS = 15
+project_events = ProjectEventHub()
+project_cache.add_listener(project_events.publish)
+
+# Startup phase reports from workspace pods and create-to-ready times
+startup_tracker = StartupTracker(v1, project_cache)
+# Phase reports are recorded by the leader only (see start_leader_duties)
+startup_tracker.report_phases = False
+
+# Wakes GET /api/projects/{namespace}?wait= long-polls when their workspace changes
+project_waiters = ProjectWaiters()
+project_cache.add_listener(project_waiters.project_changes)
+startup_tracker.add_listener(project_waiters.notify)
+
+# SQLite record of every project, serving listings; kept in sync with the cluster
+registry = ProjectRegistry()
+registry_reconciler = RegistryReconciler(registry, v1, apps_v1, project_cache, use_cache=PROJECT_CACHE_ENABLED)
+
+# Route table of the shared gateway, when it routes workspaces instead of their own Ingresses
+gateway = GatewayRoutes(v1, project_cache, use_cache=PROJECT_CACHE_ENABLED) if ROUTING_MODE == "gateway" else None
+
+# Background teardown of deleted workspaces and their cluster-scoped RBAC
+deletion = DeletionReconciler(v1, rbac_v1)
+
+# Deletes workspaces when their TTL runs out
+reaper = TtlReaper(v1, project_cache, deletion)
+
+# Scales idle workspaces to zero and wakes them on the next request
+idle_scaler = IdleScaler(apps_v1, project_cache)
+
+# Quota, in-flight limit and cluster capacity checks in front of provisioning
+admission = AdmissionController(v1, project_cache)
+
+# Pre-provisioned, unclaimed workspaces (disabled unless WARM_POOL_SIZE > 0)
+warm_pool = WarmPool(v1, project_cache, lambda: generate_namespace())
 
-k8s_client = client.ApiClient()
-v1 = client.CoreV1Api()
-apps_v1 = client.AppsV1Api()
-networking_v1 = client.NetworkingV1Api()
-rbac_v1 = client.RbacAuthorizationV1Api()
+# Names this process in coordination leases and shared idempotency records
+PROCESS_IDENTITY = process_identity()
+
+# Retried creates with the same Idempotency-Key get the original response, from any backend process
+idempotency_store = SharedIdempotencyStore(v1, PROCESS_IDENTITY) if IDEMPOTENCY_SHARED else None
+idempotency = IdempotencyCache(store=idempotency_store)
+# Fresh allocations that still hit an existing namespace are retried this many times
+NAMESPACE_ATTEMPTS = 3
+
+# Longest a GET /api/projects/{namespace}?wait= request may block
+PROJECT_WAIT_MAX_SECONDS = 300
+# Long-polls re-read the status at least this often, even without events,
+# and poll the API server this often when the informers cannot be used
+PROJECT_WAIT_RECHECK_SECONDS = 5.0
+PROJECT_WAIT_POLL_SECONDS = 2.0
+
+# Largest batch accepted by the :batch endpoints
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "200"))
+BATCH_DELETE_CONCURRENCY = int(os.environ.get("BATCH_DELETE_CONCURRENCY", "16"))
 
 # Pydantic models
 class ProjectRequest(BaseModel):
     name: str = None
+    ttl_seconds: Optional[int] = None
 
 class ProjectResponse(BaseModel):
     namespace: str
     url: str
     status: str
 
-def generate_namespace() -> str:
-    """Generate a random namespace name"""
-    suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
-    return f"proj-{suffix}"
-
-def load_manifest_template(template_name: str) -> str:
-    """Load a manifest template YAML"""
-    template_path = f"/app/manifests/{template_name}"
-    if not os.path.exists(template_path):
-        template_path = f"../manifests/{template_name}"
-
+class ReplicaCounts(BaseModel):
+    desired: int
+    current: int
+    ready: int
+    available: int
+    updated: int
+
+class ContainerDetail(BaseModel):
+    name: str
+    ready: bool
+    restarts: int
+    state: str
+    reason: Optional[str] = None
+
+class PodDetail(BaseModel):
+    name: str
+    phase: Optional[str] = None
+    ready: bool
+    restarts: int
+    conditions: Dict[str, bool]
+    containers: List[ContainerDetail]
+    started_at: Optional[str] = None
+
+class StartupReport(BaseModel):
+    phases: Dict[str, float]
+    # The template the pod actually started from: a bundle version, "image" or "legacy"
+    template_bundle: Optional[str] = None
+
+class ProjectDetail(ProjectResponse):
+    replicas: ReplicaCounts
+    pod: Optional[PodDetail] = None
+    startup: Optional[StartupReport] = None
+    created_at: Optional[str] = None
+    expires_at: Optional[str] = None
+    last_active: Optional[str] = None
+    owner: Optional[str] = None
+    template_bundle: Optional[str] = None
+
+class BatchCreateRequest(BaseModel):
+    count: int
+    ttl_seconds: Optional[int] = None
+
+class BatchDeleteRequest(BaseModel):
+    namespaces: Optional[List[str]] = None
+    label_selector: Optional[str] = None
+
+class BatchItemResult(BaseModel):
+    namespace: str
+    status: str
+    url: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BatchItemResult]
+
+def batch_response(results: List[BatchItemResult]) -> BatchResponse:
+    failed = sum(1 for result in results if result.error)
+    return BatchResponse(succeeded=len(results) - failed, failed=failed, results=results)
+
+def ttl_annotations(ttl_seconds: Optional[int]) -> Optional[dict]:
+    """Expiry annotations for a new workspace, validating a requested TTL"""
+    if ttl_seconds is None:
+        ttl_seconds = PROJECT_TTL_SECONDS
+    elif not 1 <= ttl_seconds <= PROJECT_TTL_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"ttl_seconds must be between 1 and {PROJECT_TTL_MAX_SECONDS}")
+    return expiry_annotations(ttl_seconds) if ttl_seconds > 0 else None
+
+def owner_annotations(annotations: Optional[dict], user: Optional[str]) -> Optional[dict]:
+    """Add the requesting user, if known, to a new workspace's annotations"""
+    if user is None:
+        return annotations
+    return {**(annotations or {}), OWNER_ANNOTATION: user}
+
+async def registry_write(fn, *args) -> None:
+    """Record a lifecycle change in the registry; the reconciler repairs any write that fails"""
+    if not REGISTRY_ENABLED:
+        return
     try:
-        with open(template_path, 'r') as f:
-            return f.read()
-    except FileNotFoundError:
-        logger.error(f"Template file not found at {template_path}")
-        raise HTTPException(status_code=500, detail=f"Template {template_name} not found")
-
-def _create_volume(volume_spec: dict) -> client.V1Volume:
-    """Create a Kubernetes volume from volume specification"""
-    volume_name = volume_spec['name']
-    logger.info(f"Creating volume {volume_name} with spec: {volume_spec}")
-
-    if 'emptyDir' in volume_spec:
-        logger.info(f"Creating emptyDir volume: {volume_name}")
-        return client.V1Volume(
-            name=volume_name,
-            empty_dir=client.V1EmptyDirVolumeSource()
-        )
-    elif 'hostPath' in volume_spec:
-        host_path_spec = volume_spec['hostPath']
-        logger.info(f"Creating hostPath volume: {volume_name} -> {host_path_spec['path']}")
-        return client.V1Volume(
-            name=volume_name,
-            host_path=client.V1HostPathVolumeSource(
-                path=host_path_spec['path'],
-                type=host_path_spec.get('type')
-            )
-        )
-    elif 'configMap' in volume_spec:
-        config_map_spec = volume_spec['configMap']
-        logger.info(f"Creating configMap volume: {volume_name}")
-        return client.V1Volume(
-            name=volume_name,
-            config_map=client.V1ConfigMapVolumeSource(
-                name=config_map_spec['name']
-            )
-        )
-    elif 'secret' in volume_spec:
-        secret_spec = volume_spec['secret']
-        logger.info(f"Creating secret volume: {volume_name}")
-        return client.V1Volume(
-            name=volume_name,
-            secret=client.V1SecretVolumeSource(
-                secret_name=secret_spec['secretName']
-            )
-        )
-    else:
-        # Default to emptyDir if no recognized volume type
-        logger.warning(f"Unknown volume type for {volume_name}, defaulting to emptyDir. Volume spec: {volume_spec}")
-        return client.V1Volume(
-            name=volume_name,
-            empty_dir=client.V1EmptyDirVolumeSource()
-        )
+        await registry.run(fn, *args)
+    except Exception as e:
+        logger.warning(f"Project registry write failed: {e}")
 
-def apply_manifest(namespace: str) -> None:
-    """Apply Kubernetes manifests for a new workspace"""
-    # First apply RBAC resources
-    rbac_template = load_manifest_template("rbac-template.yaml")
-    rbac_yaml = rbac_template.replace("${NAMESPACE}", namespace)
+def update_routes(added: List[str] = (), removed: List[str] = ()) -> None:
+    """Update the gateway's routes now rather than when the informers catch up"""
+    if gateway is not None:
+        gateway.table.add(added)
+        gateway.table.remove(removed)
 
-    # Then apply workspace resources
-    workspace_template = load_manifest_template("workspace-template.yaml")
-    workspace_yaml = workspace_template.replace("${NAMESPACE}", namespace)
+def annotated_expiry(annotations: Optional[dict]) -> Optional[float]:
+    return parse_timestamp((annotations or {}).get(EXPIRES_ANNOTATION))
 
-    # Combine both templates
-    manifest_yaml = rbac_yaml + "\n---\n" + workspace_yaml
+namespace_allocator = NamespaceAllocator()
+# Leases this process a node ID of its own for namespace names
+node_id_lease = NodeIdLease(coordination_v1, namespace_allocator, PROCESS_IDENTITY)
 
-    # Parse and apply each document in the YAML
-    import yaml
-    try:
-        # Parse the YAML documents
-        documents = list(yaml.safe_load_all(manifest_yaml))
-
-        # First pass: Create namespaces
-        for doc in documents:
-            if not doc:  # Skip empty documents
-                continue
-
-            kind = doc.get('kind')
-            if kind == 'Namespace':
-                api_version = doc.get('apiVersion')
-                metadata = doc.get('metadata', {})
-                name = metadata.get('name')
-
-                # Create namespace
-                namespace_obj = client.V1Namespace(
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        labels=metadata.get('labels', {})
-                    )
-                )
-                try:
-                    v1.create_namespace(namespace_obj)
-                    logger.info(f"Created namespace: {name}")
-                except ApiException as e:
-                    if e.status == 409:  # Already exists
-                        logger.info(f"Namespace {name} already exists")
-                    else:
-                        raise
-
-        # Second pass: Create all other resources
-        for doc in documents:
-            if not doc:  # Skip empty documents
-                continue
-
-            kind = doc.get('kind')
-            api_version = doc.get('apiVersion')
-            metadata = doc.get('metadata', {})
-            doc_namespace = metadata.get('namespace', 'default')
-            name = metadata.get('name')
-
-            if kind == 'Namespace':
-                # Skip - already handled in first pass
-                continue
-            elif kind == 'Deployment':
-                # Create deployment
-                logger.info(f"Creating deployment with volumes: {doc['spec']['template']['spec'].get('volumes', [])}")
-                deployment_obj = client.V1Deployment(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        namespace=doc_namespace,
-                        labels=metadata.get('labels', {})
-                    ),
-                    spec=client.V1DeploymentSpec(
-                        replicas=doc['spec']['replicas'],
-                        selector=client.V1LabelSelector(
-                            match_labels=doc['spec']['selector']['matchLabels']
-                        ),
-                        template=client.V1PodTemplateSpec(
-                            metadata=client.V1ObjectMeta(
-                                labels=doc['spec']['template']['metadata']['labels']
-                            ),
-                            spec=client.V1PodSpec(
-                                service_account_name=doc['spec']['template']['spec'].get('serviceAccountName'),
-                                containers=[
-                                    client.V1Container(
-                                        name=container['name'],
-                                        image=container['image'],
-                                        ports=[client.V1ContainerPort(container_port=port['containerPort'])
-                                               for port in container.get('ports', [])],
-                                        env=[client.V1EnvVar(name=env['name'], value=env['value'])
-                                            for env in container.get('env', [])],
-                                        command=container.get('command'),
-                                        volume_mounts=[
-                                            client.V1VolumeMount(
-                                                name=vm['name'],
-                                                mount_path=vm['mountPath']
-                                            ) for vm in container.get('volumeMounts', [])
-                                        ],
-                                        liveness_probe=client.V1Probe(
-                                            http_get=client.V1HTTPGetAction(
-                                                path=container['livenessProbe']['httpGet']['path'],
-                                                port=container['livenessProbe']['httpGet']['port']
-                                            ),
-                                            initial_delay_seconds=container['livenessProbe']['initialDelaySeconds'],
-                                            period_seconds=container['livenessProbe']['periodSeconds']
-                                        ) if 'livenessProbe' in container else None,
-                                        readiness_probe=client.V1Probe(
-                                            http_get=client.V1HTTPGetAction(
-                                                path=container['readinessProbe']['httpGet']['path'],
-                                                port=container['readinessProbe']['httpGet']['port']
-                                            ),
-                                            initial_delay_seconds=container['readinessProbe']['initialDelaySeconds'],
-                                            period_seconds=container['readinessProbe']['periodSeconds']
-                                        ) if 'readinessProbe' in container else None,
-                                        resources=client.V1ResourceRequirements(
-                                            requests=container['resources']['requests'],
-                                            limits=container['resources']['limits']
-                                        ) if 'resources' in container else None
-                                    ) for container in doc['spec']['template']['spec']['containers']
-                                ],
-                                volumes=[
-                                    _create_volume(volume) for volume in doc['spec']['template']['spec'].get('volumes', [])
-                                ]
-                            )
-                        )
-                    )
-                )
-                apps_v1.create_namespaced_deployment(namespace=doc_namespace, body=deployment_obj)
-                logger.info(f"Created deployment: {name} in namespace: {doc_namespace}")
-
-            elif kind == 'Service':
-                # Create service
-                service_obj = client.V1Service(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        namespace=doc_namespace,
-                        labels=metadata.get('labels', {})
-                    ),
-                    spec=client.V1ServiceSpec(
-                        selector=doc['spec']['selector'],
-                        ports=[
-                            client.V1ServicePort(
-                                port=port['port'],
-                                target_port=port['targetPort'],
-                                protocol=port['protocol']
-                            ) for port in doc['spec']['ports']
-                        ],
-                        type=doc['spec']['type']
-                    )
-                )
-                v1.create_namespaced_service(namespace=doc_namespace, body=service_obj)
-                logger.info(f"Created service: {name} in namespace: {doc_namespace}")
-
-            elif kind == 'Ingress':
-                # Create ingress
-                ingress_obj = client.V1Ingress(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        namespace=doc_namespace,
-                        labels=metadata.get('labels', {}),
-                        annotations=metadata.get('annotations', {})
-                    ),
-                    spec=client.V1IngressSpec(
-                        ingress_class_name=doc['spec'].get('ingressClassName'),
-                        rules=[
-                            client.V1IngressRule(
-                                http=client.V1HTTPIngressRuleValue(
-                                    paths=[
-                                        client.V1HTTPIngressPath(
-                                            path=path['path'],
-                                            path_type=path['pathType'],
-                                            backend=client.V1IngressBackend(
-                                                service=client.V1IngressServiceBackend(
-                                                    name=path['backend']['service']['name'],
-                                                    port=client.V1ServiceBackendPort(
-                                                        number=path['backend']['service']['port']['number']
-                                                    )
-                                                )
-                                            )
-                                        ) for path in rule['http']['paths']
-                                    ]
-                                )
-                            ) for rule in doc['spec']['rules']
-                        ]
-                    )
-                )
-                networking_v1.create_namespaced_ingress(namespace=doc_namespace, body=ingress_obj)
-                logger.info(f"Created ingress: {name} in namespace: {doc_namespace}")
-
-            elif kind == 'ServiceAccount':
-                # Create service account
-                sa_obj = client.V1ServiceAccount(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        namespace=doc_namespace,
-                        labels=metadata.get('labels', {})
-                    )
-                )
-                try:
-                    v1.create_namespaced_service_account(namespace=doc_namespace, body=sa_obj)
-                    logger.info(f"Created service account: {name} in namespace: {doc_namespace}")
-                except ApiException as e:
-                    if e.status == 409:  # Already exists
-                        logger.info(f"Service account {name} already exists")
-                    else:
-                        raise
-
-            elif kind == 'Role':
-                # Create role
-                role_obj = client.V1Role(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        namespace=doc_namespace,
-                        labels=metadata.get('labels', {})
-                    ),
-                    rules=[
-                        client.V1PolicyRule(
-                            api_groups=rule.get('apiGroups', []),
-                            resources=rule.get('resources', []),
-                            verbs=rule.get('verbs', [])
-                        ) for rule in doc['rules']
-                    ]
-                )
-                try:
-                    rbac_v1.create_namespaced_role(namespace=doc_namespace, body=role_obj)
-                    logger.info(f"Created role: {name} in namespace: {doc_namespace}")
-                except ApiException as e:
-                    if e.status == 409:  # Already exists
-                        logger.info(f"Role {name} already exists")
-                    else:
-                        raise
-
-            elif kind == 'RoleBinding':
-                # Create role binding
-                rb_obj = client.V1RoleBinding(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        namespace=doc_namespace,
-                        labels=metadata.get('labels', {})
-                    ),
-                    subjects=[
-                        client.V1Subject(
-                            kind=subject.get('kind'),
-                            name=subject.get('name'),
-                            namespace=subject.get('namespace')
-                        ) for subject in doc['subjects']
-                    ],
-                    role_ref=client.V1RoleRef(
-                        api_group=doc['roleRef']['apiGroup'],
-                        kind=doc['roleRef']['kind'],
-                        name=doc['roleRef']['name']
-                    )
-                )
-                try:
-                    rbac_v1.create_namespaced_role_binding(namespace=doc_namespace, body=rb_obj)
-                    logger.info(f"Created role binding: {name} in namespace: {doc_namespace}")
-                except ApiException as e:
-                    if e.status == 409:  # Already exists
-                        logger.info(f"Role binding {name} already exists")
-                    else:
-                        raise
-
-            elif kind == 'ClusterRole':
-                # Create cluster role
-                cr_obj = client.V1ClusterRole(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        labels=metadata.get('labels', {})
-                    ),
-                    rules=[
-                        client.V1PolicyRule(
-                            api_groups=rule.get('apiGroups', []),
-                            resources=rule.get('resources', []),
-                            verbs=rule.get('verbs', [])
-                        ) for rule in doc['rules']
-                    ]
-                )
-                try:
-                    rbac_v1.create_cluster_role(body=cr_obj)
-                    logger.info(f"Created cluster role: {name}")
-                except ApiException as e:
-                    if e.status == 409:  # Already exists
-                        logger.info(f"Cluster role {name} already exists")
-                    else:
-                        raise
-
-            elif kind == 'ClusterRoleBinding':
-                # Create cluster role binding
-                crb_obj = client.V1ClusterRoleBinding(
-                    api_version=api_version,
-                    kind=kind,
-                    metadata=client.V1ObjectMeta(
-                        name=name,
-                        labels=metadata.get('labels', {})
-                    ),
-                    subjects=[
-                        client.V1Subject(
-                            kind=subject.get('kind'),
-                            name=subject.get('name'),
-                            namespace=subject.get('namespace')
-                        ) for subject in doc['subjects']
-                    ],
-                    role_ref=client.V1RoleRef(
-                        api_group=doc['roleRef']['apiGroup'],
-                        kind=doc['roleRef']['kind'],
-                        name=doc['roleRef']['name']
-                    )
-                )
-                try:
-                    rbac_v1.create_cluster_role_binding(body=crb_obj)
-                    logger.info(f"Created cluster role binding: {name}")
-                except ApiException as e:
-                    if e.status == 409:  # Already exists
-                        logger.info(f"Cluster role binding {name} already exists")
-                    else:
-                        raise
-
-        logger.info(f"Applied all manifests for namespace: {namespace}")
-    except Exception as e:
-        logger.error(f"Failed to apply manifests: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to create workspace: {e}")
+def generate_namespace() -> str:
+    """Allocate a namespace name no other create can get"""
+    return namespace_allocator.next()
 
 def get_workspace_status(namespace: str) -> str:
     """Get the status of a workspace deployment"""
-    try:
-        deployment = apps_v1.read_namespaced_deployment(
-            name="vscode-server",
-            namespace=namespace
-        )
-
-        if deployment.status.ready_replicas and deployment.status.ready_replicas > 0:
-            return "ready"
-        elif deployment.status.replicas and deployment.status.replicas > 0:
-            return "starting"
-        else:
-            return "pending"
-    except ApiException:
-        return "unknown"
+    with span("status.read", namespace=namespace) as current:
+        try:
+            deployment = apps_v1.read_namespaced_deployment(
+                name="vscode-server",
+                namespace=namespace
+            )
+            status = deployment_status(deployment)
+        except ApiException:
+            status = "unknown"
+        current.set_attribute("status", status)
+        return status
+
+@app.on_event("startup")
+async def compile_templates():
+    """Parse the manifest templates up front so the first create does not pay for it"""
+    for template_name in MANIFEST_TEMPLATES:
+        template_store.get(template_name)
+
+@app.on_event("startup")
+async def start_project_cache():
+    if PROJECT_CACHE_ENABLED:
+        project_events.bind(asyncio.get_running_loop())
+        project_waiters.bind(asyncio.get_running_loop())
+        project_cache.start()
+        startup_tracker.start()
+
+@app.on_event("startup")
+async def start_registry():
+    if REGISTRY_ENABLED:
+        await registry_reconciler.start()
+
+@app.on_event("startup")
+async def start_gateway():
+    if gateway is not None:
+        await gateway.start()
+
+@app.on_event("startup")
+async def start_warm_pool():
+    warm_pool.start()
+
+@app.on_event("startup")
+async def start_deletion_reconciler():
+    deletion.start()
+
+@app.on_event("startup")
+async def start_admission():
+    # Capacity is measured against the project cache's deployments
+    admission.start(check_capacity=PROJECT_CACHE_ENABLED and ADMISSION_CAPACITY_CHECK)
+
+def start_leader_duties() -> None:
+    """Start the background work only one backend process may do"""
+    deletion.start_sweep()
+    reaper.start()
+    warm_pool.start_refill()
+    if PROJECT_CACHE_ENABLED:
+        idle_scaler.start()
+    if idempotency_store is not None:
+        idempotency_store.start_expiry()
+    startup_tracker.report_phases = True
+
+def stop_leader_duties() -> None:
+    startup_tracker.report_phases = False
+    deletion.stop_sweep()
+    reaper.stop()
+    warm_pool.stop_refill()
+    idle_scaler.stop()
+    if idempotency_store is not None:
+        idempotency_store.stop_expiry()
+
+# Exactly one backend process (worker or replica) holds the leader lease and runs the singleton duties
+leader = LeaderElector(LeaseLock(coordination_v1, LEADER_LEASE_NAME, PROCESS_IDENTITY), start_leader_duties,
+                       stop_leader_duties)
+
+@app.on_event("startup")
+async def start_coordination():
+    await node_id_lease.start()
+    await leader.start()
+
+@app.on_event("shutdown")
+async def stop_project_cache():
+    project_cache.stop()
+    startup_tracker.stop()
+
+@app.on_event("shutdown")
+async def stop_registry():
+    if REGISTRY_ENABLED:
+        registry_reconciler.stop()
+
+@app.on_event("shutdown")
+async def stop_gateway():
+    if gateway is not None:
+        gateway.stop()
+
+@app.on_event("shutdown")
+async def stop_warm_pool():
+    warm_pool.stop()
+
+@app.on_event("shutdown")
+async def stop_deletion_reconciler():
+    deletion.stop()
+
+@app.on_event("shutdown")
+async def stop_admission():
+    admission.stop()
+
+@app.on_event("shutdown")
+async def stop_coordination():
+    # Hand leadership over straight away rather than when the lease expires
+    await leader.stop()
+    await node_id_lease.stop()
 
 @app.get("/")
-async def root():
+async def root(request: Request):
+    # ingress-nginx sends a sleeping workspace's 503s here (custom-http-errors),
+    # rewritten to / and tagged with the workspace's namespace
+    namespace = request.headers.get("X-Namespace")
+    if namespace and request.headers.get("X-Code"):
+        return await wake_page(namespace)
     return {"message": "Roo SaaS Backend API", "version": "1.0.0"}
 
+async def wake_page(namespace: str) -> HTMLResponse:
+    """Wake a sleeping workspace and serve a page that reloads until it is up"""
+    try:
+        status = await idle_scaler.wake(namespace, trigger="ingress")
+    except ApiException as e:
+        logger.error(f"Failed to wake workspace {namespace}: {e}")
+        status = "starting"
+    if status is None:
+        return HTMLResponse("Workspace not found", status_code=404)
+    return HTMLResponse(HOLDING_PAGE.format(namespace=namespace), status_code=503, headers={"Retry-After": "2"})
+
 @app.post("/api/projects", response_model=ProjectResponse)
-async def create_project(request: ProjectRequest = None):
+async def create_project(http_request: Request, response: Response, request: ProjectRequest = None):
     """Create a new workspace project"""
-    namespace = generate_namespace()
-
+    user = admission.owner(http_request.headers)
+    result, replayed = await idempotency.run(
+        f"create:{user}", http_request.headers.get("Idempotency-Key"),
+        request.model_dump() if request else {}, lambda: provision_project(user, request))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def provision_project(user: Optional[str], request: Optional[ProjectRequest]) -> ProjectResponse:
+    """Claim or provision one workspace for create_project"""
+    started = time.monotonic()
+    annotations = owner_annotations(ttl_annotations(request.ttl_seconds if request else None), user)
     try:
-        # Apply Kubernetes manifests
-        apply_manifest(namespace)
+        # Hand out a pre-provisioned workspace when the warm pool has one
+        async with admission.quota(user):
+            claimed = await warm_pool.claim(annotations)
+            if claimed:
+                admission.claimed(claimed[0], user)
+        if claimed:
+            namespace, status = claimed
+            await registry_write(registry.record, [namespace], status, user, annotated_expiry(annotations))
+            update_routes(added=[namespace])
+            CREATE_REQUEST_DURATION.labels(source="pool").observe(time.monotonic() - started)
+            startup_tracker.track(namespace, "pool", started, status)
+            return ProjectResponse(
+                namespace=namespace,
+                url=f"http://localhost/{namespace}/",
+                status=status
+            )
+
+        namespace = generate_namespace()
+
+        # Apply Kubernetes manifests once there is room for them
+        async with admission.admit([namespace], workspace_requests(), owner=user):
+            for attempt in range(1, NAMESPACE_ATTEMPTS + 1):
+                # Recorded only once the Namespace is ours: a colliding name belongs to someone else's row
+                try:
+                    await apply_manifest(
+                        namespace, namespace_annotations=annotations,
+                        on_namespace_created=lambda: registry_write(registry.record, [namespace], "creating", user,
+                                                                    annotated_expiry(annotations)))
+                    break
+                except NamespaceConflict:
+                    if attempt == NAMESPACE_ATTEMPTS:
+                        raise HTTPException(status_code=409, detail="Could not allocate a free namespace")
+                    # Someone else owns that name; the reservation moves to a fresh one
+                    renamed = generate_namespace()
+                    admission.rename(namespace, renamed)
+                    namespace = renamed
+                except Exception:
+                    await registry_write(registry.set_state, [namespace], "failed")
+                    raise
+        update_routes(added=[namespace])
+        CREATE_REQUEST_DURATION.labels(source="provision").observe(time.monotonic() - started)
+        startup_tracker.track(namespace, "provision", started, "creating")
 
         # Return project info
         return ProjectResponse(
@@ -495,75 +426,425 @@ async def create_project(request: ProjectRequest = None):
             url=f"http://localhost/{namespace}/",
             status="creating"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to create project: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/projects:batch", response_model=BatchResponse)
+async def create_projects_batch(http_request: Request, response: Response, request: BatchCreateRequest):
+    """Create several workspace projects, reporting the outcome of each"""
+    if not 1 <= request.count <= BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {BATCH_MAX_SIZE}")
+
+    user = admission.owner(http_request.headers)
+    result, replayed = await idempotency.run(
+        f"batch:{user}", http_request.headers.get("Idempotency-Key"),
+        request.model_dump(), lambda: provision_batch(user, request))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def provision_batch(user: Optional[str], request: BatchCreateRequest) -> BatchResponse:
+    """Claim or provision the workspaces of one create_projects_batch call"""
+    annotations = owner_annotations(ttl_annotations(request.ttl_seconds), user)
+    started = time.monotonic()
+    results = []
+    # Pooled workspaces first, then provision the rest together
+    claims = []
+    async with admission.quota(user, request.count):
+        while len(claims) < request.count:
+            claimed = await warm_pool.claim(annotations)
+            if not claimed:
+                break
+            admission.claimed(claimed[0], user)
+            claims.append(claimed)
+    for namespace, status in claims:
+        await registry_write(registry.record, [namespace], status, user, annotated_expiry(annotations))
+        update_routes(added=[namespace])
+        startup_tracker.track(namespace, "pool", started, status)
+        results.append(BatchItemResult(namespace=namespace, url=f"http://localhost/{namespace}/", status=status))
+
+    namespaces = [generate_namespace() for _ in range(request.count - len(results))]
+    errors = []
+    if namespaces:
+        try:
+            # The rest of the batch is admitted as a whole: it queues until all of it fits
+            async with admission.admit(namespaces, workspace_requests(), owner=user):
+                # Each row is written once its Namespace is created, never over a colliding project's
+                errors = await apply_manifests(
+                    namespaces, annotations,
+                    lambda namespace: registry_write(registry.record, [namespace], "creating", user,
+                                                     annotated_expiry(annotations)))
+        except HTTPException as e:
+            # Nothing claimed yet: let the caller see the 429/503 and its Retry-After
+            if not results:
+                raise
+            errors = [e] * len(namespaces)
+    failed = [namespace for namespace, error in zip(namespaces, errors)
+              if error is not None and not isinstance(error, NamespaceConflict)]
+    if failed:
+        await registry_write(registry.set_state, failed, "failed")
+    update_routes(added=[namespace for namespace, error in zip(namespaces, errors) if error is None])
+    for namespace, error in zip(namespaces, errors):
+        if error is None:
+            startup_tracker.track(namespace, "provision", started, "creating")
+            results.append(BatchItemResult(namespace=namespace, url=f"http://localhost/{namespace}/", status="creating"))
+        else:
+            admission.release(namespace)
+            detail = error.detail if isinstance(error, HTTPException) else str(error)
+            results.append(BatchItemResult(namespace=namespace, status="failed", error=detail))
+
+    batch = batch_response(results)
+    logger.info(f"Batch create of {request.count} projects finished in {time.monotonic() - started:.2f}s "
+                f"({batch.succeeded} succeeded, {batch.failed} failed)")
+    return batch
+
+async def is_workspace(namespace: str) -> Optional[bool]:
+    """True for a roo=true workspace namespace, False for any other namespace, None if it does not exist"""
+    if PROJECT_CACHE_ENABLED and project_cache.is_fresh() and project_cache.namespace(namespace) is not None:
+        return True
+    try:
+        ns = await run_k8s(v1.read_namespace, namespace)
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
+    return (ns.metadata.labels or {}).get("roo") == "true"
+
+@app.delete("/api/projects:batch", response_model=BatchResponse)
+async def delete_projects_batch(request: BatchDeleteRequest):
+    """Queue several workspace projects for deletion, by name or label selector"""
+    if (request.namespaces is None) == (request.label_selector is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of namespaces or label_selector")
+
+    namespaces = request.namespaces
+    if request.label_selector is not None:
+        # Only ever select workspaces, whatever the selector says
+        selector = ",".join(filter(None, ["roo=true", request.label_selector]))
+        try:
+            listed = await run_k8s(v1.list_namespace, label_selector=selector)
+        except ApiException as e:
+            raise HTTPException(status_code=400 if e.status == 400 else 500, detail=f"Failed to list projects: {e.reason}")
+        namespaces = [ns.metadata.name for ns in listed.items]
+    if len(namespaces) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_SIZE} projects can be deleted at once")
+
+    slots = asyncio.Semaphore(BATCH_DELETE_CONCURRENCY)
+
+    async def delete(namespace: str) -> BatchItemResult:
+        async with slots:
+            try:
+                # Selected namespaces are workspaces already; named ones may be anything
+                workspace = True if request.label_selector is not None else await is_workspace(namespace)
+                if workspace is None:
+                    return BatchItemResult(namespace=namespace, status="not_found", error="Project not found")
+                if not workspace:
+                    return BatchItemResult(namespace=namespace, status="forbidden", error="Not a workspace project")
+                await deletion.request(namespace)
+                return BatchItemResult(namespace=namespace, status="deleting")
+            except ApiException as e:
+                if e.status == 404:
+                    return BatchItemResult(namespace=namespace, status="not_found", error="Project not found")
+                return BatchItemResult(namespace=namespace, status="failed", error=str(e.reason))
+            except Exception as e:
+                return BatchItemResult(namespace=namespace, status="failed", error=str(e))
+
+    results = list(await asyncio.gather(*(delete(namespace) for namespace in dict.fromkeys(namespaces))))
+    deleting = [r.namespace for r in results if r.status == "deleting"]
+    await registry_write(registry.set_state, deleting, "deleting")
+    update_routes(removed=deleting)
+    return batch_response(results)
+
+@app.post("/api/projects/{namespace}/wake", response_model=ProjectResponse)
+async def wake_project(namespace: str):
+    """Scale a sleeping workspace back up"""
+    try:
+        status = await idle_scaler.wake(namespace, trigger="api")
+    except ApiException as e:
+        logger.error(f"Failed to wake workspace {namespace}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return ProjectResponse(namespace=namespace, url=f"http://localhost/{namespace}/", status=status)
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/api/projects/stream")
+async def stream_projects():
+    """Stream a project snapshot followed by created/updated/deleted deltas (SSE)"""
+    if not PROJECT_CACHE_ENABLED:
+        raise HTTPException(status_code=503, detail="Project streaming requires the project cache")
+
+    # Subscribe before taking the snapshot so no delta falls in between
+    queue = project_events.subscribe()
+    snapshot = await cluster_projects()
+
+    async def events():
+        try:
+            yield _sse("snapshot", [project.model_dump() for project in snapshot])
+            while True:
+                try:
+                    change = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if change is OVERFLOW:
+                    break
+                kind, namespace, status = change
+                yield _sse(kind, ProjectResponse(
+                    namespace=namespace,
+                    url=f"http://localhost/{namespace}/",
+                    status=status
+                ).model_dump())
+        finally:
+            project_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/api/projects", response_model=List[ProjectResponse])
-async def list_projects():
-    """List all active workspace projects"""
+async def list_projects(response: Response, state: Optional[str] = None, owner: Optional[str] = None,
+                        created_after: Optional[str] = None, created_before: Optional[str] = None,
+                        cursor: Optional[str] = None, limit: Optional[int] = None):
+    """List workspace projects from the registry, optionally filtered and paginated.
+
+    state is a comma-separated list (deleted and failed projects only appear
+    when asked for), created_after/created_before are UTC timestamps such as
+    2024-01-31T12:00:00Z, and a page ends with an X-Next-Cursor header to pass
+    back as cursor. X-Total-Count is the number of matching projects.
+    """
+    if limit is not None and not 1 <= limit <= PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_SIZE_MAX}")
+    bounds = {}
+    for param, value in (("created_after", created_after), ("created_before", created_before)):
+        if value is not None:
+            bounds[param] = parse_timestamp(value)
+            if bounds[param] is None:
+                raise HTTPException(status_code=400, detail=f"{param} must look like 2024-01-31T12:00:00Z")
+
+    if REGISTRY_ENABLED and registry_reconciler.reconciled:
+        try:
+            rows, total, next_cursor = await registry.run(
+                registry.query, state.split(",") if state else None, owner,
+                bounds.get("created_after"), bounds.get("created_before"), cursor, limit)
+        except Exception as e:
+            logger.error(f"Project registry query failed, listing from the cluster: {e}")
+        else:
+            REGISTRY_REQUESTS.labels(result="hit").inc()
+            response.headers["X-Total-Count"] = str(total)
+            if next_cursor is not None:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return [ProjectResponse(namespace=row["namespace"], url=row["url"], status=row["state"]) for row in rows]
+
+    REGISTRY_REQUESTS.labels(result="miss").inc()
+    if any(param is not None for param in (state, owner, created_after, created_before, cursor, limit)):
+        raise HTTPException(status_code=503, detail="Filtering and pagination need the project registry, which is not ready",
+                            headers={"Retry-After": "5"})
+    return await cluster_projects()
+
+async def cluster_projects() -> List[ProjectResponse]:
+    """Every workspace project, from the project cache or the API server"""
+    with span("projects.list") as current:
+        return await _cluster_projects(current)
+
+async def _cluster_projects(current) -> List[ProjectResponse]:
+    if PROJECT_CACHE_ENABLED and project_cache.is_fresh():
+        CACHE_REQUESTS.labels(result="hit").inc()
+        current.set_attribute("source", "cache")
+        return [
+            ProjectResponse(
+                namespace=namespace,
+                url=f"http://localhost/{namespace}/",
+                status=status
+            ) for namespace, status in project_cache.projects()
+        ]
+
+    CACHE_REQUESTS.labels(result="miss").inc()
+    current.set_attribute("source", "api")
     try:
         # Get all namespaces with roo=true label
-        namespaces = v1.list_namespace(label_selector="roo=true")
+        namespaces = await run_k8s(v1.list_namespace, label_selector="roo=true")
 
-        projects = []
-        for ns in namespaces.items:
-            namespace = ns.metadata.name
-            status = get_workspace_status(namespace)
+        # Read the deployments concurrently rather than one after another
+        names = [ns.metadata.name for ns in namespaces.items]
+        statuses = await asyncio.gather(*(run_k8s(get_workspace_status, namespace) for namespace in names))
+        statuses = ["deleting" if is_deleting(ns) else status for ns, status in zip(namespaces.items, statuses)]
 
-            projects.append(ProjectResponse(
+        return [
+            ProjectResponse(
                 namespace=namespace,
                 url=f"http://localhost/{namespace}/",
                 status=status
-            ))
-
-        return projects
+            ) for namespace, status in zip(names, statuses)
+        ]
     except Exception as e:
         logger.error(f"Failed to list projects: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.delete("/api/projects/{namespace}")
-async def delete_project(namespace: str):
-    """Delete a workspace project"""
-    try:
-        # Delete cluster-wide RBAC resources first
-        cluster_role_name = f"workspace-cluster-reader-{namespace}"
-        cluster_role_binding_name = f"workspace-cluster-reader-{namespace}"
+def detail_cached() -> bool:
+    """True when project details can be served from the informers"""
+    return PROJECT_CACHE_ENABLED and project_cache.is_fresh() and startup_tracker.informer.synced.is_set()
 
+async def read_project_detail(namespace: str) -> Optional[dict]:
+    """Detailed status of one workspace, from the informers when they are fresh; None if it does not exist"""
+    with span("status.detail", namespace=namespace) as current:
+        return await _read_project_detail(namespace, current)
+
+async def _read_project_detail(namespace: str, current) -> Optional[dict]:
+    if detail_cached():
+        CACHE_REQUESTS.labels(result="hit").inc()
+        current.set_attribute("source", "cache")
+        ns = project_cache.namespace(namespace)
+        if ns is None:
+            return None
+        return project_detail(ns, project_cache.deployment(namespace), startup_tracker.pod(namespace))
+
+    CACHE_REQUESTS.labels(result="miss").inc()
+    current.set_attribute("source", "api")
+
+    async def read(fn, *args, **kwargs):
         try:
-            rbac_v1.delete_cluster_role(name=cluster_role_name)
-            logger.info(f"Deleted cluster role: {cluster_role_name}")
+            return await run_k8s(fn, *args, **kwargs)
         except ApiException as e:
-            if e.status != 404:  # Ignore if not found
-                logger.warning(f"Failed to delete cluster role {cluster_role_name}: {e}")
-
+            if e.status == 404:
+                return None
+            raise
+
+    ns, deployment, pods = await asyncio.gather(
+        read(v1.read_namespace, namespace),
+        read(apps_v1.read_namespaced_deployment, "vscode-server", namespace),
+        read(v1.list_namespaced_pod, namespace, label_selector="app=vscode-server"),
+    )
+    if ns is None or (ns.metadata.labels or {}).get("roo") != "true":
+        return None
+    created = lambda pod: pod.metadata.creation_timestamp.timestamp() if pod.metadata.creation_timestamp else 0.0  # noqa: E731
+    pod = max(pods.items if pods else [], key=created, default=None)
+    return project_detail(ns, deployment, pod)
+
+@app.get("/api/projects/{namespace}", response_model=ProjectDetail)
+async def get_project(namespace: str, request: Request, response: Response,
+                      wait: Optional[str] = None, timeout: float = 60):
+    """Detailed status of one workspace project.
+
+    Supports If-None-Match, and long-polling with ?wait=ready (until the
+    workspace is ready) or ?wait=change (until its ETag differs from
+    If-None-Match), returning the current state after at most ?timeout= seconds.
+    """
+    if wait not in (None, "ready", "change"):
+        raise HTTPException(status_code=400, detail="wait must be 'ready' or 'change'")
+    if not 0 <= timeout <= PROJECT_WAIT_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"timeout must be between 0 and {PROJECT_WAIT_MAX_SECONDS}")
+
+    if_none_match = request.headers.get("If-None-Match")
+    deadline = time.monotonic() + timeout
+    while True:
         try:
-            rbac_v1.delete_cluster_role_binding(name=cluster_role_binding_name)
-            logger.info(f"Deleted cluster role binding: {cluster_role_binding_name}")
+            detail = await read_project_detail(namespace)
         except ApiException as e:
-            if e.status != 404:  # Ignore if not found
-                logger.warning(f"Failed to delete cluster role binding {cluster_role_binding_name}: {e}")
-
-        # Delete the namespace (this will delete all namespaced resources in it)
-        v1.delete_namespace(name=namespace)
-        logger.info(f"Deleted namespace: {namespace}")
-        return {"message": f"Project {namespace} deleted successfully"}
+            logger.error(f"Failed to read project {namespace}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        if detail is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        etag = detail_etag(detail)
+        if wait == "ready":
+            # A workspace being deleted will never become ready
+            done = detail["status"] in ("ready", "deleting")
+        elif wait == "change":
+            done = not etag_matches(if_none_match, etag)
+        else:
+            done = True
+        remaining = deadline - time.monotonic()
+        if done or remaining <= 0:
+            break
+        interval = PROJECT_WAIT_RECHECK_SECONDS if detail_cached() else PROJECT_WAIT_POLL_SECONDS
+        await project_waiters.wait(namespace, min(remaining, interval))
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return ProjectDetail(**detail)
+
+@app.delete("/api/projects/{namespace}", status_code=202)
+async def delete_project(namespace: str):
+    """Queue a workspace project for deletion"""
+    try:
+        workspace = await is_workspace(namespace)
+        if workspace is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        if not workspace:
+            raise HTTPException(status_code=403, detail="Not a workspace project")
+        await deletion.request(namespace)
+        await registry_write(registry.set_state, [namespace], "deleting")
+        update_routes(removed=[namespace])
+        return {"message": f"Project {namespace} is being deleted", "status": "deleting"}
     except ApiException as e:
         if e.status == 404:
             raise HTTPException(status_code=404, detail="Project not found")
         logger.error(f"Failed to delete project: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/routes")
+async def gateway_routes():
+    """The shared gateway's route table"""
+    if gateway is None:
+        raise HTTPException(status_code=404, detail="Gateway routing is not enabled (ROO_ROUTING_MODE)")
+    version, routes = gateway.table.snapshot()
+    return {"version": version, "routes": routes}
+
+@app.get("/api/routes/{namespace}")
+async def gateway_route(namespace: str):
+    """Where the shared gateway sends a workspace's requests; called by its auth_request"""
+    if gateway is None:
+        raise HTTPException(status_code=404, detail="Gateway routing is not enabled (ROO_ROUTING_MODE)")
+    route = gateway.table.lookup(namespace)
+    if route is None:
+        # auth_request only passes 2xx, 401 and 403 through; the gateway turns this into a 404
+        raise HTTPException(status_code=403, detail="Workspace not found")
+    return Response(headers={"X-Roo-Upstream": route})
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
         # Test Kubernetes connectivity
-        v1.list_namespace(limit=1)
-        return {"status": "healthy", "kubernetes": "connected"}
+        await run_k8s(v1.list_namespace, limit=1)
+        return {"status": "healthy", "kubernetes": "connected", "worker": os.getpid(), "leader": leader.is_leader}
     except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}
+        return {"status": "unhealthy", "error": str(e), "worker": os.getpid()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(content=exposition(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(http_request: Request, profile_id: str):
+    """A request profile as folded stacks, ready for flamegraph.pl, inferno or speedscope"""
+    # Profiles show what other requests were doing, so they are as private as starting one
+    profile = profiler.get(profile_id) if profiler.authorized(http_request.headers.get("X-Roo-Profile")) else None
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile["folded"], headers={
+        "X-Roo-Profile-Request": profile["label"],
+        "X-Roo-Profile-Duration-Ms": str(profile["duration_ms"]),
+    })
 
 if __name__ == "__main__":
+    import tempfile
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    host = os.environ.get("BACKEND_HOST", "0.0.0.0")
+    port = int(os.environ.get("BACKEND_PORT", "5000"))
+    log_level = os.environ.get("BACKEND_LOG_LEVEL", "info")
+    if BACKEND_WORKERS > 1:
+        # Workers are separate processes: their counters and histograms meet in this directory
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="roo-metrics-"))
+        uvicorn.run("main:app", host=host, port=port, workers=BACKEND_WORKERS, log_level=log_level)
+    else:
+        uvicorn.run(app, host=host, port=port, log_level=log_level)
@@ -0,0 +1,253 @@
+"""Prometheus metrics exported on /metrics.
+
+With several worker processes (BACKEND_WORKERS > 1), main.py points
+PROMETHEUS_MULTIPROC_DIR at a fresh directory before starting them, so
+counters and histograms are summed over every worker. Gauges are computed from
+in-process state by callbacks, which cannot be shared, so they describe the
+worker that serves the scrape.
+"""
+import os
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+CACHE_REQUESTS = Counter(
+    "roo_project_cache_requests_total",
+    "Project list requests, by whether the in-memory cache could serve them",
+    ["result"],
+)
+CACHE_OBJECTS = Gauge(
+    "roo_project_cache_objects",
+    "Objects currently held by each informer",
+    ["resource"],
+)
+CACHE_STALENESS = Gauge(
+    "roo_project_cache_staleness_seconds",
+    "Seconds since each informer's watch was last confirmed healthy",
+    ["resource"],
+)
+CACHE_RESYNCS = Counter(
+    "roo_project_cache_resyncs_total",
+    "Full relists performed by each informer (startup and expired watches)",
+    ["resource"],
+)
+CACHE_WATCH_ERRORS = Counter(
+    "roo_project_cache_watch_errors_total",
+    "Watch streams that ended with an error",
+    ["resource"],
+)
+STREAM_SUBSCRIBERS = Gauge(
+    "roo_project_stream_subscribers",
+    "Clients connected to /api/projects/stream",
+)
+STREAM_DROPPED = Counter(
+    "roo_project_stream_dropped_total",
+    "Stream subscribers disconnected for falling behind",
+)
+RESOURCE_CREATE_DURATION = Histogram(
+    "roo_resource_create_seconds",
+    "Time to create one workspace resource, including waiting for a pool slot",
+    ["kind"],
+)
+PROVISION_DURATION = Histogram(
+    "roo_provision_seconds",
+    "Time to apply every manifest for one workspace",
+)
+POOL_SIZE = Gauge(
+    "roo_warm_pool_size",
+    "Unclaimed pooled workspaces, by readiness",
+    ["state"],
+)
+POOL_REFILL_BACKLOG = Gauge(
+    "roo_warm_pool_refill_backlog",
+    "Pooled workspaces still needed to reach the target pool size",
+)
+POOL_CLAIMS = Counter(
+    "roo_warm_pool_claims_total",
+    "Project creates, by whether a pooled workspace was available",
+    ["result"],
+)
+POOL_CLAIM_DURATION = Histogram(
+    "roo_warm_pool_claim_seconds",
+    "Time to claim a pooled workspace",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+CREATE_REQUEST_DURATION = Histogram(
+    "roo_create_request_seconds",
+    "POST /api/projects latency, by where the workspace came from",
+    ["source"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+STARTUP_PHASE_DURATION = Histogram(
+    "roo_workspace_startup_phase_seconds",
+    "Time spent in each workspace startup phase, as reported by the pod entrypoint",
+    ["phase"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+TIME_TO_READY = Histogram(
+    "roo_workspace_time_to_ready_seconds",
+    "Time from a create request until its workspace reports ready",
+    ["source"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+DELETION_QUEUE = Gauge(
+    "roo_deletion_queue_depth",
+    "Workspace deletions queued or waiting to be retried",
+)
+DELETION_ATTEMPTS = Counter(
+    "roo_deletion_attempts_total",
+    "Workspace teardown attempts, by outcome",
+    ["result"],
+)
+DELETION_DURATION = Histogram(
+    "roo_deletion_seconds",
+    "Time from a delete request until the workspace's objects were deleted",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+ORPHANS_COLLECTED = Counter(
+    "roo_rbac_orphans_collected_total",
+    "Cluster-scoped workspace RBAC objects deleted because their namespace was gone",
+    ["kind"],
+)
+TTL_TRACKED = Gauge(
+    "roo_ttl_tracked_projects",
+    "Workspaces with a pending expiry deadline",
+)
+TTL_REAPED = Counter(
+    "roo_ttl_reaped_total",
+    "Workspaces deleted because their TTL expired",
+)
+TTL_RECLAIMED_CPU = Counter(
+    "roo_ttl_reclaimed_cpu_cores_total",
+    "CPU requests (cores) freed by deleting expired workspaces",
+)
+TTL_RECLAIMED_MEMORY = Counter(
+    "roo_ttl_reclaimed_memory_bytes_total",
+    "Memory requests (bytes) freed by deleting expired workspaces",
+)
+IDLE_SCALE_DOWNS = Counter(
+    "roo_idle_scale_downs_total",
+    "Workspaces scaled to zero after going idle",
+)
+IDLE_WAKES = Counter(
+    "roo_idle_wakes_total",
+    "Sleeping workspaces scaled back up, by what woke them",
+    ["trigger"],
+)
+IDLE_SLEEPING = Gauge(
+    "roo_idle_sleeping_workspaces",
+    "Workspaces currently scaled to zero",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "roo_admission_queue_depth",
+    "Project create requests waiting for an in-flight slot or cluster capacity",
+)
+ADMISSION_INFLIGHT = Gauge(
+    "roo_admission_inflight_projects",
+    "Admitted workspaces currently being provisioned",
+)
+ADMISSION_DECISIONS = Counter(
+    "roo_admission_decisions_total",
+    "Admission decisions for new workspaces: admitted, or the reason they were rejected",
+    ["result"],
+)
+ADMISSION_WAIT = Histogram(
+    "roo_admission_wait_seconds",
+    "Time admitted create requests spent queued",
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+CLUSTER_CAPACITY = Gauge(
+    "roo_cluster_capacity",
+    "Cluster CPU (cores) and memory (bytes): schedulable allocatable, requested, and reserved for admitted creates",
+    ["resource", "state"],
+)
+REGISTRY_PROJECTS = Gauge(
+    "roo_registry_projects",
+    "Live projects recorded in the project registry",
+)
+REGISTRY_RECONCILES = Counter(
+    "roo_registry_reconciles_total",
+    "Full passes reconciling the project registry with the cluster",
+)
+REGISTRY_REQUESTS = Counter(
+    "roo_registry_requests_total",
+    "GET /api/projects requests served from the project registry (hit) or the cluster (miss)",
+    ["result"],
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "roo_idempotent_replays_total",
+    "Create requests answered from an earlier request with the same Idempotency-Key",
+    ["state"],
+)
+NAMESPACE_COLLISIONS = Counter(
+    "roo_namespace_collisions_total",
+    "Freshly allocated namespace names that already existed in the cluster",
+)
+GATEWAY_ROUTES = Gauge(
+    "roo_gateway_routes",
+    "Workspaces in the shared gateway's route table",
+)
+GATEWAY_ROUTE_LOOKUPS = Counter(
+    "roo_gateway_route_lookups_total",
+    "Route lookups from the shared gateway, by whether the workspace was found",
+    ["result"],
+)
+GATEWAY_ROUTE_UPDATES = Counter(
+    "roo_gateway_route_updates_total",
+    "Changes applied to the shared gateway's route table",
+    ["change"],
+)
+K8S_API_REQUESTS = Counter(
+    "roo_k8s_api_requests_total",
+    "Kubernetes API request attempts by verb, resource and status code (error: no response)",
+    ["verb", "resource", "code"],
+)
+K8S_API_DURATION = Histogram(
+    "roo_k8s_api_request_seconds",
+    "Kubernetes API request latency per attempt; for watches, the time to the response headers",
+    ["verb", "resource"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+K8S_API_RETRIES = Counter(
+    "roo_k8s_api_retries_total",
+    "Kubernetes API requests retried, by verb and the status code or connection error that caused it",
+    ["verb", "reason"],
+)
+K8S_RATE_LIMIT_WAIT = Histogram(
+    "roo_k8s_rate_limit_wait_seconds",
+    "Time Kubernetes API requests waited for the client-side rate limiter",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LEADER_TRANSITIONS = Counter(
+    "roo_leader_transitions_total",
+    "Times this backend started or stopped holding a coordination lease",
+    ["lease", "event"],
+)
+
+
+class _WorkerGauges:
+    """The serving process's gauges, for a multiprocess registry"""
+
+    def collect(self):
+        return (family for family in REGISTRY.collect() if family.type == "gauge")
+
+
+class _SharedCounters:
+    """Counters and histograms summed over every worker process"""
+
+    def __init__(self, path: str):
+        self.collector = MultiProcessCollector(None, path)
+
+    def collect(self):
+        return (family for family in self.collector.collect() if family.type != "gauge")
+
+
+def exposition() -> bytes:
+    """The /metrics payload, across all worker processes when there are several"""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return generate_latest()
+    registry = CollectorRegistry()
+    registry.register(_SharedCounters(path))
+    registry.register(_WorkerGauges())
+    return generate_latest(registry)
@@ -0,0 +1,60 @@
+"""Collision-free workspace namespace names.
+
+Names are Snowflake-style IDs: milliseconds since NAMESPACE_EPOCH, a node ID
+and a per-millisecond sequence packed into 63 bits, written as 13 base-36
+digits after the ``proj-`` prefix. One allocator never repeats a name, even if
+the clock steps back, and allocators with different node IDs (ROO_NODE_ID, or
+one leased per process by coordination.NodeIdLease, random until then) never
+produce the same name, so no API round trip is needed to claim one.
+Fixed-width names also sort by creation time.
+"""
+import os
+import time
+import random
+import threading
+
+NAMESPACE_PREFIX = "proj-"
+# 2024-01-01T00:00:00Z in milliseconds; 41 bits of milliseconds last until 2093
+NAMESPACE_EPOCH_MS = 1704067200000
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+NAME_DIGITS = 13
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _base36(value: int, width: int) -> str:
+    digits = []
+    while value:
+        value, digit = divmod(value, 36)
+        digits.append(ALPHABET[digit])
+    return "".join(reversed(digits)).rjust(width, "0")
+
+
+class NamespaceAllocator:
+    """Thread-safe generator of unique namespace names"""
+
+    def __init__(self, prefix: str = NAMESPACE_PREFIX, node_id: int = None):
+        if node_id is None:
+            node_id = int(os.environ.get("ROO_NODE_ID", random.getrandbits(NODE_BITS)))
+        if not 0 <= node_id < 2 ** NODE_BITS:
+            raise ValueError(f"node id must be between 0 and {2 ** NODE_BITS - 1}")
+        self.prefix = prefix
+        self.node_id = node_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next(self) -> str:
+        with self._lock:
+            # Never move backwards, so a clock step cannot repeat an earlier ID
+            now = max(int(time.time() * 1000) - NAMESPACE_EPOCH_MS, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) % (2 ** SEQUENCE_BITS)
+                if self._sequence == 0:
+                    # 4096 names this millisecond: borrow the next one
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            value = (now << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+        return f"{self.prefix}{_base36(value, NAME_DIGITS)}"
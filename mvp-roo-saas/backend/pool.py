@@ -0,0 +1,191 @@
+"""Warm pool of pre-provisioned workspaces.
+
+The pool keeps WARM_POOL_SIZE namespaces fully provisioned but labeled
+``roo-pool=true`` instead of ``roo=true``, so they are invisible to listings.
+A create claims one by relabeling it, guarded by a resourceVersion
+precondition so two claimers can never get the same namespace. A background
+task refills the pool, at most WARM_POOL_REFILL_PER_MINUTE namespaces a minute.
+
+Every backend process claims from the pool, but only the elected leader
+refills it (``start_refill``), so replicas do not overshoot the target size.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Set
+
+from kubernetes.client.rest import ApiException
+
+from cache import Informer, deployment_status
+from k8s import run_k8s
+from metrics import POOL_CLAIM_DURATION, POOL_CLAIMS, POOL_REFILL_BACKLOG, POOL_SIZE
+from provision import apply_manifest
+
+logger = logging.getLogger(__name__)
+
+WARM_POOL_SIZE = int(os.environ.get("WARM_POOL_SIZE", "0"))
+WARM_POOL_REFILL_PER_MINUTE = float(os.environ.get("WARM_POOL_REFILL_PER_MINUTE", "6"))
+
+POOL_LABEL = "roo-pool"
+POOL_NAMESPACE_LABELS = {POOL_LABEL: "true", "created-by": "roo-saas"}
+
+
+class WarmPool:
+    """Keeps a target number of unclaimed workspaces provisioned and hands them out"""
+
+    def __init__(self, v1, project_cache, new_namespace: Callable[[], str],
+                 size: int = WARM_POOL_SIZE, refill_per_minute: float = WARM_POOL_REFILL_PER_MINUTE):
+        self.v1 = v1
+        self.project_cache = project_cache
+        self.new_namespace = new_namespace
+        self.size = size
+        self.refill_interval = 60.0 / refill_per_minute if refill_per_minute > 0 else 0.0
+        self.namespaces: Dict[str, object] = {}
+        self.provisioning: Set[str] = set()
+        self.claiming: Set[str] = set()
+        self.informer = Informer("pool-namespaces", v1.list_namespace, self._reset, self._event,
+                                 label_selector=f"{POOL_LABEL}=true")
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._provision_tasks: Set[asyncio.Task] = set()
+        POOL_SIZE.labels(state="ready").set_function(lambda: self._count("ready"))
+        POOL_SIZE.labels(state="starting").set_function(lambda: len(self.available()) - self._count("ready"))
+        POOL_SIZE.labels(state="provisioning").set_function(lambda: len(self.provisioning))
+        POOL_REFILL_BACKLOG.set_function(self.backlog)
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        self._wakeup = asyncio.Event()
+        self.informer.start()
+
+    def stop(self) -> None:
+        self.informer.stop()
+        self.stop_refill()
+
+    def start_refill(self) -> None:
+        """Keep the pool topped up; one process in the deployment does this"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._refill_loop())
+        logger.info(f"Warm pool enabled: size {self.size}, refill every {self.refill_interval:.1f}s at most")
+
+    def stop_refill(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def available(self):
+        """Pooled namespaces that are neither terminating nor being claimed"""
+        return [
+            name for name, ns in list(self.namespaces.items())
+            if name not in self.claiming and not (ns.status and ns.status.phase == "Terminating")
+        ]
+
+    def backlog(self) -> int:
+        return max(0, self.size - len(self.available()) - len(self.provisioning))
+
+    def _status(self, name: str) -> str:
+        return deployment_status(self.project_cache.deployment(name))
+
+    def _count(self, status: str) -> int:
+        return sum(1 for name in self.available() if self._status(name) == status)
+
+    async def claim(self, annotations: Optional[Dict[str, str]] = None) -> Optional[tuple]:
+        """Claim a pooled workspace, returning (namespace, status), or None if the pool is empty.
+
+        annotations are added to the namespace as part of the claim.
+        """
+        if not self.enabled or not self.informer.synced.is_set():
+            return None
+
+        start = time.perf_counter()
+        # Ready workspaces first; a starting one still beats provisioning from scratch
+        candidates = sorted(self.available(), key=lambda name: self._status(name) != "ready")
+        for name in candidates:
+            ns = self.namespaces.get(name)
+            if ns is None or name in self.claiming:
+                continue
+            self.claiming.add(name)
+            try:
+                await run_k8s(self.v1.patch_namespace, name, {
+                    "metadata": {
+                        # Precondition: fails with 409 if anyone touched it since we saw it
+                        "resourceVersion": ns.metadata.resource_version,
+                        "labels": {"roo": "true", POOL_LABEL: None},
+                        "annotations": {
+                            "roo.io/claimed-at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                            **(annotations or {}),
+                        },
+                    }
+                })
+            except ApiException as e:
+                self.claiming.discard(name)
+                if e.status in (404, 409):  # Claimed or deleted elsewhere; try the next one
+                    continue
+                logger.warning(f"Failed to claim pooled namespace {name}: {e}")
+                break
+            self.namespaces.pop(name, None)
+            self.claiming.discard(name)
+            self._wakeup.set()
+            status = self._status(name)
+            POOL_CLAIMS.labels(result="hit").inc()
+            POOL_CLAIM_DURATION.observe(time.perf_counter() - start)
+            logger.info(f"Claimed pooled namespace {name} ({status})")
+            return name, status
+
+        POOL_CLAIMS.labels(result="miss").inc()
+        return None
+
+    async def _refill_loop(self) -> None:
+        last_refill = 0.0
+        while True:
+            try:
+                if self.informer.synced.is_set() and self.backlog() > 0:
+                    wait = last_refill + self.refill_interval - time.monotonic()
+                    if wait <= 0:
+                        last_refill = time.monotonic()
+                        namespace = self.new_namespace()
+                        self.provisioning.add(namespace)
+                        task = asyncio.create_task(self._provision(namespace))
+                        self._provision_tasks.add(task)
+                        task.add_done_callback(self._provision_tasks.discard)
+                        continue
+                    await asyncio.sleep(wait)
+                    continue
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Warm pool refill loop failed: {e}")
+                await asyncio.sleep(5)
+
+    async def _provision(self, namespace: str) -> None:
+        try:
+            await apply_manifest(namespace, namespace_labels=POOL_NAMESPACE_LABELS)
+            logger.info(f"Provisioned pooled namespace {namespace}")
+        except Exception as e:
+            # On success it stays "provisioning" until the informer sees it
+            self.provisioning.discard(namespace)
+            logger.error(f"Failed to provision pooled namespace {namespace}: {e}")
+
+    def _reset(self, items) -> None:
+        self.namespaces = {ns.metadata.name: ns for ns in items}
+        self.provisioning.difference_update(self.namespaces)
+
+    def _event(self, event_type: str, ns) -> None:
+        if event_type == 'DELETED':
+            self.namespaces.pop(ns.metadata.name, None)
+        else:
+            self.namespaces[ns.metadata.name] = ns
+            self.provisioning.discard(ns.metadata.name)
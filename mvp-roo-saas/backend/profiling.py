@@ -0,0 +1,172 @@
+"""Opt-in sampling profiler for single requests.
+
+Off unless PROFILING_ENABLED is set. A request sent with ``X-Roo-Profile: 1`` (or the value of PROFILE_TOKEN, when
+set) is profiled while it runs: a background thread samples the Python stacks
+of the event loop thread and of the k8s threads that are running a call every
+PROFILE_INTERVAL_MS. The response carries an ``X-Roo-Profile`` header with the
+path of the result, served from ``GET /debug/profiles/{id}`` in the folded
+stack format that flamegraph.pl, inferno and speedscope read. With
+PROFILE_TOKEN set, fetching a profile also needs the token in X-Roo-Profile.
+
+The loop thread is shared, so a profile also shows whatever other requests
+were doing at the time; the loop's idle time shows up as ``select``. One
+request per process is profiled at a time, and nothing is sampled unless asked
+for. Profiles are files in PROFILE_DIR, so any worker process can serve them.
+"""
+import os
+import re
+import hmac
+import sys
+import json
+import tempfile
+import threading
+import time
+import uuid
+import logging
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+# When set, the X-Roo-Profile header must carry this value, to start a profile and to read one
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+# Sampling stops after this long even if the request has not finished
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+# Finished profiles kept for download, shared by the worker processes
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "roo-profiles"))
+PROFILE_KEEP = 20
+PROFILE_ID_RE = re.compile(r"^[0-9a-f]{16}$")
+# Threads of the k8s executor (k8s.py), sampled while they run a call
+EXECUTOR_THREAD_PREFIX = "k8s"
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> list:
+    """The code objects on a thread's stack, outermost call first"""
+    stack = []
+    while frame is not None:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _running_work_item(stack) -> bool:
+    """True when an executor thread is inside a submitted call rather than waiting for one"""
+    return any(code.co_name == "run" and code.co_filename.endswith(os.path.join("futures", "thread.py"))
+               for code in stack)
+
+
+class Profile:
+    """Folded stack counts collected by one sampling run"""
+
+    def __init__(self, profile_id: str, label: str):
+        self.id = profile_id
+        self.label = label
+        self.samples: Counter = Counter()
+        self.started = time.monotonic()
+        self.duration = 0.0
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+
+    def folded(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+class RequestProfiler:
+    """Samples the loop and k8s threads while a profiled request runs, one request at a time"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.directory = PROFILE_DIR
+        self._active: Optional[Profile] = None
+        self._lock = threading.Lock()
+
+    def authorized(self, header: Optional[str]) -> bool:
+        """Whether an X-Roo-Profile header may start or read profiles"""
+        if not PROFILING_ENABLED:
+            return False
+        return hmac.compare_digest((header or "").encode(), PROFILE_TOKEN.encode()) if PROFILE_TOKEN else True
+
+    def requested(self, header: Optional[str]) -> bool:
+        """Whether a request's X-Roo-Profile header asks for a profile it may have"""
+        if not header or not self.authorized(header):
+            return False
+        return bool(PROFILE_TOKEN) or header.lower() in ("1", "true")
+
+    def start(self, label: str) -> Optional[Profile]:
+        """Begin sampling on behalf of the calling (loop) thread; None if another profile is running"""
+        with self._lock:
+            if self._active is not None and not self._active.finished.is_set():
+                return None
+            profile = self._active = Profile(uuid.uuid4().hex[:16], label)
+        threading.Thread(target=self._sample, args=(profile, threading.get_ident()),
+                         name="request-profiler", daemon=True).start()
+        return profile
+
+    def stop(self, profile: Profile) -> None:
+        """End sampling and wait for the sampler to file the profile, which takes at most one interval.
+
+        Blocks; call it off the event loop.
+        """
+        profile.stopped.set()
+        profile.finished.wait(1.0)
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        """A finished profile: its request label, duration_ms and folded stacks"""
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, profile: Profile) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{profile.id}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"label": profile.label, "duration_ms": round(profile.duration * 1000),
+                       "folded": profile.folded()}, f)
+        os.replace(f"{path}.tmp", path)
+        saved = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+                       key=lambda entry: entry.stat().st_mtime)
+        for entry in saved[:-PROFILE_KEEP]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def _sample(self, profile: Profile, loop_thread: int) -> None:
+        deadline = profile.started + self.max_seconds
+        while not profile.stopped.wait(self.interval) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                name = names.get(ident, str(ident))
+                if ident != loop_thread and not name.startswith(EXECUTOR_THREAD_PREFIX):
+                    continue
+                stack = _stack(frame)
+                if ident != loop_thread:
+                    if not _running_work_item(stack):
+                        continue
+                    name = "k8s executor"
+                else:
+                    name = "event loop"
+                profile.samples[";".join([name] + [_frame_name(code) for code in stack])] += 1
+            del frames
+        profile.duration = time.monotonic() - profile.started
+        try:
+            self._save(profile)
+        except OSError as e:
+            logger.warning(f"Failed to save profile {profile.id}: {e}")
+        profile.finished.set()
+        logger.info(f"Profiled {profile.label}: {sum(profile.samples.values())} samples "
+                    f"over {profile.duration * 1000:.0f}ms, profile {profile.id}")
@@ -0,0 +1,317 @@
+"""Workspace provisioning: render the manifests and create them in dependency order.
+
+Resources are created as a small dependency graph rather than one after the
+other. Each create starts as soon as the kinds it depends on exist, so a
+project costs roughly the critical path (Namespace -> ServiceAccount ->
+Deployment) in API round trips instead of the sum of all of them.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from kubernetes.client.rest import ApiException
+
+from apiclient import is_transient
+from k8s import v1, apps_v1, networking_v1, rbac_v1, apply_slots, run_k8s
+from metrics import NAMESPACE_COLLISIONS, PROVISION_DURATION, RESOURCE_CREATE_DURATION
+from templates import CompiledTemplate, TemplateStore, resolve_template_path
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Manifest templates are compiled once and reloaded only when the file changes
+MANIFEST_TEMPLATES = ["rbac-template.yaml", "workspace-template.yaml"]
+# Workspace template bundles (scripts/build-template-bundle.sh) live on every
+# node under this directory, one read-only directory per content hash
+TEMPLATE_BUNDLE_ROOT = "/opt/roo-templates"
+# Written by the build script next to the manifests; TEMPLATE_BUNDLE overrides it
+TEMPLATE_BUNDLE_FILE = "template-bundle.version"
+TEMPLATE_BUNDLE_ANNOTATION = "roo.io/template-bundle"
+# Where workspaces without a bundle find the raw template, if their image has none
+LEGACY_TEMPLATE_PATH = "/opt/workspace-template"
+
+
+def template_bundle() -> str:
+    """The template bundle new workspaces mount, or "none" for the image's own template"""
+    version = os.environ.get("TEMPLATE_BUNDLE")
+    if not version:
+        try:
+            with open(resolve_template_path(TEMPLATE_BUNDLE_FILE)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            version = ""
+    version = version or "none"
+    if version != "none" and not re.fullmatch(r"[0-9a-f]{12,64}", version):
+        raise ValueError(f"Template bundle version must be a hex content hash, not {version!r}")
+    return version
+
+
+TEMPLATE_BUNDLE = template_bundle()
+
+# Template parameters shared by every workspace, alongside its ${NAMESPACE}
+TEMPLATE_PARAMETERS = {
+    # How the cluster reaches this backend, for waking idle workspaces
+    "WAKER_HOST": os.environ.get("WORKSPACE_WAKER_HOST", "backend"),
+    # Recorded on the project and checked by the entrypoint against the mount
+    "TEMPLATE_BUNDLE": TEMPLATE_BUNDLE,
+    "TEMPLATE_PATH": (f"{TEMPLATE_BUNDLE_ROOT}/{TEMPLATE_BUNDLE}" if TEMPLATE_BUNDLE != "none"
+                      else LEGACY_TEMPLATE_PATH),
+}
+template_store = TemplateStore(parameters=("NAMESPACE", *TEMPLATE_PARAMETERS))
+
+# "ingress": one regex Ingress per workspace. "gateway": the shared gateway
+# (gateway.py) routes every workspace, so their Ingresses are left out
+ROUTING_MODES = ("ingress", "gateway")
+ROUTING_MODE = os.environ.get("ROO_ROUTING_MODE", "ingress")
+if ROUTING_MODE not in ROUTING_MODES:
+    raise ValueError(f"ROO_ROUTING_MODE must be one of {', '.join(ROUTING_MODES)}, not {ROUTING_MODE!r}")
+# Documents carrying this label are only created in the routing mode it names
+ROUTING_LABEL = "roo.io/routing"
+
+# Retry-After sent when creates fail on API errors that outlasted the client's retries
+TRANSIENT_RETRY_AFTER = 5
+
+# Workspaces provisioned at once by a batch; their creates still share apply_slots
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "16"))
+
+# kind -> (create call, whether a 409 already-exists is tolerated). Names are
+# freshly allocated, so a Namespace that already exists belongs to someone else
+RESOURCE_CREATORS = {
+    'Namespace': (lambda ns, body: v1.create_namespace(body=body), False),
+    'ServiceAccount': (lambda ns, body: v1.create_namespaced_service_account(namespace=ns, body=body), True),
+    'Role': (lambda ns, body: rbac_v1.create_namespaced_role(namespace=ns, body=body), True),
+    'RoleBinding': (lambda ns, body: rbac_v1.create_namespaced_role_binding(namespace=ns, body=body), True),
+    'ClusterRole': (lambda ns, body: rbac_v1.create_cluster_role(body=body), True),
+    'ClusterRoleBinding': (lambda ns, body: rbac_v1.create_cluster_role_binding(body=body), True),
+    'PersistentVolumeClaim': (lambda ns, body: v1.create_namespaced_persistent_volume_claim(namespace=ns, body=body), False),
+    'Deployment': (lambda ns, body: apps_v1.create_namespaced_deployment(namespace=ns, body=body), False),
+    'Service': (lambda ns, body: v1.create_namespaced_service(namespace=ns, body=body), False),
+    'Ingress': (lambda ns, body: networking_v1.create_namespaced_ingress(namespace=ns, body=body), False),
+    'ConfigMap': (lambda ns, body: v1.create_namespaced_config_map(namespace=ns, body=body), False),
+}
+
+# kind -> kinds that must exist before it is created. Bindings only reference
+# their role and subjects by name, so they need nothing but the namespace; the
+# Deployment waits for its ServiceAccount so the first pod is not rejected,
+# and for its volume claim so the pod is not left unschedulable.
+RESOURCE_DEPENDENCIES = {
+    'Namespace': (),
+    'ClusterRole': (),
+    'ClusterRoleBinding': (),
+    'ServiceAccount': ('Namespace',),
+    'Role': ('Namespace',),
+    'RoleBinding': ('Namespace',),
+    'Service': ('Namespace',),
+    'Ingress': ('Namespace',),
+    'ConfigMap': ('Namespace',),
+    'PersistentVolumeClaim': ('Namespace',),
+    'Deployment': ('Namespace', 'ServiceAccount', 'PersistentVolumeClaim'),
+}
+
+
+class NamespaceConflict(Exception):
+    """The namespace a new workspace was to be created in already exists"""
+
+    def __init__(self, namespace: str):
+        super().__init__(f"Namespace {namespace} already exists")
+        self.namespace = namespace
+
+
+def compiled_templates() -> List[CompiledTemplate]:
+    """The current compiled manifest templates, in apply order"""
+    try:
+        return [template_store.get(template_name) for template_name in MANIFEST_TEMPLATES]
+    except FileNotFoundError as e:
+        logger.error(f"Template file not found: {e}")
+        raise HTTPException(status_code=500, detail=f"Template {e.filename} not found")
+
+
+def routed(doc: dict) -> bool:
+    """False for documents that belong to the other routing mode"""
+    mode = ((doc.get('metadata') or {}).get('labels') or {}).get(ROUTING_LABEL)
+    return mode is None or mode == ROUTING_MODE
+
+
+def render_manifests(namespace: str, namespace_labels: Optional[Dict[str, str]] = None,
+                     templates: Optional[Sequence[CompiledTemplate]] = None,
+                     namespace_annotations: Optional[Dict[str, str]] = None) -> List[dict]:
+    """Render the workspace manifests for a namespace from the compiled templates.
+
+    namespace_labels, when given, replaces the labels on the Namespace document,
+    and namespace_annotations are added to its annotations. templates pins the
+    compiled templates to use, so a batch renders every workspace from the
+    same version.
+    """
+    if templates is None:
+        templates = compiled_templates()
+    params = {**TEMPLATE_PARAMETERS, "NAMESPACE": namespace}
+    with span("manifests.render", namespace=namespace) as current:
+        documents = [doc for template in templates for doc in template.render(params) if routed(doc)]
+        current.set_attribute("documents", len(documents))
+
+    if namespace_labels is None and not namespace_annotations:
+        return documents
+
+    def customize(doc: dict) -> dict:
+        # Rendered documents share structure with the template, so copy before changing
+        metadata = dict(doc['metadata'])
+        if namespace_labels is not None:
+            metadata['labels'] = namespace_labels
+        if namespace_annotations:
+            metadata['annotations'] = {**(metadata.get('annotations') or {}), **namespace_annotations}
+        return dict(doc, metadata=metadata)
+
+    return [customize(doc) if doc.get('kind') == 'Namespace' else doc for doc in documents]
+
+
+def _create_resource(doc: dict) -> None:
+    """Create a single rendered manifest document"""
+    kind = doc.get('kind')
+    metadata = doc.get('metadata', {})
+    name = metadata.get('name')
+    doc_namespace = metadata.get('namespace', 'default')
+
+    if kind not in RESOURCE_CREATORS:
+        logger.warning(f"Skipping unsupported manifest kind {kind}: {name}")
+        return
+
+    create, tolerate_conflict = RESOURCE_CREATORS[kind]
+    try:
+        create(doc_namespace, doc)
+        logger.info(f"Created {kind}: {name}")
+    except ApiException as e:
+        if e.status == 409 and tolerate_conflict:  # Already exists
+            logger.info(f"{kind} {name} already exists")
+        elif e.status == 409 and kind == 'Namespace':
+            raise NamespaceConflict(name)
+        else:
+            raise
+
+
+async def _create_timed(doc: dict, timings: Dict[str, float]) -> None:
+    kind = doc.get('kind')
+    start = time.perf_counter()
+    with span(f"create {kind}", kind=kind, name=doc.get('metadata', {}).get('name')) as current:
+        async with apply_slots:
+            current.set_attribute("slot_wait_ms", round((time.perf_counter() - start) * 1000, 1))
+            await run_k8s(_create_resource, doc)
+    elapsed = time.perf_counter() - start
+    timings[f"{kind}/{doc.get('metadata', {}).get('name')}"] = elapsed
+    RESOURCE_CREATE_DURATION.labels(kind=kind).observe(elapsed)
+
+
+async def _apply_documents(documents: List[dict],
+                           on_namespace_created: Optional[Callable[[], Awaitable[None]]] = None) -> Dict[str, float]:
+    """Create documents concurrently, each once the kinds it depends on are done.
+
+    on_namespace_created runs once the Namespace exists, alongside the creates
+    in it, and is finished before this returns or raises. Returns the wall time
+    of every create keyed by kind/name.
+    """
+    timings: Dict[str, float] = {}
+    by_kind: Dict[str, List[asyncio.Task]] = {}
+    tasks: List[asyncio.Task] = []
+    hooks: List[asyncio.Task] = []
+
+    async def run(doc: dict, deps: List[asyncio.Task]) -> None:
+        if deps:
+            await asyncio.gather(*deps)
+        await _create_timed(doc, timings)
+        if on_namespace_created is not None and doc.get('kind') == 'Namespace':
+            # Off the critical path: nothing in the namespace waits for it
+            hooks.append(asyncio.create_task(on_namespace_created()))
+
+    def schedule(kind: str) -> None:
+        if kind in by_kind:
+            return
+        by_kind[kind] = []
+        # Unknown kinds are assumed to be namespaced
+        dep_kinds = [dep for dep in RESOURCE_DEPENDENCIES.get(kind, ('Namespace',)) if dep != kind]
+        for dep in dep_kinds:
+            schedule(dep)
+        deps = [task for dep in dep_kinds for task in by_kind[dep]]
+        for doc in documents:
+            if doc.get('kind') == kind:
+                task = asyncio.create_task(run(doc, deps))
+                by_kind[kind].append(task)
+                tasks.append(task)
+
+    for doc in documents:
+        schedule(doc.get('kind'))
+
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        # The caller may update what the hook wrote, so it must have landed first
+        await asyncio.gather(*hooks, return_exceptions=True)
+    return timings
+
+
+async def apply_manifest(namespace: str, namespace_labels: Optional[Dict[str, str]] = None,
+                         templates: Optional[Sequence[CompiledTemplate]] = None,
+                         namespace_annotations: Optional[Dict[str, str]] = None,
+                         on_namespace_created: Optional[Callable[[], Awaitable[None]]] = None) -> Dict[str, float]:
+    """Apply Kubernetes manifests for a new workspace, returning per-resource timings.
+
+    on_namespace_created is awaited once the Namespace has been created, so the
+    caller can record the workspace knowing the name is its own.
+    """
+    documents = render_manifests(namespace, namespace_labels, templates, namespace_annotations)
+
+    start = time.perf_counter()
+    try:
+        with span("manifests.apply", namespace=namespace, documents=len(documents)):
+            timings = await _apply_documents(documents, on_namespace_created)
+    except NamespaceConflict:
+        # Namespaced objects wait for the Namespace, so none were written into
+        # someone else's workspace; the cluster RBAC is named after it either way
+        NAMESPACE_COLLISIONS.inc()
+        logger.error(f"Namespace {namespace} already exists, not touching it")
+        raise
+    except Exception as e:
+        logger.error(f"Failed to apply manifests: {e}")
+        if is_transient(e):
+            # Still failing after the client's retries: ask the caller to come back later
+            raise HTTPException(status_code=503, detail=f"Kubernetes API unavailable, try again later: {e}",
+                                headers={"Retry-After": str(TRANSIENT_RETRY_AFTER)})
+        raise HTTPException(status_code=500, detail=f"Failed to create workspace: {e}")
+
+    elapsed = time.perf_counter() - start
+    PROVISION_DURATION.observe(elapsed)
+    breakdown = ", ".join(f"{key}={seconds * 1000:.0f}ms" for key, seconds in timings.items())
+    logger.info(f"Applied all manifests for namespace: {namespace} in {elapsed * 1000:.0f}ms "
+                f"(sum of creates {sum(timings.values()) * 1000:.0f}ms; {breakdown})")
+    return timings
+
+
+async def apply_manifests(namespaces: List[str],
+                          namespace_annotations: Optional[Dict[str, str]] = None,
+                          on_namespace_created: Optional[Callable[[str], Awaitable[None]]] = None
+                          ) -> List[Optional[Exception]]:
+    """Provision several workspaces, BATCH_CONCURRENCY at a time.
+
+    Every workspace is rendered from one snapshot of the compiled templates,
+    and on_namespace_created is awaited with each namespace once it exists.
+    Returns, in order, None for each workspace created and the error for each
+    one that failed.
+    """
+    templates = compiled_templates()
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def provision(namespace: str) -> None:
+        async with slots:
+            created = (lambda: on_namespace_created(namespace)) if on_namespace_created is not None else None
+            await apply_manifest(namespace, templates=templates, namespace_annotations=namespace_annotations,
+                                 on_namespace_created=created)
+
+    results = await asyncio.gather(*(provision(namespace) for namespace in namespaces), return_exceptions=True)
+    return [result if isinstance(result, Exception) else None for result in results]
@@ -0,0 +1,198 @@
+"""Per-project TTLs, enforced in-process.
+
+Every workspace carries its deadline as the ``roo.io/expires-at`` annotation,
+set when it is created or claimed. The reaper keeps the deadlines in a min-heap
+fed by project cache deltas, sleeps until the earliest one and hands expired
+workspaces to the deletion reconciler, the same path DELETE takes. Workspaces
+without the annotation expire PROJECT_TTL_SECONDS after they were created or
+claimed from the warm pool. Only the elected leader runs the reaper.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from kubernetes.client.rest import ApiException
+from kubernetes.utils import parse_quantity
+
+from cache import is_deleting
+from k8s import run_k8s
+from metrics import TTL_REAPED, TTL_RECLAIMED_CPU, TTL_RECLAIMED_MEMORY, TTL_TRACKED
+
+logger = logging.getLogger(__name__)
+
+EXPIRES_ANNOTATION = "roo.io/expires-at"
+CLAIMED_ANNOTATION = "roo.io/claimed-at"
+PROJECT_TTL_SECONDS = int(os.environ.get("PROJECT_TTL_SECONDS", "7200"))
+PROJECT_TTL_MAX_SECONDS = int(os.environ.get("PROJECT_TTL_MAX_SECONDS", "86400"))
+# Deadlines are rebuilt from a full snapshot this often, picking up edits that
+# did not change a project's status (e.g. a hand-edited expires-at)
+REAPER_RESYNC_SECONDS = float(os.environ.get("REAPER_RESYNC_SECONDS", "300"))
+REAP_RETRY_SECONDS = 60.0
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def expiry_annotations(ttl_seconds: int) -> Dict[str, str]:
+    """Namespace annotations that make a workspace expire ttl_seconds from now"""
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+    return {EXPIRES_ANNOTATION: expires_at.strftime(TIMESTAMP_FORMAT)}
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def namespace_deadline(namespace) -> Optional[float]:
+    """Epoch seconds at which a workspace namespace expires, or None if it never does"""
+    annotations = namespace.metadata.annotations or {}
+    expires_at = parse_timestamp(annotations.get(EXPIRES_ANNOTATION))
+    if expires_at is not None:
+        return expires_at
+    if PROJECT_TTL_SECONDS <= 0:
+        return None
+    # Pooled workspaces age from when they were claimed, not created
+    started = parse_timestamp(annotations.get(CLAIMED_ANNOTATION))
+    if started is None and namespace.metadata.creation_timestamp:
+        started = namespace.metadata.creation_timestamp.timestamp()
+    return None if started is None else started + PROJECT_TTL_SECONDS
+
+
+def deployment_requests(deployment) -> Tuple[float, float]:
+    """(CPU cores, memory bytes) requested by all replicas of a deployment"""
+    if deployment is None:
+        return 0.0, 0.0
+    cpu = memory = 0.0
+    for container in deployment.spec.template.spec.containers:
+        requests = (container.resources.requests if container.resources else None) or {}
+        cpu += float(parse_quantity(requests.get("cpu", "0")))
+        memory += float(parse_quantity(requests.get("memory", "0")))
+    replicas = deployment.spec.replicas if deployment.spec.replicas is not None else 1
+    return cpu * replicas, memory * replicas
+
+
+class TtlReaper:
+    """Deletes workspaces once their expiry deadline passes"""
+
+    def __init__(self, v1, project_cache, deletion):
+        self.v1 = v1
+        self.project_cache = project_cache
+        self.deletion = deletion
+        # namespace -> deadline; heap entries that disagree with it are stale
+        self.deadlines: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._dirty: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        project_cache.add_listener(self._projects_changed)
+        TTL_TRACKED.set_function(lambda: len(self.deadlines))
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"TTL reaper enabled: default TTL {PROJECT_TTL_SECONDS}s")
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        # Another process reaps from here on; forget what this one was tracking
+        self._loop = None
+        self.deadlines = {}
+        self._heap = []
+        self._dirty.clear()
+
+    def schedule(self, namespace) -> None:
+        """Track (or stop tracking) a namespace's deadline from its current state"""
+        name = namespace.metadata.name
+        deadline = None if is_deleting(namespace) else namespace_deadline(namespace)
+        if deadline is None:
+            self.deadlines.pop(name, None)
+        elif self.deadlines.get(name) != deadline:
+            self.deadlines[name] = deadline
+            heapq.heappush(self._heap, (deadline, name))
+
+    async def resync(self) -> None:
+        """Rebuild every deadline from a full namespace snapshot"""
+        if self.project_cache.is_fresh():
+            namespaces = self.project_cache.namespace_objects()
+        else:
+            namespaces = (await run_k8s(self.v1.list_namespace, label_selector="roo=true")).items
+        self.deadlines = {}
+        self._heap = []
+        for namespace in namespaces:
+            self.schedule(namespace)
+
+    def _projects_changed(self, changes) -> None:
+        # Called on an informer thread with the cache locked: just note the names
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._mark_dirty, [namespace for _, namespace, _ in changes])
+
+    def _mark_dirty(self, names: List[str]) -> None:
+        self._dirty.update(names)
+        self._wakeup.set()
+
+    def _apply_changes(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        for name in dirty:
+            namespace = self.project_cache.namespace(name)
+            if namespace is None:
+                self.deadlines.pop(name, None)
+            else:
+                self.schedule(namespace)
+
+    async def _run(self) -> None:
+        last_resync = 0.0
+        while True:
+            try:
+                self._wakeup.clear()
+                if time.monotonic() - last_resync >= REAPER_RESYNC_SECONDS:
+                    await self.resync()
+                    self._dirty.clear()
+                    last_resync = time.monotonic()
+                self._apply_changes()
+
+                while self._heap and self._heap[0][0] <= time.time():
+                    deadline, name = heapq.heappop(self._heap)
+                    if self.deadlines.get(name) != deadline:
+                        continue
+                    del self.deadlines[name]
+                    await self._reap(name)
+
+                timeout = REAPER_RESYNC_SECONDS - (time.monotonic() - last_resync)
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - time.time())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0.01))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"TTL reaper loop failed: {e}")
+                await asyncio.sleep(5)
+
+    async def _reap(self, name: str) -> None:
+        cpu, memory = deployment_requests(self.project_cache.deployment(name))
+        try:
+            await self.deletion.request(name)
+        except ApiException as e:
+            if e.status == 404:
+                return
+            retry_at = time.time() + REAP_RETRY_SECONDS
+            self.deadlines[name] = retry_at
+            heapq.heappush(self._heap, (retry_at, name))
+            logger.warning(f"Failed to delete expired namespace {name}, retrying: {e}")
+            return
+        TTL_REAPED.inc()
+        TTL_RECLAIMED_CPU.inc(cpu)
+        TTL_RECLAIMED_MEMORY.inc(memory)
+        logger.info(f"Expired namespace {name} queued for deletion (reclaiming {cpu:g} CPU, {memory / 2**20:.0f}Mi)")
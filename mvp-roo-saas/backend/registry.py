@@ -0,0 +1,398 @@
+"""Persistent project registry backed by SQLite.
+
+The registry records every workspace's namespace, URL, owner, creation and
+expiry times and lifecycle state, indexed for listing, filtering and keyset
+pagination, so GET /api/projects is answered from a local file instead of the
+API server and survives API-server blips and backend restarts.
+
+Create and delete requests write their row as part of handling the request.
+RegistryReconciler keeps it in sync with the cluster: project cache deltas mark
+namespaces dirty and are written in small batches, and a periodic full pass
+upserts every live workspace and marks rows whose namespace is gone as
+``deleted``. Rows for deleted or failed workspaces are kept for
+REGISTRY_RETENTION_SECONDS as history, then pruned.
+
+All SQLite access happens on one dedicated thread, off the event loop.
+
+Worker processes sharing a registry file (BACKEND_WORKERS > 1) all read it and
+write their own requests' rows, but only the one holding an exclusive lock on
+``<REGISTRY_PATH>.lock`` syncs it with the cluster; the others retry the lock
+every REGISTRY_LOCK_RETRY_SECONDS, so a new syncer takes over within that long
+when the current one exits. Listings are served from the registry only once
+this process, or the live syncer since it took the lock, has completed a full
+pass: rows left by an earlier run are never trusted on their own.
+"""
+import os
+import time
+import fcntl
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from admission import OWNER_ANNOTATION
+from cache import project_status
+from k8s import run_k8s
+from metrics import REGISTRY_PROJECTS, REGISTRY_RECONCILES
+from reaper import CLAIMED_ANNOTATION, namespace_deadline, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_ENABLED = os.environ.get("REGISTRY_ENABLED", "true").lower() == "true"
+# data/ beside the backend code, whatever the working directory (/app/data in the image)
+REGISTRY_PATH = os.environ.get("REGISTRY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                                                             "registry.db"))
+REGISTRY_RESYNC_SECONDS = float(os.environ.get("REGISTRY_RESYNC_SECONDS", "300"))
+REGISTRY_RETENTION_SECONDS = float(os.environ.get("REGISTRY_RETENTION_SECONDS", "86400"))
+# How often a worker that does not sync the registry tries to take over
+REGISTRY_LOCK_RETRY_SECONDS = 5.0
+# A create's row may be written before its namespace reaches the cache
+CREATING_GRACE_SECONDS = 120.0
+# Without the project cache, statuses only change on a full pass
+UNCACHED_RESYNC_SECONDS = 15.0
+
+# States that no longer correspond to a namespace
+FINAL_STATES = ("deleted", "failed")
+PAGE_SIZE_MAX = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    namespace  TEXT PRIMARY KEY,
+    url        TEXT NOT NULL,
+    state      TEXT NOT NULL,
+    owner      TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS projects_state ON projects (state, namespace);
+CREATE INDEX IF NOT EXISTS projects_created_at ON projects (created_at);
+CREATE INDEX IF NOT EXISTS projects_owner ON projects (owner, namespace);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+COLUMNS = ("namespace", "url", "state", "owner", "created_at", "expires_at", "updated_at")
+
+
+def project_url(namespace: str) -> str:
+    return f"http://localhost/{namespace}/"
+
+
+def namespace_row(namespace, deployment) -> Dict[str, object]:
+    """Registry row for a live workspace namespace and its deployment"""
+    name = namespace.metadata.name
+    annotations = namespace.metadata.annotations or {}
+    # Pooled workspaces count from when they were claimed
+    created_at = parse_timestamp(annotations.get(CLAIMED_ANNOTATION))
+    if created_at is None:
+        created = namespace.metadata.creation_timestamp
+        created_at = created.timestamp() if created else time.time()
+    return {
+        "namespace": name,
+        "url": project_url(name),
+        "state": project_status(namespace, deployment),
+        "owner": annotations.get(OWNER_ANNOTATION),
+        "created_at": created_at,
+        "expires_at": namespace_deadline(namespace),
+    }
+
+
+class ProjectRegistry:
+    """SQLite table of projects; every method runs on the registry's own thread"""
+
+    def __init__(self, path: str = REGISTRY_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="registry")
+        self._db: Optional[sqlite3.Connection] = None
+        # Held open while this process syncs the registry; closing it releases the lock
+        self._lock_file = None
+        # Live (not deleted or failed) rows, refreshed after every write
+        self._count_cache = 0
+        REGISTRY_PROJECTS.set_function(lambda: self._count_cache)
+
+    async def run(self, fn, *args):
+        """Run a registry method on the registry thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._refresh_count()
+        logger.info(f"Project registry at {self.path} holds {self._count_cache} live projects")
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _refresh_count(self) -> None:
+        placeholders = ",".join("?" * len(FINAL_STATES))
+        self._count_cache = self._db.execute(
+            f"SELECT COUNT(*) FROM projects WHERE state NOT IN ({placeholders})", FINAL_STATES).fetchone()[0]
+
+    def _transaction(self, statements: Iterable[Tuple[str, Sequence]]) -> None:
+        cursor = self._db.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                cursor.execute(sql, params)
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+        self._refresh_count()
+
+    def try_lock(self) -> bool:
+        """Take the file lock that makes this process the registry's syncer; False if another holds it"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        # Passes recorded before this point were made by an earlier syncer
+        self.set_meta("syncer_since", str(time.time()))
+        return True
+
+    def set_meta(self, key: str, value: str) -> None:
+        self._transaction([("INSERT INTO meta (key, value) VALUES (?, ?) "
+                            "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))])
+
+    def reconciled_by_syncer(self) -> bool:
+        """Whether the current syncer has completed a full pass since it took the lock"""
+        since, reconciled = self.get_meta("syncer_since"), self.get_meta("reconciled_at")
+        return since is not None and reconciled is not None and float(reconciled) >= float(since)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, namespaces: List[str], state: str, owner: Optional[str] = None,
+               expires_at: Optional[float] = None) -> None:
+        """Insert or overwrite rows for projects this backend is creating or has claimed"""
+        now = time.time()
+        self._transaction(
+            ("INSERT INTO projects (namespace, url, state, owner, created_at, expires_at, updated_at) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (namespace) DO UPDATE SET "
+             "state = excluded.state, owner = excluded.owner, created_at = excluded.created_at, "
+             "expires_at = excluded.expires_at, updated_at = excluded.updated_at",
+             (namespace, project_url(namespace), state, owner, now, expires_at, now))
+            for namespace in namespaces
+        )
+
+    def set_state(self, namespaces: List[str], state: str) -> None:
+        now = time.time()
+        self._transaction(
+            ("UPDATE projects SET state = ?, updated_at = ? WHERE namespace = ?", (state, now, namespace))
+            for namespace in namespaces
+        )
+
+    def upsert(self, rows: List[Dict[str, object]]) -> None:
+        """Write the cluster's view of live workspaces"""
+        now = time.time()
+        self._transaction(
+            ("INSERT INTO projects (namespace, url, state, owner, created_at, expires_at, updated_at) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (namespace) DO UPDATE SET "
+             "state = excluded.state, owner = excluded.owner, created_at = excluded.created_at, "
+             "expires_at = excluded.expires_at, updated_at = excluded.updated_at",
+             (row["namespace"], row["url"], row["state"], row["owner"], row["created_at"],
+              row["expires_at"], now))
+            for row in rows
+        )
+
+    def mark_gone(self, namespaces: List[str]) -> None:
+        self.set_state(namespaces, "deleted")
+
+    def reconcile(self, rows: List[Dict[str, object]]) -> int:
+        """Apply a full snapshot of live workspaces; returns how many rows were marked deleted"""
+        live = {row["namespace"] for row in rows}
+        cutoff = time.time() - CREATING_GRACE_SECONDS
+        placeholders = ",".join("?" * len(FINAL_STATES))
+        known = self._db.execute(
+            f"SELECT namespace, state, updated_at FROM projects WHERE state NOT IN ({placeholders})",
+            FINAL_STATES).fetchall()
+        gone = [namespace for namespace, state, updated_at in known
+                if namespace not in live and not (state == "creating" and updated_at > cutoff)]
+        self.upsert(rows)
+        if gone:
+            self.mark_gone(gone)
+        self._transaction([
+            ("DELETE FROM projects WHERE state IN ('deleted', 'failed') AND updated_at < ?",
+             (time.time() - REGISTRY_RETENTION_SECONDS,)),
+            ("INSERT INTO meta (key, value) VALUES ('reconciled_at', ?) "
+             "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (str(time.time()),)),
+        ])
+        return len(gone)
+
+    def query(self, states: Optional[Sequence[str]] = None, owner: Optional[str] = None,
+              created_after: Optional[float] = None, created_before: Optional[float] = None,
+              after: Optional[str] = None,
+              limit: Optional[int] = None) -> Tuple[List[Dict[str, object]], int, Optional[str]]:
+        """One page of projects ordered by namespace, the total matching the filters, and the next page's cursor"""
+        where, params = [], []
+        if states:
+            where.append(f"state IN ({','.join('?' * len(states))})")
+            params.extend(states)
+        else:
+            where.append(f"state NOT IN ({','.join('?' * len(FINAL_STATES))})")
+            params.extend(FINAL_STATES)
+        if owner is not None:
+            where.append("owner = ?")
+            params.append(owner)
+        if created_after is not None:
+            where.append("created_at >= ?")
+            params.append(created_after)
+        if created_before is not None:
+            where.append("created_at < ?")
+            params.append(created_before)
+        clause = " AND ".join(where)
+        total = self._db.execute(f"SELECT COUNT(*) FROM projects WHERE {clause}", params).fetchone()[0]
+        if after is not None:
+            clause += " AND namespace > ?"
+            params.append(after)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM projects WHERE {clause} ORDER BY namespace"
+        if limit is not None:
+            # One extra row tells whether there is another page
+            sql += f" LIMIT {int(limit) + 1}"
+        rows = [dict(zip(COLUMNS, row)) for row in self._db.execute(sql, params)]
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            return rows, total, rows[-1]["namespace"]
+        return rows, total, None
+
+
+class RegistryReconciler:
+    """Keeps the registry in step with the cluster: cache deltas plus periodic full passes"""
+
+    def __init__(self, registry: ProjectRegistry, v1, apps_v1, project_cache, use_cache: bool = True):
+        self.registry = registry
+        self.v1 = v1
+        self.apps_v1 = apps_v1
+        self.project_cache = project_cache
+        self.use_cache = use_cache
+        self.reconciled = False
+        # Whether this process holds the registry lock and keeps the registry in sync
+        self.syncing = False
+        self._dirty: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        if use_cache:
+            project_cache.add_listener(self._projects_changed)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await self.registry.run(self.registry.open)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        self.registry._executor.submit(self.registry.close)
+
+    def _projects_changed(self, changes) -> None:
+        # Called on an informer thread with the cache locked: just note the names
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._mark_dirty, [namespace for _, namespace, _ in changes])
+
+    def _mark_dirty(self, names: List[str]) -> None:
+        if not self.syncing:
+            return
+        self._dirty.update(names)
+        self._wakeup.set()
+
+    async def _snapshot(self) -> Optional[List[Dict[str, object]]]:
+        """Rows for every live workspace, or None if no trustworthy snapshot is available"""
+        if self.use_cache:
+            if not self.project_cache.is_fresh():
+                return None
+            return [namespace_row(ns, self.project_cache.deployment(ns.metadata.name))
+                    for ns in self.project_cache.namespace_objects()]
+        namespaces, deployments = await asyncio.gather(
+            run_k8s(self.v1.list_namespace, label_selector="roo=true"),
+            run_k8s(self.apps_v1.list_deployment_for_all_namespaces, field_selector="metadata.name=vscode-server"),
+        )
+        by_namespace = {d.metadata.namespace: d for d in deployments.items}
+        return [namespace_row(ns, by_namespace.get(ns.metadata.name)) for ns in namespaces.items]
+
+    async def reconcile(self) -> bool:
+        rows = await self._snapshot()
+        if rows is None:
+            return False
+        self._dirty.clear()
+        gone = await self.registry.run(self.registry.reconcile, rows)
+        self.reconciled = True
+        REGISTRY_RECONCILES.inc()
+        if gone:
+            logger.info(f"Registry reconcile marked {gone} projects deleted")
+        return True
+
+    async def _flush(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        rows, gone = [], []
+        for name in dirty:
+            namespace = self.project_cache.namespace(name)
+            if namespace is None:
+                gone.append(name)
+            else:
+                rows.append(namespace_row(namespace, self.project_cache.deployment(name)))
+        if rows:
+            await self.registry.run(self.registry.upsert, rows)
+        if gone:
+            await self.registry.run(self.registry.mark_gone, gone)
+
+    async def _run(self) -> None:
+        while not self.syncing:
+            try:
+                self.syncing = await self.registry.run(self.registry.try_lock)
+                if not self.syncing:
+                    # A live worker holds the lock; serve listings once it has completed a pass
+                    if not self.reconciled:
+                        self.reconciled = await self.registry.run(self.registry.reconciled_by_syncer)
+                    await asyncio.sleep(REGISTRY_LOCK_RETRY_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Registry lock check failed: {e}")
+                await asyncio.sleep(REGISTRY_LOCK_RETRY_SECONDS)
+        logger.info(f"Syncing the project registry from process {os.getpid()}")
+        await self._sync()
+
+    async def _sync(self) -> None:
+        interval = REGISTRY_RESYNC_SECONDS if self.use_cache else min(REGISTRY_RESYNC_SECONDS, UNCACHED_RESYNC_SECONDS)
+        last_resync = None
+        while True:
+            try:
+                self._wakeup.clear()
+                if last_resync is None or time.monotonic() - last_resync >= interval:
+                    # Until the first pass succeeds, retry it every second
+                    if await self.reconcile():
+                        last_resync = time.monotonic()
+                elif self._dirty:
+                    await self._flush()
+                timeout = 1.0 if last_resync is None else interval - (time.monotonic() - last_resync)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0.01))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Registry reconcile failed: {e}")
+                await asyncio.sleep(5)
@@ -0,0 +1,74 @@
+"""In-memory route table behind the shared workspace gateway.
+
+Maps each routable workspace namespace to the host:port of its vscode-server
+Service. Lookups are a dict read, and adding or removing a workspace touches
+one entry, however many workspaces there are. Kept free of Kubernetes imports
+so benchmarks can load it without a cluster.
+"""
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from metrics import GATEWAY_ROUTE_LOOKUPS, GATEWAY_ROUTE_UPDATES, GATEWAY_ROUTES
+
+
+def upstream(namespace: str) -> str:
+    """host:port of a workspace's vscode-server Service"""
+    return f"vscode-server.{namespace}.svc.cluster.local:80"
+
+
+class RouteTable:
+    """namespace -> upstream for every routable workspace; safe to use from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, str] = {}
+        self.version = 0
+        GATEWAY_ROUTES.set_function(lambda: len(self._routes))
+        # Looked up once: the gateway asks on every (uncached) request
+        self._hits = GATEWAY_ROUTE_LOOKUPS.labels(result="hit")
+        self._misses = GATEWAY_ROUTE_LOOKUPS.labels(result="miss")
+
+    def lookup(self, namespace: str) -> Optional[str]:
+        route = self._routes.get(namespace)
+        (self._hits if route else self._misses).inc()
+        return route
+
+    def snapshot(self) -> Tuple[int, Dict[str, str]]:
+        with self._lock:
+            return self.version, dict(self._routes)
+
+    def add(self, namespaces: Iterable[str]) -> None:
+        with self._lock:
+            added = [ns for ns in namespaces if ns not in self._routes]
+            for namespace in added:
+                self._routes[namespace] = upstream(namespace)
+            self._changed("added", len(added))
+
+    def remove(self, namespaces: Iterable[str]) -> None:
+        with self._lock:
+            removed = [ns for ns in namespaces if self._routes.pop(ns, None) is not None]
+            self._changed("removed", len(removed))
+
+    def replace(self, namespaces: Iterable[str]) -> None:
+        """Make the table exactly these workspaces"""
+        routes = {namespace: upstream(namespace) for namespace in namespaces}
+        with self._lock:
+            added = len(routes.keys() - self._routes.keys())
+            removed = len(self._routes.keys() - routes.keys())
+            self._routes = routes
+            self._changed("added", added)
+            self._changed("removed", removed)
+
+    def _changed(self, change: str, count: int) -> None:
+        if count:
+            self.version += 1
+            GATEWAY_ROUTE_UPDATES.labels(change=change).inc(count)
+
+    def project_changes(self, changes) -> None:
+        """Project cache listener: route live workspaces, drop deleting and deleted ones"""
+        gone = [ns for change, ns, status in changes if change == "deleted" or status == "deleting"]
+        live = [ns for change, ns, status in changes if change != "deleted" and status != "deleting"]
+        if gone:
+            self.remove(gone)
+        if live:
+            self.add(live)
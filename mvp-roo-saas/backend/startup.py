@@ -0,0 +1,149 @@
+"""Workspace startup timing.
+
+The workspace entrypoint times each of its startup phases and records them on
+its own pod as the ``roo.io/startup-phases`` annotation. StartupTracker watches
+vscode-server pods and turns each report into per-phase histograms, and follows
+the project cache to time every create request until its workspace is ready.
+It also keeps the current pods, so one project's detailed status can be served
+from memory.
+
+Every backend process watches the same pods, so only the one with
+``report_phases`` set (the leader) records phase reports; time to ready is
+recorded by the process that served the create.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from cache import Informer
+from metrics import STARTUP_PHASE_DURATION, TIME_TO_READY
+
+logger = logging.getLogger(__name__)
+
+PHASES_ANNOTATION = "roo.io/startup-phases"
+# Creates that have not become ready after this long stop being tracked
+STARTUP_TRACK_TIMEOUT = float(os.environ.get("STARTUP_TRACK_TIMEOUT", "1800"))
+
+
+class StartupTracker:
+    """Collects entrypoint phase reports and create-to-ready times"""
+
+    def __init__(self, v1, project_cache):
+        self._lock = threading.Lock()
+        # namespace -> (time.monotonic() of the create request, source)
+        self.pending: Dict[str, Tuple[float, str]] = {}
+        # UIDs of pods whose phase report has been observed
+        self.reported: Set[str] = set()
+        # namespace -> {pod UID: pod}
+        self.pods: Dict[str, Dict[str, object]] = {}
+        self.listeners: List[Callable[[List[str]], None]] = []
+        # Off in all but one process, so each report is counted once across workers and replicas
+        self.report_phases = True
+        self.informer = Informer("pods", v1.list_pod_for_all_namespaces, self._reset, self._event,
+                                 label_selector="app=vscode-server")
+        project_cache.add_listener(self._projects_changed)
+
+    def start(self) -> None:
+        self.informer.start()
+
+    def stop(self) -> None:
+        self.informer.stop()
+
+    def add_listener(self, listener: Callable[[List[str]], None]) -> None:
+        """Register a callback receiving the namespaces whose pods changed; runs on the informer thread"""
+        self.listeners.append(listener)
+
+    def pod(self, namespace: str) -> Optional[object]:
+        """The newest vscode-server pod in a namespace, if any"""
+        with self._lock:
+            pods = list(self.pods.get(namespace, {}).values())
+        created = lambda pod: pod.metadata.creation_timestamp.timestamp() if pod.metadata.creation_timestamp else 0.0  # noqa: E731
+        return max(pods, key=created, default=None)
+
+    def _notify(self, namespaces: List[str]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(namespaces)
+            except Exception as e:
+                logger.warning(f"Pod listener failed: {e}")
+
+    def track(self, namespace: str, source: str, started: float, status: str) -> None:
+        """Start the time-to-ready clock for a workspace whose create began at `started`"""
+        if status == "ready":
+            TIME_TO_READY.labels(source=source).observe(time.monotonic() - started)
+            return
+        now = time.monotonic()
+        with self._lock:
+            for name, (created, _) in list(self.pending.items()):
+                if now - created > STARTUP_TRACK_TIMEOUT:
+                    del self.pending[name]
+            self.pending[namespace] = (started, source)
+
+    def _projects_changed(self, changes) -> None:
+        for change, namespace, status in changes:
+            if change != "deleted" and status != "ready":
+                continue
+            with self._lock:
+                tracked = self.pending.pop(namespace, None)
+            if tracked and change != "deleted":
+                started, source = tracked
+                TIME_TO_READY.labels(source=source).observe(time.monotonic() - started)
+
+    def _observe(self, pod) -> None:
+        raw = (pod.metadata.annotations or {}).get(PHASES_ANNOTATION)
+        if not raw or pod.metadata.uid in self.reported:
+            return
+        self.reported.add(pod.metadata.uid)
+        if not self.report_phases:
+            return
+        try:
+            report = json.loads(raw)
+            phases = {phase: float(seconds) for phase, seconds in report["phases"].items()}
+            started_at = float(report["started_at"])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring malformed startup report on {pod.metadata.namespace}/{pod.metadata.name}: {e}")
+            return
+        # Scheduling, image pull and container creation happen before the entrypoint runs
+        if pod.metadata.creation_timestamp:
+            phases["pod_start"] = max(0.0, started_at - pod.metadata.creation_timestamp.timestamp())
+        for phase, seconds in phases.items():
+            STARTUP_PHASE_DURATION.labels(phase=phase).observe(seconds)
+        breakdown = ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in phases.items())
+        logger.info(f"Workspace {pod.metadata.namespace} startup phases: {breakdown}")
+
+    def _reset(self, items) -> None:
+        pods: Dict[str, Dict[str, object]] = {}
+        for pod in items:
+            pods.setdefault(pod.metadata.namespace, {})[pod.metadata.uid] = pod
+        with self._lock:
+            changed = list(set(self.pods) | set(pods))
+            self.pods = pods
+        self._notify(changed)
+        if not self.informer.synced.is_set():
+            # Reports that predate this process were counted by whoever saw them first
+            self.reported = {
+                pod.metadata.uid for pod in items
+                if PHASES_ANNOTATION in (pod.metadata.annotations or {})
+            }
+            return
+        self.reported &= {pod.metadata.uid for pod in items}
+        for pod in items:
+            self._observe(pod)
+
+    def _event(self, event_type: str, pod) -> None:
+        namespace = pod.metadata.namespace
+        with self._lock:
+            if event_type == 'DELETED':
+                self.pods.get(namespace, {}).pop(pod.metadata.uid, None)
+                if not self.pods.get(namespace):
+                    self.pods.pop(namespace, None)
+            else:
+                self.pods.setdefault(namespace, {})[pod.metadata.uid] = pod
+        self._notify([namespace])
+        if event_type == 'DELETED':
+            self.reported.discard(pod.metadata.uid)
+        else:
+            self._observe(pod)
@@ -0,0 +1,151 @@
+"""Detailed status of a single workspace, and long-poll waiting for it to change.
+
+``project_detail`` condenses a workspace's namespace, vscode-server deployment
+and newest pod into the document served by ``GET /api/projects/{namespace}``.
+Its ETag is a hash of that document, so a client can revalidate with
+If-None-Match. ``ProjectWaiters`` lets requests block until informer events
+touch a given namespace instead of polling the API.
+"""
+import re
+import json
+import asyncio
+import hashlib
+from typing import Dict, List, Optional, Set
+
+from admission import OWNER_ANNOTATION
+from cache import project_status
+from idle import LAST_ACTIVE_ANNOTATION
+from provision import TEMPLATE_BUNDLE_ANNOTATION
+from reaper import EXPIRES_ANNOTATION
+from startup import PHASES_ANNOTATION
+
+# One entity tag of an If-None-Match list, weak or strong, or the * wildcard
+ENTITY_TAG_RE = re.compile(r'(?:W/)?("[^"]*")|(\*)')
+
+
+def _timestamp(value) -> Optional[str]:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ") if value else None
+
+
+def _container(status) -> dict:
+    state, reason = "unknown", None
+    if status.state:
+        for name in ("running", "waiting", "terminated"):
+            detail = getattr(status.state, name)
+            if detail is not None:
+                state, reason = name, getattr(detail, "reason", None)
+                break
+    return {"name": status.name, "ready": bool(status.ready), "restarts": status.restart_count or 0,
+            "state": state, "reason": reason}
+
+
+def pod_detail(pod) -> Optional[dict]:
+    """Phase, probe conditions and container states of a workspace pod"""
+    if pod is None:
+        return None
+    status = pod.status
+    containers = [_container(c) for c in (status.container_statuses if status else None) or ()]
+    conditions = {c.type: c.status == "True" for c in (status.conditions if status else None) or ()}
+    return {
+        "name": pod.metadata.name,
+        "phase": status.phase if status else None,
+        "ready": conditions.get("Ready", False),
+        "restarts": sum(c["restarts"] for c in containers),
+        "conditions": conditions,
+        "containers": containers,
+        "started_at": _timestamp(status.start_time if status else None),
+    }
+
+
+def startup_detail(pod) -> Optional[dict]:
+    """The entrypoint's startup phase report, if the pod has posted one"""
+    raw = (pod.metadata.annotations or {}).get(PHASES_ANNOTATION) if pod is not None else None
+    if not raw:
+        return None
+    try:
+        report = json.loads(raw)
+        return {"phases": {phase: float(seconds) for phase, seconds in report["phases"].items()},
+                "template_bundle": report.get("template_bundle")}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def project_detail(namespace, deployment, pod) -> dict:
+    """Detailed status document for one workspace"""
+    name = namespace.metadata.name
+    annotations = namespace.metadata.annotations or {}
+    spec = deployment.spec if deployment is not None else None
+    status = deployment.status if deployment is not None else None
+    return {
+        "namespace": name,
+        "url": f"http://localhost/{name}/",
+        "status": project_status(namespace, deployment),
+        "replicas": {
+            "desired": (spec.replicas if spec.replicas is not None else 1) if spec else 0,
+            "current": (status.replicas or 0) if status else 0,
+            "ready": (status.ready_replicas or 0) if status else 0,
+            "available": (status.available_replicas or 0) if status else 0,
+            "updated": (status.updated_replicas or 0) if status else 0,
+        },
+        "pod": pod_detail(pod),
+        "startup": startup_detail(pod),
+        "created_at": _timestamp(namespace.metadata.creation_timestamp),
+        "expires_at": annotations.get(EXPIRES_ANNOTATION),
+        "last_active": ((deployment.metadata.annotations or {}).get(LAST_ACTIVE_ANNOTATION)
+                        if deployment is not None else None),
+        "owner": annotations.get(OWNER_ANNOTATION),
+        "template_bundle": annotations.get(TEMPLATE_BUNDLE_ANNOTATION),
+    }
+
+
+def detail_etag(detail: dict) -> str:
+    digest = hashlib.sha1(json.dumps(detail, sort_keys=True).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag: any tag of its list, compared weakly, or *"""
+    if not if_none_match:
+        return False
+    etag = etag[2:] if etag.startswith("W/") else etag
+    return any(wildcard or tag == etag for tag, wildcard in ENTITY_TAG_RE.findall(if_none_match))
+
+
+class ProjectWaiters:
+    """Wakes requests waiting on a namespace when informer events touch it"""
+
+    def __init__(self):
+        self._waiting: Dict[str, Set[asyncio.Event]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def notify(self, namespaces: List[str]) -> None:
+        """Safe to call from any thread"""
+        if self._loop is not None and self._waiting:
+            self._loop.call_soon_threadsafe(self._wake, namespaces)
+
+    def project_changes(self, changes) -> None:
+        self.notify([namespace for _, namespace, _ in changes])
+
+    def _wake(self, namespaces: List[str]) -> None:
+        for namespace in namespaces:
+            for event in self._waiting.get(namespace, ()):
+                event.set()
+
+    async def wait(self, namespace: str, timeout: float) -> bool:
+        """Block until the namespace changes or timeout passes; True if it changed"""
+        event = asyncio.Event()
+        self._waiting.setdefault(namespace, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiting.get(namespace)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiting[namespace]
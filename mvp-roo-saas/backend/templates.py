@@ -0,0 +1,166 @@
+"""Compiled workspace manifest templates.
+
+Templates are read and parsed once, then kept as a tree in which every
+subtree without a ``${...}`` placeholder is shared between renders. Rendering
+a project only rebuilds the path down to the parameterised strings, so the
+per-request cost no longer includes file I/O or YAML parsing.
+"""
+import os
+import re
+import threading
+import time
+import logging
+from typing import Any, Dict, FrozenSet, List, Tuple
+
+import yaml
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_RE = re.compile(r"\$\{(\w+)\}")
+
+TEMPLATE_DIRS = ["/app/manifests", "../manifests"]
+
+
+def resolve_template_path(template_name: str) -> str:
+    """Find a manifest template on disk"""
+    for directory in TEMPLATE_DIRS:
+        template_path = os.path.join(directory, template_name)
+        if os.path.exists(template_path):
+            return template_path
+    return os.path.join(TEMPLATE_DIRS[-1], template_name)
+
+
+class _Param:
+    """A string leaf containing one or more ${PARAM} placeholders"""
+    __slots__ = ("parts",)
+
+    def __init__(self, parts: List[Tuple[str, str]]):
+        # Alternating (literal, parameter name) pairs; the name may be empty
+        self.parts = parts
+
+    def render(self, params: Dict[str, str]) -> str:
+        return "".join(literal + (params[name] if name else "") for literal, name in self.parts)
+
+
+def _split_placeholders(raw: str, names: FrozenSet[str]) -> List[Tuple[str, str]]:
+    """Split a string on known placeholders; unknown ones (e.g. shell variables) stay literal"""
+    parts, literal, pos = [], "", 0
+    for match in PLACEHOLDER_RE.finditer(raw):
+        if match.group(1) not in names:
+            continue
+        literal += raw[pos:match.start()]
+        parts.append((literal, match.group(1)))
+        literal, pos = "", match.end()
+    if parts:
+        parts.append((literal + raw[pos:], ""))
+    return parts
+
+
+class _Mapping:
+    """A dict with at least one parameterised descendant"""
+    __slots__ = ("static", "dynamic")
+
+    def __init__(self, static: Dict[str, Any], dynamic: List[Tuple[str, Any]]):
+        self.static = static
+        self.dynamic = dynamic
+
+    def render(self, params: Dict[str, str]) -> Dict[str, Any]:
+        rendered = dict(self.static)
+        for key, node in self.dynamic:
+            rendered[key] = node.render(params)
+        return rendered
+
+
+class _Sequence:
+    """A list with at least one parameterised descendant"""
+    __slots__ = ("items",)
+
+    def __init__(self, items: List[Any]):
+        self.items = items
+
+    def render(self, params: Dict[str, str]) -> List[Any]:
+        return [item.render(params) if isinstance(item, _DYNAMIC) else item for item in self.items]
+
+
+_DYNAMIC = (_Param, _Mapping, _Sequence)
+
+
+def _compile_node(node: Any, names: FrozenSet[str]) -> Any:
+    """Compile a parsed YAML node, returning it unchanged when it has no placeholders"""
+    if isinstance(node, str):
+        parts = _split_placeholders(node, names)
+        return _Param(parts) if parts else node
+    if isinstance(node, dict):
+        static, dynamic = {}, []
+        for key, value in node.items():
+            compiled = _compile_node(value, names)
+            if isinstance(compiled, _DYNAMIC):
+                dynamic.append((key, compiled))
+            else:
+                static[key] = compiled
+        return _Mapping(static, dynamic) if dynamic else node
+    if isinstance(node, list):
+        items = [_compile_node(item, names) for item in node]
+        return _Sequence(items) if any(isinstance(item, _DYNAMIC) for item in items) else node
+    return node
+
+
+class CompiledTemplate:
+    """A parsed multi-document manifest with pre-compiled placeholders"""
+
+    def __init__(self, path: str, mtime: float, documents: List[Dict[str, Any]], parameters: FrozenSet[str]):
+        self.path = path
+        self.mtime = mtime
+        self.documents = [_compile_node(doc, parameters) for doc in documents if doc]
+
+    def render(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Render every document with the given parameters.
+
+        Unchanged subtrees are shared with the compiled template, so callers
+        must treat the result as read-only.
+        """
+        return [doc.render(params) if isinstance(doc, _DYNAMIC) else doc for doc in self.documents]
+
+
+class TemplateStore:
+    """Caches compiled templates and reloads them when the file changes"""
+
+    def __init__(self, parameters=("NAMESPACE",), check_interval: float = 2.0):
+        self.parameters = frozenset(parameters)
+        self.check_interval = check_interval
+        self._templates: Dict[str, CompiledTemplate] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, template_name: str) -> CompiledTemplate:
+        """Return the compiled template, recompiling it if its mtime moved"""
+        now = time.monotonic()
+        compiled = self._templates.get(template_name)
+        if compiled and now - self._checked_at.get(template_name, 0) < self.check_interval:
+            return compiled
+
+        with self._lock, span("template.load", template=template_name) as current:
+            compiled = self._templates.get(template_name)
+            path = resolve_template_path(template_name)
+            mtime = os.stat(path).st_mtime
+            if compiled is None or compiled.path != path or compiled.mtime != mtime:
+                with span("template.parse", path=path):
+                    with open(path, 'r') as f:
+                        documents = list(yaml.safe_load_all(f))
+                with span("template.compile", documents=len(documents)):
+                    compiled = CompiledTemplate(path, mtime, documents, self.parameters)
+                self._templates[template_name] = compiled
+                logger.info(f"Compiled manifest template {template_name} from {path}")
+                current.set_attribute("recompiled", True)
+            self._checked_at[template_name] = now
+            return compiled
+
+    def render(self, template_names: List[str], params: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Render several templates into one list of documents, in order"""
+        documents = []
+        for template_name in template_names:
+            documents.extend(self.get(template_name).render(params))
+        return documents
+
@@ -0,0 +1,256 @@
+"""Request tracing with OpenTelemetry-shaped spans.
+
+``span()`` times a block of code (sync or async) as a child of the current
+span, so a slow ``POST /api/projects`` breaks down into template loading,
+manifest rendering, each resource create and the API calls under it. The
+current span lives in a context variable: asyncio tasks inherit it, and
+``run_k8s`` carries it into the k8s thread pool.
+
+Finished spans are exported in the background, as one JSON object per line
+with the field names of the OTLP JSON encoding (traceId, spanId,
+parentSpanId, startTimeUnixNano, ...):
+
+- TRACING_EXPORTER=console logs each span;
+- TRACING_EXPORTER=file appends them to TRACING_FILE;
+- TRACING_EXPORTER=none (the default) records nothing and costs one
+  context-variable read per span.
+
+Each request is a trace of its own unless it carries a W3C ``traceparent``
+header, which is continued; the response's ``traceparent`` names the request
+span. TRACING_SAMPLE_RATIO keeps that fraction of new traces.
+"""
+import os
+import json
+import asyncio
+import queue
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.environ.get("TRACING_FILE", "traces.jsonl")
+TRACING_SAMPLE_RATIO = float(os.environ.get("TRACING_SAMPLE_RATIO", "1.0"))
+TRACING_EXPORTERS = ("none", "console", "file")
+if TRACING_EXPORTER not in TRACING_EXPORTERS:
+    raise ValueError(f"TRACING_EXPORTER must be one of {', '.join(TRACING_EXPORTERS)}, not {TRACING_EXPORTER!r}")
+# Spans waiting for the exporter; beyond this they are dropped rather than held in memory
+EXPORT_QUEUE_SIZE = 10000
+
+
+class Span:
+    """One timed operation within a trace"""
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NonRecordingSpan:
+    """Stands in for a span when tracing is off or the trace was not sampled"""
+    __slots__ = ()
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, error: BaseException) -> None:
+        pass
+
+
+NON_RECORDING = _NonRecordingSpan()
+# The innermost open span of this task or thread; None when not inside a sampled trace
+_current: ContextVar[Optional[Span]] = ContextVar("roo_current_span", default=None)
+
+
+class SpanExporter:
+    """Writes finished spans from a background thread, so the event loop never blocks on I/O"""
+
+    def __init__(self, kind: str, path: str):
+        self.kind = kind
+        self.path = path
+        self._queue: Optional["queue.Queue[Span]"] = None
+        self.dropped = 0
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        # Started on first use, so each worker process has its own thread
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+                threading.Thread(target=self._run, args=(self._queue,), name="span-exporter", daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self, spans: "queue.Queue[Span]") -> None:
+        out = open(self.path, "a", buffering=1) if self.kind == "file" else None
+        while True:
+            span = spans.get()
+            try:
+                line = json.dumps(span.to_dict(), default=str)
+                if out:
+                    out.write(line + "\n")
+                else:
+                    logger.info(f"span {line}")
+            except Exception as e:
+                logger.warning(f"Failed to export span {span.name}: {e}")
+
+
+exporter = SpanExporter(TRACING_EXPORTER, TRACING_FILE) if TRACING_EXPORTER != "none" else None
+if exporter:
+    logger.info(f"Tracing to {TRACING_FILE if TRACING_EXPORTER == 'file' else 'the log'} "
+                f"(sampling {TRACING_SAMPLE_RATIO:.0%} of traces)")
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None"""
+    parts = (header or "").strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+@contextmanager
+def span(name: str, /, **attributes: Any) -> Iterator[Any]:
+    """Time a block as a child of the current span; nothing is recorded outside a sampled trace"""
+    parent = _current.get()
+    if parent is None:
+        yield NON_RECORDING
+        return
+    with _record(Span(name, parent.trace_id, parent.span_id, attributes)) as child:
+        yield child
+
+
+@contextmanager
+def root_span(name: str, /, traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Any]:
+    """Start a trace, or continue the caller's when a traceparent header is given"""
+    if exporter is None:
+        yield NON_RECORDING
+        return
+    remote = parse_traceparent(traceparent)
+    if remote:
+        trace_id, parent_id, sampled = remote
+    else:
+        trace_id, parent_id, sampled = f"{random.getrandbits(128):032x}", None, random.random() < TRACING_SAMPLE_RATIO
+    if not sampled:
+        yield NON_RECORDING
+        return
+    with _record(Span(name, trace_id, parent_id, attributes)) as new:
+        yield new
+
+
+@contextmanager
+def _record(new: Span) -> Iterator[Span]:
+    token = _current.set(new)
+    try:
+        yield new
+    except BaseException as e:
+        new.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        new.end_ns = time.time_ns()
+        exporter.export(new)
+
+
+class TracingMiddleware:
+    """ASGI middleware: a root span per HTTP request, and a sampling profile when one is asked for.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streaming responses are
+    timed to their last byte and untraced, unprofiled requests pass straight
+    through.
+    """
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]
+                   if key in (b"traceparent", b"x-roo-profile")}
+        # The header that reads a profile back must not start another one
+        profiled = self.profiler is not None and self.profiler.requested(headers.get("x-roo-profile")) \
+            and not scope["path"].startswith("/debug/profiles/")
+        if exporter is None and not profiled:
+            return await self.app(scope, receive, send)
+
+        name = f"{scope['method']} {scope['path']}"
+        with root_span(name, traceparent=headers.get("traceparent"),
+                       method=scope["method"], path=scope["path"]) as current:
+            profile = self.profiler.start(name) if profiled else None
+
+            async def send_with_headers(message):
+                if message["type"] == "http.response.start":
+                    current.set_attribute("status_code", message["status"])
+                    extra = []
+                    if current.traceparent:
+                        extra.append((b"traceparent", current.traceparent.encode()))
+                    if profiled:
+                        location = f"/debug/profiles/{profile.id}" if profile else "busy"
+                        extra.append((b"x-roo-profile", location.encode()))
+                    message = {**message, "headers": list(message.get("headers", [])) + extra}
+                elif profile and message["type"] == "http.response.body" and not message.get("more_body"):
+                    # File the profile before the client can ask for it
+                    await asyncio.to_thread(self.profiler.stop, profile)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_headers)
+            finally:
+                if profile and not profile.finished.is_set():
+                    # Waits for the sampler thread, which must not hold up the loop
+                    await asyncio.to_thread(self.profiler.stop, profile)
@@ -24,6 +24,8 @@ import {
 import { ExternalLinkIcon, AddIcon, DeleteIcon } from '@chakra-ui/icons'
 
 const API_BASE = '/api'
+// Project list refresh interval when the live stream is unavailable
+const POLL_INTERVAL_MS = 10000
 
 function App() {
   const [projects, setProjects] = useState([])
@@ -73,9 +75,6 @@ function App() {
         duration: 5000,
         isClosable: true,
       })
-
-      // Refresh the project list
-      fetchProjects()
     } catch (error) {
       toast({
         title: 'Error creating project',
@@ -98,15 +97,12 @@ function App() {
       if (!response.ok) throw new Error('Failed to delete project')
 
       toast({
-        title: 'Project deleted',
-        description: `Workspace ${namespace} has been deleted`,
+        title: 'Deleting project',
+        description: `Workspace ${namespace} is being deleted`,
         status: 'info',
         duration: 3000,
         isClosable: true,
       })
-
-      // Refresh the project list
-      fetchProjects()
     } catch (error) {
       toast({
         title: 'Error deleting project',
@@ -124,15 +120,46 @@ function App() {
       case 'starting': return 'yellow'
       case 'creating': return 'blue'
       case 'pending': return 'orange'
+      case 'deleting': return 'red'
+      case 'sleeping': return 'purple'
       default: return 'gray'
     }
   }
 
   useEffect(() => {
-    fetchProjects()
-    // Auto-refresh every 10 seconds
-    const interval = setInterval(fetchProjects, 10000)
-    return () => clearInterval(interval)
+    // Live updates: a snapshot on connect, then created/updated/deleted deltas.
+    // EventSource reconnects by itself and every reconnect starts with a fresh snapshot.
+    const source = new EventSource(`${API_BASE}/projects/stream`)
+    let pollTimer = null
+
+    const upsert = (event) => {
+      const project = JSON.parse(event.data)
+      setProjects((current) => {
+        const others = current.filter((p) => p.namespace !== project.namespace)
+        return [...others, project].sort((a, b) => a.namespace.localeCompare(b.namespace))
+      })
+    }
+
+    source.addEventListener('snapshot', (event) => setProjects(JSON.parse(event.data)))
+    source.addEventListener('created', upsert)
+    source.addEventListener('updated', upsert)
+    source.addEventListener('deleted', (event) => {
+      const { namespace } = JSON.parse(event.data)
+      setProjects((current) => current.filter((p) => p.namespace !== namespace))
+    })
+    source.onerror = () => {
+      // A refused stream (e.g. 503 when the backend's project cache is disabled)
+      // is not retried by the browser: poll the project list instead
+      if (source.readyState === EventSource.CLOSED && pollTimer === null) {
+        fetchProjects()
+        pollTimer = setInterval(fetchProjects, POLL_INTERVAL_MS)
+      }
+    }
+
+    return () => {
+      source.close()
+      if (pollTimer !== null) clearInterval(pollTimer)
+    }
   }, [])
 
   return (
@@ -221,14 +248,15 @@ function App() {
                         </VStack>
 
                         <HStack spacing={2}>
-                          {project.status === 'ready' ? (
+                          {/* Opening a sleeping workspace wakes it up */}
+                          {project.status === 'ready' || project.status === 'sleeping' ? (
                             <Link href={project.url} isExternal>
                               <Button
                                 leftIcon={<ExternalLinkIcon />}
                                 colorScheme="green"
                                 size="sm"
                               >
-                                Open IDE
+                                {project.status === 'sleeping' ? 'Wake IDE' : 'Open IDE'}
                               </Button>
                             </Link>
                           ) : (
@@ -238,7 +266,7 @@ function App() {
                               size="sm"
                               isDisabled
                             >
-                              Starting...
+                              {project.status === 'deleting' ? 'Deleting...' : 'Starting...'}
                             </Button>
                           )}
 
@@ -248,6 +276,7 @@ function App() {
                             variant="outline"
                             size="sm"
                             onClick={() => deleteProject(project.namespace)}
+                            isDisabled={project.status === 'deleting'}
                           >
                             Delete
                           </Button>
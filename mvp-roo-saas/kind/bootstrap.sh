@@ -69,11 +69,6 @@ KUBECONFIG="$KUBECONFIG_PATH" kubectl wait --namespace ingress-nginx \
   --selector=app.kubernetes.io/component=controller \
   --timeout=90s
 
-echo "🎯 Applying cleanup CronJob..."
-KUBECONFIG="$KUBECONFIG_PATH" kubectl apply -f ../manifests/cleanup-cronjob.yaml
-
-echo "✅ Cleanup CronJob applied successfully"
-
 # Setup workspace template on kind nodes
 echo ""
 echo "📦 Setting up workspace template on kind nodes..."
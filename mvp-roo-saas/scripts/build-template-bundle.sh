@@ -0,0 +1,80 @@
+#!/bin/bash
+
+# Build the workspace template as a content-addressed bundle and install it on the kind nodes.
+#
+# The bundle holds the MCP server already built (node_modules and dist
+# included), the VS Code settings, the sample projects and the helper scripts.
+# Its version is a hash of every input file plus the Node.js image used to
+# build it, so rebuilding unchanged sources gives the same version and nothing
+# is copied again. Each version lives read-only in /opt/roo-templates/<version>
+# on every node. Workspaces mount it and link the MCP server instead of
+# copying it and running npm install.
+#
+# The version is written to manifests/template-bundle.version, where the
+# backend picks it up on its next start (or set TEMPLATE_BUNDLE explicitly).
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+WORKSPACE_DIR="$(cd "$SCRIPT_DIR/../../workspace" && pwd)"
+MANIFESTS_DIR="$(cd "$SCRIPT_DIR/../manifests" && pwd)"
+CLUSTER_NAME="roo"
+BUNDLE_ROOT="/opt/roo-templates"
+NODE_IMAGE="${NODE_IMAGE:-node:18-bookworm-slim}"
+
+INPUTS=()
+for INPUT in .mcp-servers/workspace-deployment/package.json \
+             .mcp-servers/workspace-deployment/package-lock.json \
+             .mcp-servers/workspace-deployment/tsconfig.json \
+             .mcp-servers/workspace-deployment/src \
+             .mcp-servers/workspace-deployment/templates \
+             .vscode-server/settings.json \
+             projects setup-mcp-server.sh mcp-dev.sh; do
+    [ -e "$WORKSPACE_DIR/$INPUT" ] && INPUTS+=("$INPUT")
+done
+
+VERSION=$(cd "$WORKSPACE_DIR" && {
+    echo "$NODE_IMAGE"
+    find "${INPUTS[@]}" -type f -print0 | LC_ALL=C sort -z | xargs -0 sha256sum
+} | sha256sum | cut -c1-16)
+echo "📦 Workspace template bundle $VERSION"
+
+NODES=$(kind get nodes --name="$CLUSTER_NAME")
+if [ -z "$NODES" ]; then
+    echo "❌ No nodes found in kind cluster '$CLUSTER_NAME'"
+    exit 1
+fi
+
+MISSING=""
+for NODE in $NODES; do
+    docker exec "$NODE" test -f "$BUNDLE_ROOT/$VERSION/BUNDLE_VERSION" || MISSING="$MISSING $NODE"
+done
+
+if [ -n "$MISSING" ]; then
+    STAGE=$(mktemp -d)
+    trap 'rm -rf "$STAGE"' EXIT
+    tar -C "$WORKSPACE_DIR" -cf - "${INPUTS[@]}" | tar -C "$STAGE" -xf -
+
+    echo "🏗️  Building the MCP server in $NODE_IMAGE..."
+    docker run --rm -v "$STAGE/.mcp-servers/workspace-deployment:/build" -w /build "$NODE_IMAGE" \
+        sh -c "npm install --no-audit --no-fund && npm run build && npm prune --omit=dev --no-audit --no-fund"
+    chmod +x "$STAGE"/*.sh 2>/dev/null || true
+    # Written last: a directory with this file is a complete bundle
+    echo "$VERSION" > "$STAGE/BUNDLE_VERSION"
+
+    for NODE in $MISSING; do
+        echo "📋 Installing bundle $VERSION on $NODE..."
+        # Copy next to the final path and rename, so pods never see half a bundle
+        docker exec "$NODE" sh -c "mkdir -p $BUNDLE_ROOT && rm -rf $BUNDLE_ROOT/.incoming-$VERSION"
+        docker cp "$STAGE/." "$NODE:$BUNDLE_ROOT/.incoming-$VERSION"
+        docker exec "$NODE" sh -c "chmod -R a-w $BUNDLE_ROOT/.incoming-$VERSION && \
+            mv $BUNDLE_ROOT/.incoming-$VERSION $BUNDLE_ROOT/$VERSION"
+    done
+else
+    echo "✅ Already installed on every node"
+fi
+
+echo "$VERSION" > "$MANIFESTS_DIR/template-bundle.version"
+echo ""
+echo "🎉 Template bundle $VERSION is ready"
+echo "🔄 Restart the backend (docker compose restart backend) so new workspaces use it"
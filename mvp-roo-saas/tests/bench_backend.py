@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Backend throughput benchmark against the fake Kubernetes API.
+
+Starts the fake API server (with optional latency and fault injection) and the
+backend under uvicorn, then runs a sequence of phases, each with a fixed number
+of operations spread over --concurrency client threads:
+
+  create   POST /api/projects
+  route    GET /api/routes/{namespace}, the shared gateway's per-request lookup
+           (only with --env ROO_ROUTING_MODE=gateway)
+  list     GET /api/projects
+  delete   DELETE /api/projects/{namespace} for the projects created above
+  mixed    a weighted random mix of the three (--mix create=2,list=6,delete=2)
+
+For every phase it reports req/s, p50/p95/p99 latency, error counts and the
+Kubernetes API calls per operation, by verb and resource, from the fake
+server's counters. Watches and lease renewals are not counted, and a phase
+that deletes waits for the queued teardowns to finish so their calls land in
+the phase that caused them.
+
+Results are written as a JSON baseline (tests/baselines/<commit>.json by
+default); --compare prints the change against an earlier baseline and exits
+non-zero if any phase regressed by more than --threshold.
+
+Usage:
+  python tests/bench_backend.py [--ops 200] [--concurrency 16] [--latency-ms 5]
+  python tests/bench_backend.py --compare tests/baselines/<commit>.json
+  python tests/bench_backend.py compare OLD.json NEW.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(TESTS_DIR, "baselines")
+sys.path.insert(0, TESTS_DIR)
+
+from fake_apiserver import FakeApiServer  # noqa: E402
+from load_health import free_port, start_backend  # noqa: E402
+
+PHASES = ("create", "route", "list", "delete", "mixed")
+DELETION_ANNOTATION = "roo.io/deletion-requested"
+# Metrics compared between baselines: name -> True if higher is better
+COMPARED = {"rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "api_calls_per_op": False}
+
+
+class Client:
+    """One keep-alive HTTP connection per thread, so the client is not what is measured"""
+
+    def __init__(self, base):
+        self.host, self.port = base.split("//", 1)[1].split(":")
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, int(self.port), timeout=120)
+        data = json.dumps(body).encode() if body is not None else None
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            payload = resp.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self.local.conn = None
+            raise
+        return resp.status, payload, time.perf_counter() - start
+
+
+def summarize(latencies, statuses, wall, ops, calls):
+    latencies = sorted(latencies)
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)  # noqa: E731
+    per_op = {key: round(count / ops, 2) for key, count in sorted(calls.items()) if count}
+    return {
+        "ops": ops,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "wall_s": round(wall, 3),
+        "rps": round(ops / wall, 1),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "api_calls_per_op": round(sum(calls.values()) / ops, 2),
+        "api_calls": per_op,
+    }
+
+
+class Benchmark:
+    def __init__(self, fake, client, concurrency, mix):
+        self.fake = fake
+        self.client = client
+        self.concurrency = concurrency
+        self.mix = mix
+        self.created = []
+        self._lock = threading.Lock()
+
+    def api_calls(self):
+        with self.fake._calls_lock:
+            # Watches and lease renewals run in the background whatever the load
+            return Counter({key: count for key, count in self.fake.calls.items()
+                            if not key.startswith("watch ") and not key.endswith(" leases")})
+
+    def deleting(self):
+        with self.fake.store.cond:
+            return sum(1 for ns in self.fake.store.objects.get("namespaces", {}).values()
+                       if DELETION_ANNOTATION in (ns["metadata"].get("annotations") or {}))
+
+    def wait_for_teardown(self, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while self.deleting() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def op_create(self):
+        status, payload, elapsed = self.client.request("POST", "/api/projects", {})
+        if status == 200:
+            with self._lock:
+                self.created.append(json.loads(payload)["namespace"])
+        return status, elapsed
+
+    def op_route(self):
+        with self._lock:
+            namespace = random.choice(self.created) if self.created else None
+        if namespace is None:
+            return self.op_list()
+        status, _, elapsed = self.client.request("GET", f"/api/routes/{namespace}")
+        return status, elapsed
+
+    def op_list(self):
+        status, _, elapsed = self.client.request("GET", "/api/projects")
+        return status, elapsed
+
+    def op_delete(self):
+        with self._lock:
+            namespace = self.created.pop(random.randrange(len(self.created))) if self.created else None
+        if namespace is None:
+            return self.op_list()
+        status, _, elapsed = self.client.request("DELETE", f"/api/projects/{namespace}")
+        return status, elapsed
+
+    def pick(self, phase):
+        if phase != "mixed":
+            return getattr(self, f"op_{phase}")
+        ops, weights = zip(*self.mix.items())
+        return getattr(self, f"op_{random.choices(ops, weights)[0]}")
+
+    def run_phase(self, phase, ops):
+        before_calls = self.api_calls()
+        latencies, statuses = [], Counter()
+        results_lock = threading.Lock()
+        counter = iter(range(ops))
+
+        def worker():
+            for _ in iter(lambda: next(counter, None), None):
+                status, elapsed = self.pick(phase)()
+                with results_lock:
+                    latencies.append(elapsed)
+                    statuses[status] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(self.concurrency)]:
+                future.result()
+        wall = time.perf_counter() - start
+        # Deletes return before teardown; charge its API calls to this phase
+        self.wait_for_teardown()
+        return summarize(latencies, statuses, wall, ops, self.api_calls() - before_calls)
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=TESTS_DIR, capture_output=True, text=True).stdout.strip()
+    revision = git("rev-parse", "--short", "HEAD") or "unknown"
+    return revision + ("-dirty" if git("status", "--porcelain", "--untracked-files=no") else "")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        op, _, weight = part.partition("=")
+        if op not in ("create", "list", "delete"):
+            raise argparse.ArgumentTypeError(f"unknown operation {op!r}")
+        mix[op] = float(weight or 1)
+    return mix
+
+
+def compare(old, new, threshold):
+    """Print per-phase changes; returns the regressions beyond threshold"""
+    regressions = []
+    print(f"{'phase':<8} {'metric':<17} {old['revision']:>14} {new['revision']:>14} {'change':>8}")
+    for phase in PHASES:
+        if phase not in old["phases"] or phase not in new["phases"]:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            a, b = old["phases"][phase][metric], new["phases"][phase][metric]
+            change = (b - a) / a if a else 0.0
+            worse = -change if higher_is_better else change
+            flag = " !" if worse > threshold else ""
+            if flag:
+                regressions.append(f"{phase} {metric}")
+            print(f"{phase:<8} {metric:<17} {a:>14} {b:>14} {change:>+7.0%}{flag}")
+    if old["config"] != new["config"]:
+        print("note: baselines were recorded with different settings")
+    return regressions
+
+
+def run(args):
+    fake = FakeApiServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, fault_rate=args.fault_rate,
+                         fault_statuses=[int(s) for s in args.fault_statuses.split(",")],
+                         fault_verbs=[v for v in args.fault_verbs.split(",") if v]).start()
+    with tempfile.NamedTemporaryFile("w", suffix=".kubeconfig", delete=False) as f:
+        f.write(fake.kubeconfig())
+    env = dict(item.split("=", 1) for item in args.env)
+    if env.get("ROO_ROUTING_MODE") != "gateway":
+        # Without the gateway there is no route table to look up
+        args.phases = [phase for phase in args.phases if phase != "route"]
+    proc, base = start_backend(f.name, free_port(), env)
+    try:
+        bench = Benchmark(fake, Client(base), args.concurrency, args.mix)
+        # Let the informers sync so list phases measure the steady state
+        time.sleep(args.warmup)
+        phases = {}
+        for phase in args.phases:
+            phases[phase] = bench.run_phase(phase, args.ops)
+            p = phases[phase]
+            print(f"{phase:<7} {p['rps']:>8.1f} req/s  p50 {p['p50_ms']:>7.1f} ms  p95 {p['p95_ms']:>7.1f} ms  "
+                  f"p99 {p['p99_ms']:>7.1f} ms  {p['api_calls_per_op']:>5.1f} API calls/op  {p['errors']} errors")
+    finally:
+        proc.terminate()
+        proc.wait()
+        fake.stop()
+        os.unlink(f.name)
+
+    return {
+        "revision": git_revision(),
+        "recorded_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "config": {"ops": args.ops, "concurrency": args.concurrency, "latency_ms": args.latency_ms,
+                   "jitter_ms": args.jitter_ms, "fault_rate": args.fault_rate, "fault_statuses": args.fault_statuses,
+                   "fault_verbs": args.fault_verbs, "mix": args.mix, "env": args.env},
+        "phases": phases,
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="bench_backend.py compare")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=0.2)
+        args = parser.parse_args(sys.argv[2:])
+        with open(args.old) as a, open(args.new) as b:
+            sys.exit(1 if compare(json.load(a), json.load(b), args.threshold) else 0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=200, help="operations per phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--phases", type=lambda v: v.split(","), default=list(PHASES))
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("create=2,list=6,delete=2"))
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--fault-statuses", default="500", help="comma-separated, e.g. 404,409,500")
+    parser.add_argument("--fault-verbs", default="", help="comma-separated, e.g. create,patch (default: all)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="backend environment")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to wait for informers to sync")
+    parser.add_argument("--output", help="baseline file to write (default: tests/baselines/<revision>.json)")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare the results against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    result = run(args)
+    if not args.no_save:
+        output = args.output or os.path.join(BASELINE_DIR, f"{result['revision']}.json")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {os.path.relpath(output)}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), result, args.threshold)
+        if regressions:
+            print(f"regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
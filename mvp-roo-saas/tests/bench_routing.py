@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: cost of routing and of route updates, per-workspace Ingress vs shared gateway.
+
+"ingress" models what ingress-nginx does with one regex Ingress per workspace:
+every create or delete regenerates the location blocks for all workspaces
+before the reload (the reload itself is not included), and a request is matched
+against the regex locations in order. "gateway" uses the backend's RouteTable:
+an update touches one entry and a lookup is a dict read.
+
+Usage: python tests/bench_routing.py [workspaces ...]   (default 100 1000 5000)
+"""
+import os
+import random
+import re
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from routes import RouteTable  # noqa: E402
+
+LOCATION = """
+    location ~* "^/{ns}(/|$)(.*)" {{
+        set $namespace "{ns}";
+        set $service_name "vscode-server";
+        set $service_port "80";
+        rewrite "(?i)/{ns}(/|$)(.*)" /$2 break;
+        proxy_pass http://upstream_balancer;
+    }}
+"""
+
+
+def ingress_config(namespaces):
+    return "".join(LOCATION.format(ns=ns) for ns in namespaces)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench(count, lookups=2000):
+    namespaces = [f"proj-{i:013d}" for i in range(count)]
+    paths = [f"/{random.choice(namespaces)}/static/app.js" for _ in range(lookups)]
+
+    # Each change re-renders every workspace's location block
+    updates = max(3, 20000 // count)
+    ingress_update = timed(lambda: ingress_config(namespaces), updates)
+    locations = [re.compile(f"^/{ns}(/|$)(.*)", re.IGNORECASE) for ns in namespaces]
+
+    def ingress_match():
+        for path in paths:
+            for location in locations:
+                if location.match(path):
+                    break
+    ingress_lookup = timed(ingress_match, 1) / lookups
+
+    table = RouteTable()
+    table.replace(namespaces)
+    extra = [f"proj-x{i:012d}" for i in range(updates)]
+
+    def gateway_churn():
+        for ns in extra:
+            table.add([ns])
+            table.remove([ns])
+    gateway_update = timed(gateway_churn, 1) / (2 * updates)
+
+    def gateway_match():
+        for path in paths:
+            table.lookup(path.split("/", 2)[1])
+    gateway_lookup = timed(gateway_match, 1) / lookups
+
+    print(f"{count:>6} workspaces  update: ingress {ingress_update:10.1f} us  gateway {gateway_update:6.2f} us   "
+          f"lookup: ingress {ingress_lookup:8.1f} us  gateway {gateway_lookup:5.2f} us")
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000]
+    for count in counts:
+        bench(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/bin/bash
+# Workspace start-to-ready benchmark on the kind cluster.
+#
+# Applies the workspace manifests into throwaway namespaces and times each one
+# from apply until the vscode-server Deployment is Available, for:
+#   old - the template from the first commit, which installs every tool on start
+#   new - the current template, running the prebuilt roo-workspace image
+#
+# Usage: bash tests/bench_startup.sh [runs]
+#   OLD_TEMPLATE=path  use another file as the "old" workspace template
+#   TIMEOUT=600s       give up on a workspace after this long
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+ROOT_DIR="$(cd "$SCRIPT_DIR/.." && pwd)"
+RUNS="${1:-3}"
+TIMEOUT="${TIMEOUT:-600s}"
+export KUBECONFIG="${KUBECONFIG:-$ROOT_DIR/kind/kubeconfig-host}"
+
+RBAC_TEMPLATE="$ROOT_DIR/manifests/rbac-template.yaml"
+NEW_TEMPLATE="$ROOT_DIR/manifests/workspace-template.yaml"
+OLD_TEMPLATE="${OLD_TEMPLATE:-}"
+WORK_DIR=$(mktemp -d)
+trap 'rm -rf "$WORK_DIR"' EXIT
+
+if [ -z "$OLD_TEMPLATE" ]; then
+    OLD_TEMPLATE="$WORK_DIR/workspace-template.old.yaml"
+    BASE_COMMIT=$(git -C "$ROOT_DIR" rev-list --max-parents=0 HEAD | tail -1)
+    git -C "$ROOT_DIR" show "$BASE_COMMIT:mvp-roo-saas/manifests/workspace-template.yaml" > "$OLD_TEMPLATE"
+fi
+
+if ! docker exec roo-control-plane crictl images 2>/dev/null | grep -q roo-workspace; then
+    echo "⚠️  roo-workspace image not loaded into kind; run 'make workspace-image' first"
+    exit 1
+fi
+
+# Prints seconds from apply to Available for one workspace
+time_workspace() {
+    local template="$1" ns="$2" start end
+    start=$(date +%s.%N)
+    { cat "$template"; echo "---"; cat "$RBAC_TEMPLATE"; } | sed -e "s/\${NAMESPACE}/$ns/g" -e "s/\${WAKER_HOST}/backend/g" | kubectl apply -f - > /dev/null
+    kubectl wait -n "$ns" --for=condition=Available deployment/vscode-server --timeout="$TIMEOUT" > /dev/null
+    end=$(date +%s.%N)
+    awk -v s="$start" -v e="$end" 'BEGIN { printf "%.1f\n", e - s }'
+}
+
+cleanup_workspace() {
+    local ns="$1"
+    kubectl delete namespace "$ns" --wait=false > /dev/null 2>&1 || true
+    kubectl delete clusterrole,clusterrolebinding "workspace-cluster-reader-$ns" > /dev/null 2>&1 || true
+}
+
+# Prints "min p50 max mean" for a list of numbers
+summarize() {
+    sort -n | awk '{ v[NR] = $1; sum += $1 } END {
+        printf "min %6.1fs  p50 %6.1fs  max %6.1fs  mean %6.1fs\n", v[1], v[int((NR + 1) / 2)], v[NR], sum / NR }'
+}
+
+for VARIANT in old new; do
+    TEMPLATE="$OLD_TEMPLATE"
+    [ "$VARIANT" = "new" ] && TEMPLATE="$NEW_TEMPLATE"
+    : > "$WORK_DIR/$VARIANT.txt"
+    for RUN in $(seq 1 "$RUNS"); do
+        NS="bench-$VARIANT-$RUN-$(date +%s)"
+        if SECONDS_TO_READY=$(time_workspace "$TEMPLATE" "$NS"); then
+            echo "  $VARIANT run $RUN: ${SECONDS_TO_READY}s"
+            echo "$SECONDS_TO_READY" >> "$WORK_DIR/$VARIANT.txt"
+        else
+            echo "  $VARIANT run $RUN: not ready within $TIMEOUT"
+        fi
+        cleanup_workspace "$NS"
+    done
+done
+
+echo ""
+echo "📊 Start-to-ready over $RUNS runs:"
+for VARIANT in old new; do
+    if [ -s "$WORK_DIR/$VARIANT.txt" ]; then
+        echo "  $VARIANT: $(summarize < "$WORK_DIR/$VARIANT.txt")"
+    else
+        echo "  $VARIANT: no successful runs"
+    fi
+done
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: per-project manifest render cost, before and after template compilation.
+
+"before" repeats what apply_manifest() used to do for every request: read both
+templates from disk, substitute ${NAMESPACE} as text, parse the YAML and build
+the kubernetes client model objects. "after" renders from the compiled
+TemplateStore.
+
+Usage: python tests/bench_templates.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import yaml  # noqa: E402
+from kubernetes import client  # noqa: E402
+
+import templates  # noqa: E402
+
+TEMPLATE_NAMES = ["rbac-template.yaml", "workspace-template.yaml"]
+
+api_client = client.ApiClient()
+
+
+class _Response:
+    """Just enough of a urllib3 response for ApiClient.deserialize()"""
+
+    def __init__(self, doc):
+        self.data = json.dumps(doc)
+
+
+def render_legacy(namespace):
+    text = []
+    for name in TEMPLATE_NAMES:
+        with open(templates.resolve_template_path(name)) as f:
+            text.append(f.read().replace("${NAMESPACE}", namespace))
+    documents = [doc for doc in yaml.safe_load_all("\n---\n".join(text)) if doc]
+    return [api_client.deserialize(_Response(doc), f"V1{doc['kind']}") for doc in documents]
+
+
+def render_compiled(store, namespace):
+    return store.render(TEMPLATE_NAMES, {"NAMESPACE": namespace})
+
+
+def bench(label, fn, iterations):
+    fn("proj-warmup")
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(f"proj-{i:06d}")
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / iterations * 1e6
+    print(f"{label:<10} {iterations:>6} renders  {per_call_us:10.1f} us/project")
+    return per_call_us
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    store = templates.TemplateStore()
+
+    before = bench("legacy", render_legacy, iterations)
+    after = bench("compiled", lambda ns: render_compiled(store, ns), iterations)
+    print(f"speedup    {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
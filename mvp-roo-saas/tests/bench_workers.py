@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Backend request throughput with 1 to N worker processes.
+
+Starts the fake Kubernetes API, seeds it with --projects workspaces through the
+backend, then for each worker count starts ``python main.py`` with
+BACKEND_WORKERS set and drives read endpoints (GET /api/projects by default)
+from --clients load generator processes, each with --concurrency keep-alive
+connections, for --duration seconds. Reports req/s per worker count and the
+speedup over the first.
+
+Scaling is bounded by the cores available to the backend and the load
+generators together: on a machine with fewer cores than workers plus clients
+the extra workers only add scheduling overhead.
+
+Usage: python tests/bench_workers.py [--workers 1,2,4] [--duration 10] [--clients 4] [--concurrency 8]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS_DIR)
+
+from bench_backend import Client  # noqa: E402
+from fake_apiserver import FakeApiServer  # noqa: E402
+from load_health import free_port, start_backend  # noqa: E402
+
+
+def generate_load(base, paths, concurrency, duration, results):
+    """One load generator process: concurrency threads requesting paths round-robin until the deadline"""
+    client = Client(base)
+    deadline = time.monotonic() + duration
+    counts = [[0, 0] for _ in range(concurrency)]
+
+    def worker(slot):
+        i = slot
+        while time.monotonic() < deadline:
+            try:
+                status, _, _ = client.request("GET", paths[i % len(paths)])
+            except OSError:
+                status = 599
+            counts[slot][0 if status < 400 else 1] += 1
+            i += 1
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((sum(ok for ok, _ in counts), sum(errors for _, errors in counts)))
+
+
+def measure(kubeconfig, workers, args):
+    env = dict(item.split("=", 1) for item in args.env)
+    proc, base = start_backend(kubeconfig, free_port(), env, workers=workers)
+    try:
+        # Informers sync and follower workers pick up the first registry pass
+        time.sleep(args.warmup)
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=generate_load,
+                                           args=(base, args.paths, args.concurrency, args.duration, results))
+                   for _ in range(args.clients)]
+        start = time.monotonic()
+        for client in clients:
+            client.start()
+        totals = [results.get() for _ in clients]
+        wall = time.monotonic() - start
+        for client in clients:
+            client.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+    ok = sum(ok for ok, _ in totals)
+    return {"workers": workers, "rps": ok / wall, "errors": sum(errors for _, errors in totals)}
+
+
+def seed(kubeconfig, count):
+    proc, base = start_backend(kubeconfig, free_port(), {"K8S_QPS": "0", "ADMISSION_MAX_INFLIGHT": "64",
+                                                         "REGISTRY_ENABLED": "false"})
+    try:
+        client = Client(base)
+        for _ in range(count):
+            client.request("POST", "/api/projects", {})
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--warmup", type=float, default=6.0)
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="connections per load generator")
+    parser.add_argument("--projects", type=int, default=50, help="workspaces to seed the fake cluster with")
+    parser.add_argument("--paths", default="/api/projects", help="comma-separated GET paths, requested round-robin")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake API server latency per call")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="backend environment")
+    args = parser.parse_args()
+    args.paths = args.paths.split(",")
+
+    fake = FakeApiServer(latency_ms=args.latency_ms).start()
+    with tempfile.NamedTemporaryFile("w", suffix=".kubeconfig", delete=False) as f:
+        f.write(fake.kubeconfig())
+    try:
+        seed(f.name, args.projects)
+        print(f"{os.cpu_count()} CPUs, {args.clients} load generators x {args.concurrency} connections, "
+              f"GET {', '.join(args.paths)}")
+        baseline = None
+        for workers in (int(n) for n in args.workers.split(",")):
+            result = measure(f.name, workers, args)
+            baseline = baseline or result["rps"]
+            print(f"{workers:>2} workers  {result['rps']:>8.1f} req/s  x{result['rps'] / baseline:.2f}  "
+                  f"{result['errors']} errors")
+    finally:
+        fake.stop()
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""In-memory stand-in for the Kubernetes API server, for load tests and benchmarks.
+
+It stores whatever objects it is sent, generically, for both core (/api/v1) and
+grouped (/apis/<group>/<version>) resources. It supports create, get, list
+(label, including set-based, and field selectors), replace, merge/strategic/JSON
+patch, delete, delete-collection and watch. Namespace deletion cascades to the
+objects inside the namespace. Deployments report ready replicas after a
+configurable delay, and optional latency and error injection (optionally
+limited to some verbs, e.g. only creates) make client behaviour under load
+observable.
+
+Run standalone:   python tests/fake_apiserver.py --port 18080 --latency-ms 20
+Or embed:         server = FakeApiServer(latency_ms=20).start(); ...; server.stop()
+
+GET /_fake/stats returns per-verb request counts; POST /_fake/reset clears them.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SYSTEM_NAMESPACES = ("default", "kube-system")
+KINDS = {
+    "namespaces": "Namespace",
+    "pods": "Pod",
+    "nodes": "Node",
+    "services": "Service",
+    "serviceaccounts": "ServiceAccount",
+    "configmaps": "ConfigMap",
+    "secrets": "Secret",
+    "persistentvolumeclaims": "PersistentVolumeClaim",
+    "events": "Event",
+    "deployments": "Deployment",
+    "ingresses": "Ingress",
+    "roles": "Role",
+    "rolebindings": "RoleBinding",
+    "clusterroles": "ClusterRole",
+    "clusterrolebindings": "ClusterRoleBinding",
+    "leases": "Lease",
+}
+
+CLUSTER_SCOPED = {"namespaces", "nodes", "clusterroles", "clusterrolebindings", "persistentvolumes"}
+
+EVENT_HISTORY = 10000
+
+# Injected faults look like the errors real clients would see for these codes
+FAULT_REASONS = {404: "NotFound", 409: "AlreadyExists", 429: "TooManyRequests", 503: "ServiceUnavailable"}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _status(code, reason, message):
+    return {"kind": "Status", "apiVersion": "v1", "metadata": {}, "status": "Failure",
+            "message": message, "reason": reason, "code": code}
+
+
+class ApiError(Exception):
+    def __init__(self, code, reason, message, headers=None):
+        super().__init__(message)
+        self.body = _status(code, reason, message)
+        self.code = code
+        self.headers = headers or {}
+
+
+def _merge(target, patch):
+    """RFC 7386 merge patch; strategic merge patches are treated the same way"""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = _merge(result.get(key), value)
+    return result
+
+
+def _json_patch(target, operations):
+    """Minimal RFC 6902 support: add, replace and remove"""
+    doc = json.loads(json.dumps(target))
+    for op in operations:
+        parts = [p.replace("~1", "/").replace("~0", "~") for p in op["path"].split("/")[1:]]
+        parent = doc
+        for part in parts[:-1]:
+            parent = parent[int(part)] if isinstance(parent, list) else parent.setdefault(part, {})
+        last = parts[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(index, op["value"])
+            elif op["op"] == "replace":
+                parent[index] = op["value"]
+            elif op["op"] == "remove":
+                parent.pop(index)
+        else:
+            if op["op"] in ("add", "replace"):
+                parent[last] = op["value"]
+            elif op["op"] == "remove":
+                parent.pop(last, None)
+    return doc
+
+
+SET_TERM_RE = re.compile(r"^\s*([\w./-]+)\s+(in|notin)\s+\((.*)\)\s*$")
+
+
+def _match_labels(labels, selector):
+    if not selector:
+        return True
+    # Commas inside "key in (a,b)" do not separate terms
+    for term in re.split(r",(?![^(]*\))", selector):
+        term = term.strip()
+        if not term:
+            continue
+        set_term = SET_TERM_RE.match(term)
+        if set_term:
+            key, operator, values = set_term.groups()
+            present = labels.get(key) in {value.strip() for value in values.split(",")}
+            if present != (operator == "in"):
+                return False
+        elif "!=" in term:
+            key, value = term.split("!=", 1)
+            if labels.get(key.strip()) == value.strip():
+                return False
+        elif "=" in term:
+            key, value = term.replace("==", "=").split("=", 1)
+            if labels.get(key.strip()) != value.strip():
+                return False
+        elif term.startswith("!"):
+            if term[1:] in labels:
+                return False
+        elif term not in labels:
+            return False
+    return True
+
+
+def _field(obj, path):
+    for part in path.split("."):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(part)
+    return obj
+
+
+def _match_fields(obj, selector):
+    if not selector:
+        return True
+    for term in selector.split(","):
+        if "!=" in term:
+            key, value = term.split("!=", 1)
+            if str(_field(obj, key)) == value:
+                return False
+        elif "=" in term:
+            key, value = term.replace("==", "=").split("=", 1)
+            if str(_field(obj, key)) != value:
+                return False
+    return True
+
+
+class Store:
+    """Thread-safe object store with a bounded per-resource event history for watches"""
+
+    def __init__(self, ready_delay=0.0, terminate_delay=0.0):
+        self.ready_delay = ready_delay
+        self.terminate_delay = terminate_delay
+        self.objects = {}  # resource -> {(namespace, name): obj}
+        self.events = {}  # resource -> deque[(rv, type, obj)]
+        self.rv = 0
+        self.cond = threading.Condition()
+        self._timers = []
+        # Namespaces every cluster has; the backend keeps its coordination leases in "default"
+        for name in SYSTEM_NAMESPACES:
+            self.objects.setdefault("namespaces", {})[("", name)] = {
+                "apiVersion": "v1", "kind": "Namespace",
+                "metadata": {"name": name, "uid": str(uuid.uuid4()), "creationTimestamp": _now(),
+                             "resourceVersion": self._bump()},
+                "status": {"phase": "Active"},
+            }
+
+    def _bump(self):
+        self.rv += 1
+        return str(self.rv)
+
+    def _record(self, resource, event_type, obj, previous_labels=None):
+        """Append a watch event; previous_labels lets watchers see selector transitions"""
+        history = self.events.setdefault(resource, deque(maxlen=EVENT_HISTORY))
+        if previous_labels is None:
+            previous_labels = obj["metadata"].get("labels") or {}
+        history.append((int(obj["metadata"]["resourceVersion"]), event_type, json.loads(json.dumps(obj)),
+                        dict(previous_labels)))
+        self.cond.notify_all()
+
+    def _later(self, delay, fn, *args):
+        if delay <= 0:
+            fn(*args)
+            return
+        timer = threading.Timer(delay, fn, args)
+        timer.daemon = True
+        self._timers.append(timer)
+        timer.start()
+
+    def create(self, resource, namespace, body):
+        with self.cond:
+            meta = body.setdefault("metadata", {})
+            name = meta.get("name")
+            if not name and meta.get("generateName"):
+                name = meta["generateName"] + uuid.uuid4().hex[:5]
+                meta["name"] = name
+            if namespace is not None and resource not in CLUSTER_SCOPED:
+                if ("", namespace) not in self.objects.get("namespaces", {}):
+                    raise ApiError(404, "NotFound", f'namespaces "{namespace}" not found')
+                ns_obj = self.objects["namespaces"][("", namespace)]
+                if ns_obj.get("status", {}).get("phase") == "Terminating":
+                    raise ApiError(403, "Forbidden", f"namespace {namespace} is being terminated")
+                meta["namespace"] = namespace
+            key = (namespace or "", name)
+            bucket = self.objects.setdefault(resource, {})
+            if key in bucket:
+                raise ApiError(409, "AlreadyExists", f'{resource} "{name}" already exists')
+            meta["uid"] = str(uuid.uuid4())
+            meta["creationTimestamp"] = _now()
+            meta["resourceVersion"] = self._bump()
+            body.setdefault("kind", KINDS.get(resource, resource.capitalize()))
+            if resource == "namespaces":
+                body["status"] = {"phase": "Active"}
+            if resource == "deployments":
+                body["status"] = {"replicas": body.get("spec", {}).get("replicas", 1)}
+            bucket[key] = body
+            self._record(resource, "ADDED", body)
+        if resource == "deployments":
+            self._later(self.ready_delay, self._mark_ready, namespace, name, meta["uid"])
+        return body
+
+    def _mark_ready(self, namespace, name, uid):
+        with self.cond:
+            obj = self.objects.get("deployments", {}).get((namespace, name))
+            if not obj or obj["metadata"]["uid"] != uid:
+                return
+            replicas = obj.get("spec", {}).get("replicas", 1)
+            obj["status"] = {"replicas": replicas, "readyReplicas": replicas,
+                             "availableReplicas": replicas, "updatedReplicas": replicas}
+            obj["metadata"]["resourceVersion"] = self._bump()
+            self._record("deployments", "MODIFIED", obj)
+
+    def get(self, resource, namespace, name):
+        with self.cond:
+            obj = self.objects.get(resource, {}).get((namespace or "", name))
+            if obj is None:
+                raise ApiError(404, "NotFound", f'{resource} "{name}" not found')
+            return obj
+
+    def list(self, resource, namespace, label_selector, field_selector, limit=None):
+        with self.cond:
+            items = [
+                obj for (ns, _), obj in self.objects.get(resource, {}).items()
+                if (namespace is None or ns == namespace)
+                and _match_labels(obj["metadata"].get("labels") or {}, label_selector)
+                and _match_fields(obj, field_selector)
+            ]
+            if limit:
+                items = items[:limit]
+            return items, str(self.rv)
+
+    def replace(self, resource, namespace, name, body):
+        with self.cond:
+            current = self.get(resource, namespace, name)
+            expected = body.get("metadata", {}).get("resourceVersion")
+            if expected and expected != current["metadata"]["resourceVersion"]:
+                raise ApiError(409, "Conflict", "the object has been modified; please apply your changes to the latest version")
+            for field in ("uid", "creationTimestamp"):
+                body.setdefault("metadata", {})[field] = current["metadata"][field]
+            if namespace:
+                body["metadata"]["namespace"] = namespace
+            body["metadata"]["resourceVersion"] = self._bump()
+            body.setdefault("kind", current.get("kind"))
+            self.objects[resource][(namespace or "", name)] = body
+            self._record(resource, "MODIFIED", body, current["metadata"].get("labels") or {})
+            return body
+
+    def patch(self, resource, namespace, name, patch, content_type):
+        with self.cond:
+            current = self.get(resource, namespace, name)
+            if "json-patch" in content_type:
+                updated = _json_patch(current, patch)
+            else:
+                expected = (patch.get("metadata") or {}).get("resourceVersion")
+                if expected and expected != current["metadata"]["resourceVersion"]:
+                    raise ApiError(409, "Conflict", "the object has been modified; please apply your changes to the latest version")
+                updated = _merge(current, patch)
+            updated["metadata"]["resourceVersion"] = self._bump()
+            self.objects[resource][(namespace or "", name)] = updated
+            self._record(resource, "MODIFIED", updated, current["metadata"].get("labels") or {})
+            if resource == "deployments" and updated.get("spec", {}).get("replicas") != current.get("spec", {}).get("replicas"):
+                replicas = updated["spec"].get("replicas", 1)
+                updated["status"] = {"replicas": replicas}
+                self._later(self.ready_delay, self._mark_ready, namespace, name, updated["metadata"]["uid"])
+            return updated
+
+    def delete(self, resource, namespace, name):
+        with self.cond:
+            obj = self.get(resource, namespace, name)
+            if resource == "namespaces":
+                if obj.get("status", {}).get("phase") == "Terminating":
+                    return obj
+                obj["status"] = {"phase": "Terminating"}
+                obj["metadata"]["deletionTimestamp"] = _now()
+                obj["metadata"]["resourceVersion"] = self._bump()
+                self._record(resource, "MODIFIED", obj)
+            else:
+                self._remove(resource, namespace or "", name)
+        if resource == "namespaces":
+            self._later(self.terminate_delay, self._finalize_namespace, name)
+        return obj
+
+    def _remove(self, resource, namespace, name):
+        obj = self.objects.get(resource, {}).pop((namespace, name), None)
+        if obj is not None:
+            obj["metadata"]["resourceVersion"] = self._bump()
+            self._record(resource, "DELETED", obj)
+
+    def _finalize_namespace(self, name):
+        with self.cond:
+            for resource, bucket in self.objects.items():
+                if resource in CLUSTER_SCOPED:
+                    continue
+                for key in [k for k in bucket if k[0] == name]:
+                    self._remove(resource, key[0], key[1])
+            self._remove("namespaces", "", name)
+
+    def events_since(self, resource, rv):
+        """Events after rv, or None if rv has fallen out of the retained history"""
+        history = self.events.get(resource, ())
+        if len(history) == EVENT_HISTORY and rv < history[0][0]:
+            return None
+        return [e for e in history if e[0] > rv]
+
+
+class FakeApiServer:
+    """Threaded HTTP server wrapping a Store, with latency and fault injection"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0,
+                 fault_rate=0.0, fault_statuses=(500,), ready_delay=0.0, terminate_delay=0.0, fault_verbs=None):
+        self.store = Store(ready_delay=ready_delay, terminate_delay=terminate_delay)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fault_rate = fault_rate
+        self.fault_statuses = tuple(fault_statuses)
+        # None injects faults into every verb except watch
+        self.fault_verbs = set(fault_verbs) if fault_verbs else None
+        self.calls = Counter()
+        self._calls_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def kubeconfig(self):
+        """A kubeconfig document pointing at this server"""
+        return (
+            "apiVersion: v1\nkind: Config\n"
+            f"clusters:\n- cluster: {{server: \"{self.url}\"}}\n  name: fake\n"
+            "contexts:\n- context: {cluster: fake, user: fake}\n  name: fake\n"
+            "current-context: fake\n"
+            "users:\n- name: fake\n  user: {token: fake}\n"
+        )
+
+    def count(self, key):
+        with self._calls_lock:
+            self.calls[key] += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Buffer writes so headers and body leave in one segment (no delayed-ACK stalls)
+            wbufsize = 64 * 1024
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+            def _send(self, code, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                try:
+                    body = self._body() if method in ("POST", "PUT", "PATCH") else None
+                    if url.path.startswith("/_fake/"):
+                        return self._control(method, url.path)
+                    resource, namespace, name, subresource = _parse_path(url.path)
+                    watching = method == "GET" and query.get("watch", "").lower() in ("true", "1")
+                    verb = "watch" if watching else _verb(method, name)
+                    server.count(f"{verb} {resource}")
+                    if server.latency_ms or server.jitter_ms:
+                        time.sleep(max(0.0, server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms)) / 1000)
+                    faultable = not watching and (server.fault_verbs is None or verb in server.fault_verbs)
+                    if server.fault_rate and faultable and random.random() < server.fault_rate:
+                        code = random.choice(server.fault_statuses)
+                        headers = {"Retry-After": "1"} if code == 429 else None
+                        raise ApiError(code, FAULT_REASONS.get(code, "InjectedFault"), f"injected {code}", headers)
+                    if watching:
+                        return self._watch(resource, namespace, query)
+                    self._send(*self._dispatch(method, resource, namespace, name, subresource, query, body))
+                except ApiError as e:
+                    self._send(e.code, e.body, e.headers)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _dispatch(self, method, resource, namespace, name, subresource, query, body):
+                store = server.store
+                if subresource == "scale" and resource == "deployments":
+                    if method == "GET":
+                        obj = store.get(resource, namespace, name)
+                    else:
+                        replicas = (body.get("spec") or {}).get("replicas")
+                        obj = store.patch(resource, namespace, name, {"spec": {"replicas": replicas}}, "merge")
+                    return 200, {"kind": "Scale", "apiVersion": "autoscaling/v1", "metadata": obj["metadata"],
+                                 "spec": {"replicas": obj["spec"].get("replicas", 1)},
+                                 "status": {"replicas": obj.get("status", {}).get("replicas", 0)}}
+                if method == "GET" and name is None:
+                    items, rv = store.list(resource, namespace, query.get("labelSelector"),
+                                           query.get("fieldSelector"), int(query.get("limit") or 0) or None)
+                    return 200, {"kind": KINDS.get(resource, "Object") + "List", "apiVersion": "v1",
+                                 "metadata": {"resourceVersion": rv}, "items": items}
+                if method == "GET":
+                    return 200, store.get(resource, namespace, name)
+                if method == "POST":
+                    return 201, store.create(resource, namespace, body)
+                if method == "PUT":
+                    return 200, store.replace(resource, namespace, name, body)
+                if method == "PATCH":
+                    return 200, store.patch(resource, namespace, name, body, self.headers.get("Content-Type", ""))
+                if method == "DELETE" and name is None:
+                    items, _ = store.list(resource, namespace, query.get("labelSelector"), query.get("fieldSelector"))
+                    for item in items:
+                        store.delete(resource, namespace, item["metadata"]["name"])
+                    return 200, {"kind": KINDS.get(resource, "Object") + "List", "apiVersion": "v1",
+                                 "metadata": {}, "items": items}
+                if method == "DELETE":
+                    return 200, store.delete(resource, namespace, name)
+                raise ApiError(405, "MethodNotAllowed", method)
+
+            def _watch(self, resource, namespace, query):
+                store = server.store
+                rv = int(query.get("resourceVersion") or 0)
+                deadline = time.monotonic() + float(query.get("timeoutSeconds") or 300)
+                label_selector = query.get("labelSelector")
+                field_selector = query.get("fieldSelector")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    while time.monotonic() < deadline:
+                        with store.cond:
+                            events = store.events_since(resource, rv)
+                            if events == []:
+                                store.cond.wait(timeout=min(1.0, max(0.0, deadline - time.monotonic())))
+                                events = store.events_since(resource, rv)
+                        if events is None:
+                            self._chunk({"type": "ERROR", "object": _status(410, "Expired", "too old resource version")})
+                            break
+                        for event_rv, event_type, obj, previous_labels in events:
+                            rv = event_rv
+                            meta = obj["metadata"]
+                            if namespace is not None and meta.get("namespace") != namespace:
+                                continue
+                            if not _match_fields(obj, field_selector):
+                                continue
+                            # Like the real watch cache, an object moving into or out of
+                            # the label selector is reported as ADDED or DELETED
+                            matches = _match_labels(meta.get("labels") or {}, label_selector)
+                            matched = _match_labels(previous_labels, label_selector)
+                            if event_type == "MODIFIED" and matches != matched:
+                                event_type = "ADDED" if matches else "DELETED"
+                            elif not matches:
+                                continue
+                            self._chunk({"type": event_type, "object": obj})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                self.close_connection = True
+
+            def _chunk(self, event):
+                data = (json.dumps(event) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _control(self, method, path):
+                if path == "/_fake/stats":
+                    with server._calls_lock:
+                        return self._send(200, dict(server.calls))
+                if path == "/_fake/reset" and method == "POST":
+                    with server._calls_lock:
+                        server.calls.clear()
+                    return self._send(200, {})
+                raise ApiError(404, "NotFound", path)
+
+        return Handler
+
+
+_PATH_RE = re.compile(r"^/(?:api/v1|apis/[^/]+/[^/]+)(?:/namespaces/(?P<ns>[^/]+))?(?:/(?P<rest>.*))?$")
+
+
+def _parse_path(path):
+    """Split an API path into (resource, namespace, name, subresource)"""
+    match = _PATH_RE.match(path.rstrip("/"))
+    if not match:
+        raise ApiError(404, "NotFound", path)
+    namespace, rest = match.group("ns"), match.group("rest")
+    if namespace is not None and not rest:
+        # /api/v1/namespaces/<name> is the namespace object itself
+        return "namespaces", None, namespace, None
+    if rest is None:
+        return "namespaces", None, None, None
+    parts = rest.split("/")
+    resource = parts[0]
+    name = parts[1] if len(parts) > 1 else None
+    subresource = parts[2] if len(parts) > 2 else None
+    return resource, namespace, name, subresource
+
+
+def _verb(method, name):
+    return {"GET": "get" if name else "list", "POST": "create", "PUT": "update",
+            "PATCH": "patch", "DELETE": "delete" if name else "deletecollection"}[method]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--fault-statuses", default="500", help="comma-separated, e.g. 404,409,429,500")
+    parser.add_argument("--fault-verbs", default="", help="comma-separated verbs to fault, e.g. create,patch (default: all)")
+    parser.add_argument("--ready-delay", type=float, default=0.0, help="seconds before deployments report ready")
+    parser.add_argument("--terminate-delay", type=float, default=0.0, help="seconds namespaces stay Terminating")
+    args = parser.parse_args()
+
+    server = FakeApiServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.fault_rate,
+                           [int(s) for s in args.fault_statuses.split(",")], args.ready_delay, args.terminate_delay,
+                           [v for v in args.fault_verbs.split(",") if v])
+    print(f"Fake Kubernetes API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Load test: /health latency while project creates are in flight.
+
+Starts the fake Kubernetes API (with per-call latency) and the backend under
+uvicorn, measures /health on an idle backend, then again while N concurrent
+POST /api/projects calls are running. With Kubernetes I/O off the event loop
+both distributions should look the same.
+
+The backend is started with its admission limits raised to --admit-inflight
+(by default --creates), so every create really is in flight at once. Creates
+beyond the limits are refused with 429, which are counted separately rather
+than failing the run.
+
+Usage: python tests/load_health.py [--creates 50] [--latency-ms 50] [--admit-inflight N]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTS_DIR, "..", "backend")
+sys.path.insert(0, TESTS_DIR)
+
+from fake_apiserver import FakeApiServer  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(method, url, body=None, timeout=120):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        # An error response is an outcome to measure, not a harness failure
+        e.read()
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def start_backend(kubeconfig_path, port, extra_env=None, workers=1):
+    env = dict(os.environ, KUBECONFIG=kubeconfig_path, **(extra_env or {}))
+    if "REGISTRY_PATH" not in (extra_env or {}):
+        # A registry of its own, so no run lists the projects of an earlier one
+        env["REGISTRY_PATH"] = os.path.join(tempfile.mkdtemp(prefix="roo-registry-"), "registry.db")
+    if workers > 1:
+        # main.py's launcher, which also sets up shared metrics for the worker processes
+        env.update(BACKEND_WORKERS=str(workers), BACKEND_HOST="127.0.0.1", BACKEND_PORT=str(port),
+                   BACKEND_LOG_LEVEL="warning")
+        cmd = [sys.executable, "main.py"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            request("GET", f"{base}/", timeout=1)
+            return proc, base
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("backend did not start")
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000  # noqa: E731
+    return {"n": len(samples), "p50_ms": round(pick(0.50), 1), "p99_ms": round(pick(0.99), 1),
+            "mean_ms": round(statistics.mean(samples) * 1000, 1)}
+
+
+def probe_health(base, stop, interval):
+    samples = []
+    while not stop.is_set():
+        samples.append(request("GET", f"{base}/health")[1])
+        time.sleep(interval)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--creates", type=int, default=50)
+    parser.add_argument("--admit-inflight", type=int, help="backend ADMISSION_MAX_INFLIGHT (default: --creates)")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    parser.add_argument("--interval", type=float, default=0.02)
+    args = parser.parse_args()
+
+    fake = FakeApiServer(latency_ms=args.latency_ms).start()
+    with tempfile.NamedTemporaryFile("w", suffix=".kubeconfig", delete=False) as f:
+        f.write(fake.kubeconfig())
+    inflight = args.admit_inflight or args.creates
+    proc, base = start_backend(f.name, free_port(), {"ADMISSION_MAX_INFLIGHT": str(inflight),
+                                                     "ADMISSION_MAX_QUEUE": str(args.creates)})
+
+    try:
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as probe:
+            idle = probe.submit(probe_health, base, stop, args.interval)
+            try:
+                time.sleep(args.idle_seconds)
+            finally:
+                stop.set()
+            idle_samples = idle.result()
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=args.creates + 1) as pool:
+            loaded = pool.submit(probe_health, base, stop, args.interval)
+            try:
+                start = time.perf_counter()
+                creates = [pool.submit(request, "POST", f"{base}/api/projects", {}) for _ in range(args.creates)]
+                results = [c.result() for c in creates]
+                wall = time.perf_counter() - start
+            finally:
+                # Always end the probe, or a failed create leaves the pool waiting on it forever
+                stop.set()
+            loaded_samples = loaded.result()
+
+        statuses = Counter(status for status, _ in results)
+        created = [latency for status, latency in results if 200 <= status < 300]
+        print(f"fake API latency {args.latency_ms:.0f} ms/call, {args.creates} concurrent creates "
+              f"({inflight} admitted at once) in {wall:.2f}s")
+        print(f"/health idle:   {percentiles(idle_samples)}")
+        print(f"/health loaded: {percentiles(loaded_samples)}")
+        print(f"create:         {percentiles(created) if created else 'none succeeded'}")
+        print(f"create statuses: {dict(sorted(statuses.items()))}, "
+              f"{statuses[429]} refused by admission (429)")
+    finally:
+        proc.terminate()
+        proc.wait()
+        fake.stop()
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
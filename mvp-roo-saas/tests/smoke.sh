@@ -55,32 +55,31 @@ test_create_project() {
         NAMESPACE=$(echo "$RESPONSE" | grep -o '"namespace":"[^"]*"' | cut -d'"' -f4)
         echo -e "${GREEN}✅ PASS${NC} (Created: $NAMESPACE)"
 
-        # Wait for deployment to be ready (max 2 minutes)
+        # Block until the workspace is ready (max 2 minutes), one long-poll at a time
         echo -n "⏳ Waiting for workspace to be ready... "
-        for i in {1..24}; do
-            if kubectl get deployment vscode-server -n "$NAMESPACE" > /dev/null 2>&1; then
-                if kubectl wait --for=condition=available deployment/vscode-server -n "$NAMESPACE" --timeout=5s > /dev/null 2>&1; then
-                    echo -e "${GREEN}✅ READY${NC}"
-
-                    # Test if workspace is accessible
-                    echo -n "🌐 Testing workspace accessibility... "
-                    sleep 5  # Give ingress a moment
-                    if curl -s -f "http://localhost/$NAMESPACE/" > /dev/null; then
-                        echo -e "${GREEN}✅ PASS${NC}"
-                    else
-                        echo -e "${YELLOW}⚠️  PARTIAL${NC} (Deployment ready but ingress not accessible)"
-                    fi
-
-                    # Cleanup
-                    echo -n "🧹 Cleaning up test workspace... "
-                    kubectl delete namespace "$NAMESPACE" > /dev/null 2>&1
-                    echo -e "${GREEN}✅ DONE${NC}"
-                    return 0
+        for i in {1..2}; do
+            STATUS=$(curl -s "http://localhost:5000/api/projects/$NAMESPACE?wait=ready&timeout=60")
+            if echo "$STATUS" | grep -q '"status":"ready"'; then
+                echo -e "${GREEN}✅ READY${NC}"
+
+                # Test if workspace is accessible
+                echo -n "🌐 Testing workspace accessibility... "
+                sleep 5  # Give ingress a moment
+                if curl -s -f "http://localhost/$NAMESPACE/" > /dev/null; then
+                    echo -e "${GREEN}✅ PASS${NC}"
+                else
+                    echo -e "${YELLOW}⚠️  PARTIAL${NC} (Deployment ready but ingress not accessible)"
                 fi
+
+                # Cleanup
+                echo -n "🧹 Cleaning up test workspace... "
+                curl -s -X DELETE "http://localhost:5000/api/projects/$NAMESPACE" > /dev/null
+                echo -e "${GREEN}✅ DONE${NC}"
+                return 0
             fi
-            sleep 5
         done
         echo -e "${RED}❌ TIMEOUT${NC}"
+        echo "Status: $STATUS"
         return 1
     else
         echo -e "${RED}❌ FAIL${NC}"
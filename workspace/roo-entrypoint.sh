@@ -0,0 +1,236 @@
+#!/bin/bash
+# Workspace container entrypoint.
+#
+# The prebuilt image (Dockerfile.vscode-server) already contains kubectl,
+# skaffold, Node.js, the Roo Code extension and the compiled MCP server, so the
+# normal path only writes a kubeconfig, lays out the workspace and starts the
+# server. Anything missing from the image is installed the slow way, so the
+# script also works on the stock gitpod/openvscode-server image.
+
+ROO_HOME="${ROO_HOME:-/opt/roo}"
+WORKSPACE="/home/workspace"
+EXTENSIONS_DIR="${ROO_EXTENSIONS_DIR:-$ROO_HOME/extensions}"
+ROO_CODE_VSIX_URL="${ROO_CODE_VSIX_URL:-https://github.com/RooCodeInc/Roo-Code/releases/download/v3.19.3/roo-cline-3.19.3.vsix}"
+# How often editor connections are checked and reported to the backend's idle scaler
+ACTIVITY_INTERVAL="${ROO_ACTIVITY_INTERVAL:-60}"
+
+# Startup phase timing. Each phase is logged as a "ROO_PHASE" line and the full
+# set is recorded on this pod as the roo.io/startup-phases annotation, which the
+# backend turns into per-phase histograms.
+STARTED_AT=$(date +%s.%N)
+PHASES=""
+PHASE=""
+PHASE_START=""
+
+# Ends the current phase, if any, and starts the named one
+phase() {
+  local now seconds
+  now=$(date +%s.%N)
+  if [ -n "$PHASE" ]; then
+    seconds=$(awk -v s="$PHASE_START" -v e="$now" 'BEGIN { printf "%.3f", e - s }')
+    echo "ROO_PHASE phase=$PHASE seconds=$seconds"
+    PHASES="${PHASES:+$PHASES,}\"$PHASE\":$seconds"
+  fi
+  PHASE="$1"
+  PHASE_START="$now"
+}
+
+report_phases() {
+  kubectl annotate pod "$HOSTNAME" -n "$KUBE_NAMESPACE" --overwrite \
+    "roo.io/startup-phases={\"version\":1,\"started_at\":$STARTED_AT,\"template_bundle\":\"$TEMPLATE_SOURCE\",\"phases\":{$PHASES}}" > /dev/null || \
+  echo "⚠️  Could not report startup phases"
+}
+
+# Setup kubeconfig using service account token
+phase kubeconfig
+echo "🔧 Setting up kubeconfig..."
+mkdir -p /home/.kube
+KUBE_TOKEN=$(cat /var/run/secrets/kubernetes.io/serviceaccount/token)
+KUBE_CA_CERT=/var/run/secrets/kubernetes.io/serviceaccount/ca.crt
+KUBE_NAMESPACE=$(cat /var/run/secrets/kubernetes.io/serviceaccount/namespace)
+
+cat > /home/.kube/config << EOF
+apiVersion: v1
+kind: Config
+clusters:
+- cluster:
+    certificate-authority: ${KUBE_CA_CERT}
+    server: https://kubernetes.default.svc.cluster.local
+  name: default-cluster
+contexts:
+- context:
+    cluster: default-cluster
+    namespace: ${KUBE_NAMESPACE}
+    user: default-user
+  name: default-context
+current-context: default-context
+users:
+- name: default-user
+  user:
+    token: ${KUBE_TOKEN}
+EOF
+chmod 600 /home/.kube/config
+echo "✅ kubeconfig created successfully"
+
+# Tools: baked into the prebuilt image, installed here only as a fallback
+phase tools
+if ! command -v kubectl > /dev/null; then
+  echo "📦 Installing kubectl..."
+  curl -LO "https://dl.k8s.io/release/$(curl -L -s https://dl.k8s.io/release/stable.txt)/bin/linux/amd64/kubectl" && \
+  chmod +x kubectl && mv kubectl /usr/local/bin/ || echo "⚠️  Could not install kubectl"
+fi
+
+if ! command -v skaffold > /dev/null; then
+  echo "📦 Installing skaffold..."
+  curl -Lo skaffold https://storage.googleapis.com/skaffold/releases/latest/skaffold-linux-amd64 && \
+  chmod +x skaffold && mv skaffold /usr/local/bin/ || echo "⚠️  Could not install skaffold"
+fi
+
+if ! command -v node > /dev/null; then
+  echo "📦 Installing Node.js..."
+  (curl -fsSL https://deb.nodesource.com/setup_18.x | bash - && apt-get install -y nodejs) || \
+  echo "⚠️  Could not install Node.js"
+fi
+
+phase template
+# Workspace layout, from the first of:
+#  - the template bundle ROO_TEMPLATE_BUNDLE, mounted read-only at /workspace-template
+#    (scripts/build-template-bundle.sh; prebuilt, node_modules and dist included)
+#  - the template baked into the image, which also ships a built MCP server
+#  - the raw /workspace-template hostPath, which still has to be built
+BUNDLE_DIR="/workspace-template"
+ROO_TEMPLATE_BUNDLE="${ROO_TEMPLATE_BUNDLE:-none}"
+if [ "$ROO_TEMPLATE_BUNDLE" != "none" ] && [ "$(cat "$BUNDLE_DIR/BUNDLE_VERSION" 2>/dev/null)" = "$ROO_TEMPLATE_BUNDLE" ]; then
+  TEMPLATE_DIR="$BUNDLE_DIR"
+  TEMPLATE_SOURCE="$ROO_TEMPLATE_BUNDLE"
+else
+  [ "$ROO_TEMPLATE_BUNDLE" != "none" ] && echo "⚠️  Template bundle $ROO_TEMPLATE_BUNDLE is not installed on this node"
+  TEMPLATE_DIR="${ROO_WORKSPACE_TEMPLATE:-$ROO_HOME/workspace-template}"
+  TEMPLATE_SOURCE="image"
+  if [ ! -d "$TEMPLATE_DIR" ]; then
+    TEMPLATE_DIR="$BUNDLE_DIR"
+    TEMPLATE_SOURCE="legacy"
+  fi
+fi
+echo "📋 Setting up workspace from $TEMPLATE_DIR ($TEMPLATE_SOURCE)..."
+mkdir -p "$WORKSPACE/projects" "$WORKSPACE/.vscode-server"
+
+# The MCP server is ours and never edited in place. A prebuilt one is linked,
+# not copied, so starting costs no disk I/O however large node_modules is; the
+# link also keeps it current. Only a raw template is copied, to be built below
+MCP_TEMPLATE="$TEMPLATE_DIR/.mcp-servers"
+if [ -f "$MCP_TEMPLATE/workspace-deployment/dist/index.js" ]; then
+  [ -L "$WORKSPACE/.mcp-servers" ] || rm -rf "$WORKSPACE/.mcp-servers"
+  ln -sfn "$MCP_TEMPLATE" "$WORKSPACE/.mcp-servers"
+  echo "✅ Linked MCP server from $MCP_TEMPLATE"
+else
+  # Replace a link left by an earlier start; it points at read-only files
+  [ -L "$WORKSPACE/.mcp-servers" ] && rm "$WORKSPACE/.mcp-servers"
+  if [ -d "$MCP_TEMPLATE" ]; then
+    cp -r "$MCP_TEMPLATE" "$WORKSPACE/"
+    echo "✅ Copied MCP server files"
+  else
+    mkdir -p "$WORKSPACE/.mcp-servers/workspace-deployment"
+  fi
+fi
+
+# Everything else belongs to the user once seeded, so it is copied, but only
+# into a fresh volume: a few small files, and the volume survives sleeping
+if [ ! -f "$WORKSPACE/.roo-initialized" ]; then
+  [ -f "$TEMPLATE_DIR/.vscode-server/settings.json" ] && cp "$TEMPLATE_DIR/.vscode-server/settings.json" "$WORKSPACE/.vscode-server/"
+  [ -d "$TEMPLATE_DIR/projects" ] && cp -r "$TEMPLATE_DIR/projects" "$WORKSPACE/"
+  for SCRIPT in setup-mcp-server.sh mcp-dev.sh; do
+    if [ -f "$TEMPLATE_DIR/$SCRIPT" ]; then
+      cp "$TEMPLATE_DIR/$SCRIPT" "$WORKSPACE/"
+      chmod +x "$WORKSPACE/$SCRIPT"
+    fi
+  done
+  touch "$WORKSPACE/.roo-initialized"
+else
+  echo "✅ Existing workspace found, keeping user files"
+fi
+
+# Cline MCP configuration
+MCP_SETTINGS_DIR="$WORKSPACE/.openvscode-server/data/User/globalStorage/rooveterinaryinc.roo-cline/settings"
+mkdir -p "$MCP_SETTINGS_DIR"
+cat > "$MCP_SETTINGS_DIR/mcp_settings.json" << 'EOF'
+{
+  "mcpServers": {
+    "workspace-deployment": {
+      "command": "node",
+      "args": ["/home/workspace/.mcp-servers/workspace-deployment/dist/index.js"],
+      "env": {
+        "WORKSPACE_ROOT": "/home/workspace"
+      }
+    }
+  }
+}
+EOF
+echo "✅ Cline MCP settings configured"
+
+# The image ships a built MCP server; only build when the template did not include one
+phase mcp_build
+MCP_DIR="$WORKSPACE/.mcp-servers/workspace-deployment"
+if [ -f "$MCP_DIR/package.json" ] && [ ! -f "$MCP_DIR/dist/index.js" ]; then
+  echo "📦 Building MCP server..."
+  (cd "$MCP_DIR" && npm install --silent && npm run build) || echo "⚠️  Could not build MCP server"
+fi
+
+# Roo Code extension: preinstalled into $EXTENSIONS_DIR in the prebuilt image
+phase extension
+mkdir -p "$EXTENSIONS_DIR"
+if ! ls "$EXTENSIONS_DIR" | grep -q "roo-cline"; then
+  echo "📦 Installing Roo Code extension..."
+  if curl -fL -o /tmp/roo-code.vsix "$ROO_CODE_VSIX_URL"; then
+    /home/.openvscode-server/bin/openvscode-server \
+      --extensions-dir "$EXTENSIONS_DIR" \
+      --install-extension /tmp/roo-code.vsix \
+      --force
+  else
+    echo "⚠️  Could not download Roo Code extension, continuing without it..."
+  fi
+fi
+
+echo "Starting OpenVSCode Server..."
+phase server_start
+/home/.openvscode-server/bin/openvscode-server \
+  --host 0.0.0.0 \
+  --port 3000 \
+  --without-connection-token \
+  --accept-server-license-terms \
+  --connection-secret-file /dev/null \
+  --extensions-dir "$EXTENSIONS_DIR" \
+  --server-base-path "/${KUBE_NAMESPACE}" &
+SERVER_PID=$!
+trap 'kill -TERM "$SERVER_PID" 2>/dev/null' TERM INT
+
+# The server is started once it answers HTTP at all
+until curl -s -o /dev/null "http://127.0.0.1:3000/"; do
+  kill -0 "$SERVER_PID" 2>/dev/null || break
+  sleep 0.2
+done
+phase ""
+report_phases
+
+# Activity: while anyone holds a connection to the editor, stamp the Deployment
+# so the backend does not scale this workspace to zero
+report_activity() {
+  while sleep "$ACTIVITY_INTERVAL"; do
+    # Established TCP connections to local port 3000 (0x0BB8)
+    CONNECTIONS=$(awk '$2 ~ /:0BB8$/ && $4 == "01"' /proc/net/tcp /proc/net/tcp6 2>/dev/null | wc -l)
+    if [ "$CONNECTIONS" -gt 0 ]; then
+      kubectl annotate deployment vscode-server -n "$KUBE_NAMESPACE" --overwrite \
+        "roo.io/last-active=$(date -u +%Y-%m-%dT%H:%M:%SZ)" > /dev/null || true
+    fi
+  done
+}
+report_activity &
+
+wait "$SERVER_PID"
+STATUS=$?
+# A trapped signal interrupts wait; keep waiting for the server to exit
+while kill -0 "$SERVER_PID" 2>/dev/null; do
+  wait "$SERVER_PID"
+  STATUS=$?
+done
+exit $STATUS